@@ -1,15 +1,122 @@
+import asyncio
 import types
 from aiogram import Router
 from click import Command
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
-from sqlalchemy import select, text, func, update, Table, MetaData
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import select, text, func, update, delete, insert, and_, or_, case, cast, literal_column, event, Integer, Table, MetaData
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError, DBAPIError, DisconnectionError, InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
+from typing import Optional
 import json
-import re
+import logging
 
-from .models.schemas import Base, Chat, User, UserChatData, GlobalSettings, ActionLog, Statistics
+from .models.schemas import Base, Chat, User, UserChatData, GlobalSettings, ActionLog, Statistics, PendingDeletion, FsmState, current_period
 from .config import config
+from .services.banned_words import banned_word_matchers
+from .services.exception_rules import exception_rules
+from .services.chat_settings import ChatSettingsSnapshot, chat_settings
+from .services.global_settings import GlobalSettingsView, global_settings
+from .services.action_log import action_log_writer
+from .services.counter_store import counter_store
+from .services.circuit_breaker import CircuitOpenError, db_breaker
+from .migrations.runner import LATEST_VERSION as LATEST_SCHEMA_VERSION, get_schema_version, upgrade as upgrade_schema
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class AdmissionDecision:
+    """Результат допуска сообщения: состояние пользователя и чата после учета"""
+    user_id: int
+    chat_id: int
+    chat_title: str = ""
+    is_active: bool = True
+    is_muted: bool = False
+    mute_until: Optional[datetime] = None
+    counted: bool = False  # Было ли сообщение учтено в счетчике
+    message_count: int = 0
+    user_limit: int = 5
+    is_custom_limit: bool = False
+    notifications: dict = field(default_factory=dict)
+    contact_link: str = ""
+
+    @property
+    def remaining(self) -> int:
+        """Сколько сообщений осталось до лимита"""
+        return max(0, self.user_limit - self.message_count)
+
+    @property
+    def limit_reached(self) -> bool:
+        """Достигнут ли лимит после учета этого сообщения"""
+        return self.counted and self.message_count >= self.user_limit
+
+
+# Ошибки недоступности хранилища (в отличие от ошибок в запросах и данных)
+_OUTAGE_ERRORS = (OperationalError, InterfaceError, DisconnectionError, PoolTimeoutError,
+                  OSError, asyncio.TimeoutError)
+
+
+# SQLite сообщает OperationalError и об ошибках в самом запросе
+_QUERY_ERROR_MARKERS = ("no such table", "no such column", "syntax error")
+
+
+def _is_outage(exc: BaseException) -> bool:
+    if isinstance(exc, DBAPIError) and exc.connection_invalidated:
+        return True
+    if isinstance(exc, OperationalError) and any(m in str(exc.orig).lower() for m in _QUERY_ERROR_MARKERS):
+        return False
+    return isinstance(exc, _OUTAGE_ERRORS)
+
+
+class _GuardedSession:
+    """Сессия под предохранителем: при разомкнутом сразу CircuitOpenError"""
+
+    __slots__ = ("_factory", "_kwargs", "_session")
+
+    def __init__(self, factory, kwargs: dict):
+        self._factory = factory
+        self._kwargs = kwargs
+        self._session = None
+
+    async def __aenter__(self) -> AsyncSession:
+        if not db_breaker.allow():
+            raise CircuitOpenError("БД временно недоступна")
+        self._session = self._factory(**self._kwargs)
+        return await self._session.__aenter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            result = await self._session.__aexit__(exc_type, exc, tb)
+        except BaseException as close_error:
+            self._record(close_error)
+            raise
+        self._record(exc)
+        return result
+
+    @staticmethod
+    def _record(exc: Optional[BaseException]):
+        if exc is None or (isinstance(exc, Exception) and not _is_outage(exc)):
+            db_breaker.record_success()
+        elif _is_outage(exc):
+            db_breaker.record_failure()
+        else:
+            # Отмена задачи - о доступности БД ничего не известно
+            db_breaker.release()
+
+
+class _GuardedSessionFactory:
+    """async_sessionmaker, пропускающий сессии через предохранитель db_breaker"""
+
+    def __init__(self, factory: async_sessionmaker):
+        self._factory = factory
+
+    def __call__(self, **kwargs) -> _GuardedSession:
+        return _GuardedSession(self._factory, kwargs)
+
 
 class Database:
     async def search_chats(self, search_text: str) -> list:
@@ -49,7 +156,7 @@ class Database:
                 return valid_chats
             
         except Exception as e:
-            print(f"⚠️ Ошибка поиска чатов: {e}")
+            logger.warning("⚠️ Ошибка поиска чатов: %s", e)
             return []
 
     async def search_users_in_chat(self, chat_id: int, search_text: str) -> list:
@@ -106,37 +213,137 @@ class Database:
                 return result.all()
         
         except Exception as e:
-            print(f"⚠️ Ошибка поиска пользователей: {e}")
+            logger.warning("⚠️ Ошибка поиска пользователей: %s", e)
             return []
     def __init__(self):
+        self.storage_profile = {}
+        self.degraded_admissions = 0
         try:
-            self.engine = create_async_engine(config.DB_URL, echo=False)
-            self.async_session = async_sessionmaker(
+            self.engine = create_async_engine(config.DB_URL, echo=False, **self._engine_options(config.DB_URL))
+            if self.engine.dialect.name == "sqlite":
+                self.storage_profile = self._sqlite_pragmas()
+                event.listen(self.engine.sync_engine, "connect", self._apply_sqlite_pragmas)
+            if not event.contains(Session, "after_flush", self._forget_changed_counters):
+                event.listen(Session, "after_flush", self._forget_changed_counters)
+            # Пока БД недоступна, сессии отклоняются сразу, без ожидания таймаутов
+            self.async_session = _GuardedSessionFactory(async_sessionmaker(
                 self.engine, 
                 class_=AsyncSession,
                 expire_on_commit=False
-            )
-            print(f"✅ База данных подключена: {config.DB_URL}")
+            ))
+            logger.info("✅ База данных подключена: %s", config.DB_URL)
         except Exception as e:
-            print(f"⚠️ Ошибка подключения к БД: {e}")
-            print("⚠️ Бот будет работать без сохранения данных")
+            logger.warning("⚠️ Ошибка подключения к БД: %s", e)
+            logger.warning("⚠️ Бот будет работать без сохранения данных")
             self.engine = None
             self.async_session = None
     
+    @staticmethod
+    def _engine_options(url: str) -> dict:
+        """Параметры пула подключений для create_async_engine"""
+        if url.startswith("sqlite") and ":memory:" not in url and not url.endswith("://"):
+            # По умолчанию aiosqlite открывает новое подключение на каждую
+            # сессию; держим небольшой пул, чтобы PRAGMA применялись один раз
+            return {
+                "poolclass": AsyncAdaptedQueuePool,
+                "pool_size": config.DB_POOL_SIZE,
+                "max_overflow": config.DB_POOL_MAX_OVERFLOW,
+                "pool_timeout": config.DB_POOL_TIMEOUT,
+                "pool_recycle": config.DB_POOL_RECYCLE,
+                "connect_args": {"timeout": config.SQLITE_BUSY_TIMEOUT_MS / 1000},
+            }
+        if url.startswith("postgresql"):
+            return {
+                "pool_size": config.DB_POOL_SIZE,
+                "max_overflow": config.DB_POOL_MAX_OVERFLOW,
+                "pool_timeout": config.DB_POOL_TIMEOUT,
+                "pool_recycle": config.DB_POOL_RECYCLE,
+                # Соединения могут быть закрыты сервером или pgbouncer
+                "pool_pre_ping": True,
+            }
+        return {}
+    
+    @staticmethod
+    def _sqlite_pragmas() -> dict:
+        """PRAGMA из профиля хранения (порядок важен: journal_mode первым)"""
+        return {
+            "journal_mode": config.SQLITE_JOURNAL_MODE,
+            "synchronous": config.SQLITE_SYNCHRONOUS,
+            "busy_timeout": config.SQLITE_BUSY_TIMEOUT_MS,
+            "cache_size": -config.SQLITE_CACHE_SIZE_KB,  # отрицательное значение - в КиБ
+            "mmap_size": config.SQLITE_MMAP_SIZE,
+        }
+    
+    def _apply_sqlite_pragmas(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in self.storage_profile.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+    
+    @staticmethod
+    def _forget_changed_counters(session, flush_context):
+        """Строки user_chat_data, измененные через ORM, перечитываются счетчиками из БД"""
+        for obj in list(session.dirty) + list(session.deleted):
+            if isinstance(obj, UserChatData):
+                counter_store.forget(obj.user_id, obj.chat_id)
+    
+    async def close(self):
+        """Закрывает подключения пула (потоки aiosqlite не дают процессу завершиться)"""
+        if self.engine:
+            await self.engine.dispose()
+    
+    async def get_storage_profile(self) -> dict:
+        """
+        Фактические настройки хранилища (читаются из БД)
+        
+        Returns:
+            Словарь {параметр: значение}, пустой если БД недоступна
+        """
+        if not self.engine:
+            return {}
+        
+        profile = {"dialect": self.engine.dialect.name, "pool": type(self.engine.pool).__name__}
+        try:
+            pool_size = getattr(self.engine.pool, "size", None)
+            if callable(pool_size):
+                profile["pool_size"] = pool_size()
+            
+            if self.engine.dialect.name == "sqlite":
+                async with self.engine.connect() as conn:
+                    for name in self.storage_profile:
+                        result = await conn.execute(text(f"PRAGMA {name}"))
+                        profile[name] = result.scalar()
+            elif self.engine.dialect.name == "postgresql":
+                async with self.engine.connect() as conn:
+                    for name in ("server_version", "max_connections"):
+                        result = await conn.execute(text(f"SHOW {name}"))
+                        profile[name] = result.scalar()
+        except Exception as e:
+            logger.warning("⚠️ Ошибка чтения настроек хранилища: %s", e)
+        return profile
+    
     async def create_tables(self):
-        """Создание таблиц в БД"""
+        """
+        Создание таблиц и миграция схемы БД
+
+        Если версия схемы актуальна, выполняется только чтение schema_version;
+        иначе применяются недостающие миграции (bot/migrations/runner.py).
+        """
         if not self.engine:
             return
             
         try:
-            async with self.engine.begin() as conn:
-                await conn.run_sync(Base.metadata.create_all)
-            print("✅ Таблицы БД созданы/проверены")
+            version = await get_schema_version(self.engine)
+            if version == LATEST_SCHEMA_VERSION:
+                logger.info("✅ Схема БД актуальна (версия %s)", version)
+                return
             
-            # Проверяем и добавляем недостающие колонки
-            await self.check_and_add_columns()
+            await upgrade_schema(self)
+            logger.info("✅ Таблицы БД созданы/проверены")
         except Exception as e:
-            print(f"⚠️ Ошибка создания таблиц: {e}")
+            logger.warning("⚠️ Ошибка создания таблиц: %s", e)
     
     def is_valid_chat_id(self, chat_id: int) -> bool:
         """Проверяем, является ли ID валидным для сохранения в БД"""
@@ -152,147 +359,20 @@ class Database:
         
         return chat_id < -99
     
-    async def check_and_add_columns(self):
-        """Проверяем и добавляем недостающие колонки во всех таблицах"""
-        if not self.engine:
-            return
-    
-        try:
-            async with self.engine.begin() as conn:
-                # Создаем метаданные и отражаем структуру БД
-                metadata = MetaData()
-                await conn.run_sync(metadata.reflect)
-        
-                # ===== ТАБЛИЦА chats =====
-                if 'chats' in metadata.tables:
-                    table = metadata.tables['chats']
-                    existing_columns = {c.name for c in table.columns}
-            
-                    # Список необходимых колонок для chats
-                    required_columns = {
-                        'id', 'title', 'message_limit', 'exclude_words', 
-                        'exclude_use_regex', 'banned_words', 'notification_texts', 
-                        'custom_notifications', 'is_active', 'created_at', 'updated_at'
-                    }
-            
-                    missing_columns = required_columns - existing_columns
-            
-                    if missing_columns:
-                        print(f"⚠️ Найдены недостающие колонки в chats: {missing_columns}")
-                
-                        for column_name in missing_columns:
-                            if column_name == 'exclude_use_regex':
-                                await conn.execute(
-                                    text(f"ALTER TABLE chats ADD COLUMN {column_name} BOOLEAN DEFAULT 0")
-                                )
-                            elif column_name == 'banned_words':
-                                await conn.execute(
-                                    text(f"ALTER TABLE chats ADD COLUMN {column_name} JSON DEFAULT NULL")
-                                )
-                            elif column_name == 'custom_notifications':
-                                await conn.execute(
-                                    text(f"ALTER TABLE chats ADD COLUMN {column_name} JSON DEFAULT '{{}}'")
-                                )
-                            else:
-                                print(f"   ⚠️ Неизвестный тип колонки: {column_name}")
-                                continue
-                            print(f"✅ Добавлена колонка в chats: {column_name}")
-        
-                # ===== ТАБЛИЦА user_chat_data =====
-                if 'user_chat_data' in metadata.tables:
-                    table = metadata.tables['user_chat_data']
-                    existing_columns = {c.name for c in table.columns}
-            
-                    required_columns = {
-                        'id', 'user_id', 'chat_id', 'message_count', 'custom_limit',
-                        'custom_limit_expires_at',  # НОВАЯ КОЛОНКА
-                        'is_muted', 'mute_until', 'last_reset_date', 'last_custom_reset_date',
-                        'is_custom_limit_active', 'created_at', 'updated_at'
-                    }
+    async def check_and_add_columns(self, dry_run: bool = False) -> list:
+        """
+        Применяет недостающие миграции схемы
 
-                    missing_columns = required_columns - existing_columns
-            
-                    if missing_columns:
-                        print(f"⚠️ Найдены недостающие колонки в user_chat_data: {missing_columns}")
-                
-                        for column_name in missing_columns:
-                            if column_name == 'last_custom_reset_date':
-                                await conn.execute(
-                                    text(f"ALTER TABLE user_chat_data ADD COLUMN {column_name} DATETIME")
-                                )
-                            elif column_name == 'custom_limit_expires_at':
-                                await conn.execute(
-                                    text(f"ALTER TABLE user_chat_data ADD COLUMN {column_name} DATETIME")
-                                )
-                            elif column_name == 'is_custom_limit_active':
-                                await conn.execute(
-                                    text(f"ALTER TABLE user_chat_data ADD COLUMN {column_name} BOOLEAN DEFAULT 0")
-                                )
-                            else:
-                                print(f"   ⚠️ Неизвестный тип колонки: {column_name}")
-                                continue
-                            print(f"✅ Добавлена колонка в user_chat_data: {column_name}")
-        
-                # ===== ТАБЛИЦА global_settings =====
-                if 'global_settings' in metadata.tables:
-                    table = metadata.tables['global_settings']
-                    existing_columns = {c.name for c in table.columns}
-            
-                    required_columns = {
-                        'id', 'contact_link', 'default_message_limit', 
-                        'default_exclude_words', 'default_exclude_use_regex',
-                        'default_notifications', 'default_banned_words',
-                        'auto_unblock_days', 'security_log_enabled', 'default_min_message_length', 'updated_at'
-                    }
+        Args:
+            dry_run: только показать запросы, ничего не меняя
 
-                    missing_columns = required_columns - existing_columns
-            
-                    if missing_columns:
-                        print(f"⚠️ Найдены недостающие колонки в global_settings: {missing_columns}")
-                
-                        for column_name in missing_columns:
-                            if column_name == 'default_exclude_use_regex':
-                                await conn.execute(
-                                    text(f"ALTER TABLE global_settings ADD COLUMN {column_name} BOOLEAN DEFAULT 0")
-                                )
-                            elif column_name == 'default_banned_words':
-                                await conn.execute(
-                                    text(f"ALTER TABLE global_settings ADD COLUMN {column_name} JSON DEFAULT '[]'")
-                                )
-                            else:
-                                print(f"   ⚠️ Неизвестный тип колонки: {column_name}")
-                                continue
-                            print(f"✅ Добавлена колонка в global_settings: {column_name}")
-        
-                # ===== ТАБЛИЦА users =====
-                if 'users' in metadata.tables:
-                    table = metadata.tables['users']
-                    existing_columns = {c.name for c in table.columns}
-            
-                    required_columns = {
-                        'id', 'username', 'first_name', 'last_name', 
-                        'is_global_admin', 'created_at'
-                    }
-            
-                    missing_columns = required_columns - existing_columns
-            
-                    if missing_columns:
-                        print(f"⚠️ Найдены недостающие колонки в users: {missing_columns}")
-                
-                        for column_name in missing_columns:
-                            if column_name == 'is_global_admin':
-                                await conn.execute(
-                                    text(f"ALTER TABLE users ADD COLUMN {column_name} BOOLEAN DEFAULT 0")
-                                )
-                            else:
-                                print(f"   ⚠️ Неизвестный тип колонки: {column_name}")
-                                continue
-                            print(f"✅ Добавлена колонка в users: {column_name}")
-        
-                print("✅ Структура всех таблиц проверена и обновлена")
-                        
-        except Exception as e:
-            print(f"⚠️ Ошибка при проверке структуры таблицы: {e}")
+        Returns:
+            Список примененных (в dry_run - ожидающих) миграций
+        """
+        if not self.engine:
+            return []
+        return await upgrade_schema(self, dry_run=dry_run)
+    
     async def get_or_create_chat(self, chat_id: int, chat_title: str = None) -> Chat:
         """Получить или создать чат в БД (с обновлением названия)"""
         if not self.is_valid_chat_id(chat_id):
@@ -327,15 +407,17 @@ class Database:
                     session.add(chat)
                     await session.commit()
                     await session.refresh(chat)
+                    self._settings_changed(chat_id)
                 else:
                     # ВСЕГДА обновляем название чата, если оно передано
                     if chat_title and chat.title != chat_title:
                         chat.title = chat_title
                         await session.commit()
+                        self._settings_changed(chat_id)
             
             return chat
         except Exception as e:
-            print(f"⚠️ Ошибка при работе с чатом {chat_id}: {e}")
+            logger.warning("⚠️ Ошибка при работе с чатом %s: %s", chat_id, e)
             return None
     
     async def get_or_create_user(self, user_id: int, username: str = None, 
@@ -364,7 +446,7 @@ class Database:
                 
                 return user
         except Exception as e:
-            print(f"⚠️ Ошибка при работе с пользователем: {e}")
+            logger.warning("⚠️ Ошибка при работе с пользователем: %s", e)
             return User(id=user_id, username=username, first_name=first_name or "")
     
     async def get_or_create_user_chat_data(self, user_id: int, chat_id: int) -> UserChatData:
@@ -399,10 +481,83 @@ class Database:
             
                 return user_chat_data
         except Exception as e:
-            print(f"⚠️ Ошибка при работе с user_chat_data: {e}")
+            logger.warning("⚠️ Ошибка при работе с user_chat_data: %s", e)
             # Возвращаем временный объект в случае ошибки
             return UserChatData(user_id=user_id, chat_id=chat_id, message_count=0)
     
+    def _period_expr(self, column):
+        """Выражение SQL: месяц даты в виде числа YYYYMM (для текущего диалекта)"""
+        if self.engine.dialect.name == "postgresql":
+            return cast(func.to_char(column, literal_column("'YYYYMM'")), Integer)
+        return cast(func.strftime(literal_column("'%Y%m'"), column), Integer)
+
+    def _dialect_insert(self, model):
+        """INSERT с поддержкой ON CONFLICT для текущего диалекта (SQLite/PostgreSQL)"""
+        if self.engine.dialect.name == "postgresql":
+            return postgresql.insert(model)
+        return sqlite.insert(model)
+
+    async def _upsert_user_chat_data(self, session, user_id: int, chat_id: int, increment: bool):
+        """
+        Создает данные пользователя в чате или увеличивает счетчик одним запросом
+
+        INSERT ... ON CONFLICT (user_id, chat_id) DO UPDATE ... RETURNING:
+        счетчик заблокированного пользователя не растет, счетчик прошлого
+        месяца (стандартный лимит) обнуляется вместе с блокировкой.
+
+        Args:
+            session: открытая сессия
+            increment: увеличить счетчик на 1
+
+        Returns:
+            Строка с полями id, message_count, is_muted, mute_until,
+            custom_limit, custom_limit_expires_at
+        """
+        now = datetime.utcnow()
+        period = current_period()
+        step = 1 if increment else 0
+
+        stale = and_(
+            UserChatData.custom_limit == None,
+            or_(UserChatData.count_period == None, UserChatData.count_period != period)
+        )
+
+        stmt = self._dialect_insert(UserChatData).values(
+            user_id=user_id,
+            chat_id=chat_id,
+            message_count=step,
+            is_muted=False,
+            last_reset_date=now,
+            count_period=period,
+            created_at=now,
+            updated_at=now
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UserChatData.user_id, UserChatData.chat_id],
+            set_={
+                "message_count": case(
+                    (stale, step),
+                    (UserChatData.is_muted == True, UserChatData.message_count),
+                    else_=func.coalesce(UserChatData.message_count, 0) + step
+                ),
+                "is_muted": case((stale, False), else_=UserChatData.is_muted),
+                "mute_until": case((stale, None), else_=UserChatData.mute_until),
+                "last_reset_date": case((stale, now), else_=UserChatData.last_reset_date),
+                "count_period": case((stale, period), else_=UserChatData.count_period),
+                "updated_at": now
+            }
+        ).returning(
+            UserChatData.id,
+            UserChatData.message_count,
+            UserChatData.is_muted,
+            UserChatData.mute_until,
+            UserChatData.custom_limit,
+            UserChatData.custom_limit_expires_at
+        )
+
+        result = await session.execute(stmt)
+        return result.one()
+
     async def update_message_count(self, user_id: int, chat_id: int) -> int:
         """Увеличивает счетчик сообщений и возвращает новое значение"""
         if not self.is_valid_chat_id(chat_id):
@@ -411,6 +566,343 @@ class Database:
         if not self.async_session:
             return 1
             
+        try:
+            async with self.async_session() as session:
+                row = await self._upsert_user_chat_data(session, user_id, chat_id, increment=True)
+                await session.commit()
+                return row.message_count
+        except Exception as e:
+            logger.warning("⚠️ Ошибка при обновлении счетчика: %s", e)
+            return 1
+    
+    @staticmethod
+    def _merge_notifications(chat: Chat, settings: GlobalSettingsView) -> dict:
+        """Объединяет уведомления чата с глобальными"""
+        base_notifications = (
+            settings.default_notifications if settings and settings.default_notifications
+            else config.DEFAULT_NOTIFICATIONS
+        )
+        if chat and chat.custom_notifications:
+            notifications = base_notifications.copy()
+            notifications.update(chat.custom_notifications)
+            return notifications
+        if chat and chat.notification_texts:
+            return chat.notification_texts
+        return base_notifications
+
+    @staticmethod
+    def _resolve_user_limit(user_chat_data: UserChatData, chat: Chat) -> tuple:
+        """
+        Определяет действующий лимит пользователя.
+        Returns: (лимит, ручной ли лимит, истек ли временный лимит)
+        """
+        chat_limit = chat.message_limit if chat and chat.message_limit else config.DEFAULT_MESSAGE_LIMIT
+
+        if user_chat_data and user_chat_data.custom_limit:
+            if user_chat_data.custom_limit_expires_at:
+                if datetime.utcnow() < user_chat_data.custom_limit_expires_at:
+                    return user_chat_data.custom_limit, True, False
+                return chat_limit, False, True
+            return user_chat_data.custom_limit, True, False
+
+        return chat_limit, False, False
+
+    async def admit_message(self, user_id: int, chat_id: int, chat_title: str = None,
+                            username: str = None, first_name: str = None, last_name: str = None,
+                            count: bool = True) -> Optional[AdmissionDecision]:
+        """
+        Допуск сообщения за одну сессию: загружает пользователя и чат одним
+        запросом, создает недостающие записи, а данные пользователя в чате
+        создает/обновляет одним UPSERT, который увеличивает счетчик (если
+        count=True, пользователь не заблокирован и бот активен в чате).
+        """
+        if not self.is_valid_chat_id(chat_id):
+            return None
+
+        if not self.async_session:
+            return AdmissionDecision(
+                user_id=user_id,
+                chat_id=chat_id,
+                chat_title=chat_title or f"Чат {chat_id}",
+                counted=count,
+                message_count=1 if count else 0,
+                user_limit=config.DEFAULT_MESSAGE_LIMIT,
+                notifications=config.DEFAULT_NOTIFICATIONS
+            )
+
+        if db_breaker.is_open:
+            return self._admit_degraded(user_id, chat_id, chat_title, count)
+
+        if counter_store.running:
+            decision = await self._admit_from_memory(user_id, chat_id, chat_title, count)
+            if decision is not None:
+                return decision
+            # Первое сообщение, новый месяц и т.п. - обычный путь через БД
+            counter_store.forget(user_id, chat_id)
+
+        settings = await self.get_global_settings()
+
+        try:
+            async with self.async_session() as session:
+                result = await session.execute(
+                    select(Chat, User)
+                    .select_from(Chat)
+                    .outerjoin(User, User.id == user_id)
+                    .where(Chat.id == chat_id)
+                )
+                row = result.first()
+
+                if row:
+                    chat, user = row
+                else:
+                    # Первое сообщение в чате - чата еще нет в БД
+                    chat = None
+                    user = await session.get(User, user_id)
+
+                chat_changed = not chat or bool(chat_title and chat.title != chat_title)
+                if not chat:
+                    chat = Chat(
+                        id=chat_id,
+                        title=chat_title or f"Чат {chat_id}",
+                        message_limit=config.DEFAULT_MESSAGE_LIMIT,
+                        exclude_words=(
+                            settings.default_exclude_words if settings
+                            else config.DEFAULT_EXCLUDE_WORDS
+                        ),
+                        exclude_use_regex=config.DEFAULT_EXCLUDE_USE_REGEX,
+                        notification_texts=config.DEFAULT_NOTIFICATIONS,
+                        is_active=True
+                    )
+                    session.add(chat)
+                elif chat_title and chat.title != chat_title:
+                    chat.title = chat_title
+
+                if not user:
+                    user = User(
+                        id=user_id,
+                        username=username,
+                        first_name=first_name or "",
+                        last_name=last_name
+                    )
+                    session.add(user)
+
+                # Чат и пользователь должны попасть в БД раньше данных пользователя в чате
+                await session.flush()
+
+                is_active = chat.is_active is not False
+                user_chat_data = await self._upsert_user_chat_data(
+                    session, user_id, chat_id, increment=count and is_active
+                )
+
+                user_limit, is_custom, custom_expired = self._resolve_user_limit(user_chat_data, chat)
+                if custom_expired:
+                    # Временный лимит истек - сбрасываем его
+                    await session.execute(
+                        update(UserChatData)
+                        .where(UserChatData.id == user_chat_data.id)
+                        .values(custom_limit=None, custom_limit_expires_at=None)
+                        .execution_options(synchronize_session=False)
+                    )
+
+                is_muted = bool(user_chat_data.is_muted)
+                counted = count and is_active and not is_muted
+                message_count = user_chat_data.message_count or 0
+
+                await session.commit()
+                if chat_changed:
+                    self._settings_changed(chat_id)
+
+                return AdmissionDecision(
+                    user_id=user_id,
+                    chat_id=chat_id,
+                    chat_title=chat.title or "",
+                    is_active=is_active,
+                    is_muted=is_muted,
+                    mute_until=user_chat_data.mute_until,
+                    counted=counted,
+                    message_count=message_count,
+                    user_limit=user_limit,
+                    is_custom_limit=is_custom,
+                    notifications=self._merge_notifications(chat, settings),
+                    contact_link=settings.contact_link if settings and settings.contact_link else ""
+                )
+        except Exception as e:
+            logger.warning("⚠️ Ошибка допуска сообщения user=%s, chat=%s: %s", user_id, chat_id, e)
+            if db_breaker.is_open:
+                return self._admit_degraded(user_id, chat_id, chat_title, count)
+            return None
+
+    def _admit_degraded(self, user_id: int, chat_id: int, chat_title: str,
+                        count: bool) -> AdmissionDecision:
+        """
+        Допуск без обращения к БД, пока она недоступна (предохранитель разомкнут)
+
+        Используются только настройки чата и счетчики из памяти. Если счетчика
+        пользователя в памяти нет, сообщение пропускается без учета в лимите.
+        """
+        self.degraded_admissions += 1
+        snapshot = chat_settings.get(chat_id)
+        if snapshot is None:
+            snapshot = self._build_chat_settings(chat_id, None, global_settings.get())
+
+        entry = counter_store.get(user_id, chat_id, current_period()) if counter_store.running else None
+        if entry is None:
+            return AdmissionDecision(
+                user_id=user_id,
+                chat_id=chat_id,
+                chat_title=chat_title or snapshot.title,
+                is_active=snapshot.is_active,
+                user_limit=snapshot.message_limit,
+                notifications=dict(snapshot.notifications),
+                contact_link=snapshot.contact_link
+            )
+
+        user_limit, is_custom, _ = self._resolve_user_limit(entry, snapshot)
+        counted = count and snapshot.is_active and not entry.is_muted
+        # Приращение останется в очереди счетчиков до восстановления БД
+        message_count = counter_store.increment(user_id, chat_id, entry) if counted else entry.count
+
+        return AdmissionDecision(
+            user_id=user_id,
+            chat_id=chat_id,
+            chat_title=chat_title or snapshot.title,
+            is_active=snapshot.is_active,
+            is_muted=entry.is_muted,
+            mute_until=entry.mute_until,
+            counted=counted,
+            message_count=message_count,
+            user_limit=user_limit,
+            is_custom_limit=is_custom,
+            notifications=dict(snapshot.notifications),
+            contact_link=snapshot.contact_link
+        )
+
+    async def _admit_from_memory(self, user_id: int, chat_id: int, chat_title: str,
+                                 count: bool) -> Optional[AdmissionDecision]:
+        """
+        Допуск сообщения по счетчику в памяти (режим COUNTER_WRITE_BEHIND)
+
+        Returns:
+            Решение или None, если нужен обычный путь через БД (чата или
+            пользователя еще нет, сменилось название, наступил новый месяц,
+            истек временный лимит)
+        """
+        snapshot = await self.get_chat_settings(chat_id)
+        if not snapshot.exists or (chat_title and snapshot.title != chat_title):
+            return None
+
+        period = current_period()
+        entry = counter_store.get(user_id, chat_id, period)
+        if entry is None:
+            row = await self._get_user_counter_row(user_id, chat_id)
+            if row is None or (row.custom_limit is None and row.count_period != period):
+                return None
+            entry = counter_store.load(user_id, chat_id, period, row)
+
+        user_limit, is_custom, custom_expired = self._resolve_user_limit(entry, snapshot)
+        if custom_expired:
+            return None
+
+        counted = count and snapshot.is_active and not entry.is_muted
+        message_count = counter_store.increment(user_id, chat_id, entry) if counted else entry.count
+
+        return AdmissionDecision(
+            user_id=user_id,
+            chat_id=chat_id,
+            chat_title=snapshot.title,
+            is_active=snapshot.is_active,
+            is_muted=entry.is_muted,
+            mute_until=entry.mute_until,
+            counted=counted,
+            message_count=message_count,
+            user_limit=user_limit,
+            is_custom_limit=is_custom,
+            notifications=dict(snapshot.notifications),
+            contact_link=snapshot.contact_link
+        )
+
+    async def _get_user_counter_row(self, user_id: int, chat_id: int):
+        """Поля user_chat_data, нужные для решения по лимиту (без ORM-объекта)"""
+        try:
+            async with self.async_session() as session:
+                result = await session.execute(
+                    select(
+                        UserChatData.message_count,
+                        UserChatData.count_period,
+                        UserChatData.is_muted,
+                        UserChatData.mute_until,
+                        UserChatData.custom_limit,
+                        UserChatData.custom_limit_expires_at
+                    )
+                    .where(UserChatData.user_id == user_id)
+                    .where(UserChatData.chat_id == chat_id)
+                )
+                return result.first()
+        except Exception as e:
+            logger.warning("⚠️ Ошибка чтения счетчика user=%s, chat=%s: %s", user_id, chat_id, e)
+            return None
+
+    async def add_message_counts(self, deltas: list) -> bool:
+        """
+        Прибавить накопленные счетчики одним пакетным UPSERT
+
+        Приращение прошлого месяца к уже сброшенному счетчику не прибавляется.
+        Период строки с ручным лимитом не продвигается (см. _upsert_user_chat_data),
+        поэтому ее счетчик пополняется при любом периоде.
+
+        Args:
+            deltas: список (user_id, chat_id, период YYYYMM, приращение)
+
+        Returns:
+            True если записано
+        """
+        if not self.async_session or not deltas:
+            return False
+
+        now = datetime.utcnow()
+        stmt = self._dialect_insert(UserChatData)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UserChatData.user_id, UserChatData.chat_id],
+            set_={
+                "message_count": case(
+                    (
+                        or_(UserChatData.count_period == None,
+                            UserChatData.count_period == stmt.excluded.count_period,
+                            UserChatData.custom_limit != None),
+                        func.coalesce(UserChatData.message_count, 0) + stmt.excluded.message_count
+                    ),
+                    else_=UserChatData.message_count
+                ),
+                "updated_at": stmt.excluded.updated_at
+            }
+        )
+
+        try:
+            async with self.async_session() as session:
+                await session.execute(stmt, [
+                    {
+                        "user_id": user_id,
+                        "chat_id": chat_id,
+                        "message_count": delta,
+                        "count_period": period,
+                        "is_muted": False,
+                        "last_reset_date": now,
+                        "created_at": now,
+                        "updated_at": now
+                    }
+                    for user_id, chat_id, period, delta in deltas
+                ])
+                await session.commit()
+                return True
+        except Exception as e:
+            logger.warning("⚠️ Ошибка записи счетчиков (%s записей): %s", len(deltas), e)
+            return False
+
+    async def set_user_muted(self, user_id: int, chat_id: int, mute_until: datetime) -> bool:
+        """Отмечает пользователя заблокированным в чате (создает запись при необходимости)"""
+        if not self.is_valid_chat_id(chat_id) or not self.async_session:
+            return False
+
         try:
             async with self.async_session() as session:
                 result = await session.execute(
@@ -419,27 +911,26 @@ class Database:
                     .where(UserChatData.chat_id == chat_id)
                 )
                 user_chat_data = result.scalar_one_or_none()
-                
-                if not user_chat_data:
-                    user_chat_data = UserChatData(
+
+                if user_chat_data:
+                    user_chat_data.is_muted = True
+                    user_chat_data.mute_until = mute_until
+                else:
+                    session.add(UserChatData(
                         user_id=user_id,
                         chat_id=chat_id,
-                        message_count=1,
+                        is_muted=True,
+                        mute_until=mute_until,
+                        message_count=0,
                         last_reset_date=datetime.utcnow()
-                    )
-                    session.add(user_chat_data)
-                else:
-                    user_chat_data.message_count += 1
-                    user_chat_data.updated_at = datetime.utcnow()
-                
+                    ))
+
                 await session.commit()
-                await session.refresh(user_chat_data)
-                
-                return user_chat_data.message_count
+                return True
         except Exception as e:
-            print(f"⚠️ Ошибка при обновлении счетчика: {e}")
-            return 1
-    
+            logger.warning("⚠️ Не удалось обновить статус мута в БД: %s", e)
+            return False
+
     async def get_all_chats(self) -> list:
         """Получить все чаты из БД"""
         if not self.async_session:
@@ -460,7 +951,7 @@ class Database:
                 
                 return valid_chats
         except Exception as e:
-            print(f"⚠️ Ошибка при получении чатов: {e}")
+            logger.warning("⚠️ Ошибка при получении чатов: %s", e)
             return []
     
     async def get_chat_by_id(self, chat_id: int) -> Chat:
@@ -478,9 +969,174 @@ class Database:
                 )
                 return result.scalar_one_or_none()
         except Exception as e:
-            print(f"⚠️ Ошибка при получении чата {chat_id}: {e}")
+            logger.warning("⚠️ Ошибка при получении чата %s: %s", chat_id, e)
             return None
     
+    def _settings_changed(self, chat_id: int = None):
+        """Сбрасывает кэши настроек после записи (chat_id=None - изменились глобальные)"""
+        if chat_id is None:
+            global_settings.invalidate()
+        chat_settings.invalidate(chat_id)
+        banned_word_matchers.invalidate(chat_id)
+        exception_rules.invalidate(chat_id)
+
+    @staticmethod
+    def _build_chat_settings(chat_id: int, chat: Chat, settings: GlobalSettingsView) -> ChatSettingsSnapshot:
+        """Объединяет настройки чата с глобальными в один снимок"""
+        if chat and chat.exclude_words:
+            exclude_words = chat.exclude_words
+        elif settings and settings.default_exclude_words:
+            exclude_words = settings.default_exclude_words
+        else:
+            exclude_words = config.DEFAULT_EXCLUDE_WORDS
+
+        if chat and chat.exclude_use_regex is not None:
+            exclude_use_regex = chat.exclude_use_regex
+        elif settings and settings.default_exclude_use_regex is not None:
+            exclude_use_regex = settings.default_exclude_use_regex
+        else:
+            exclude_use_regex = config.DEFAULT_EXCLUDE_USE_REGEX
+
+        if chat and chat.banned_words:
+            banned_words = chat.banned_words
+        elif settings:
+            banned_words = settings.default_banned_words or []
+        else:
+            banned_words = ["хуй", "пизда", "еблан", "мудак", "сука", "блять"]
+
+        min_message_length = getattr(chat, 'min_message_length', None)
+        if not min_message_length:
+            min_message_length = (
+                settings.default_min_message_length
+                if settings and settings.default_min_message_length else 20
+            )
+
+        return ChatSettingsSnapshot(
+            chat_id=chat_id,
+            exists=chat is not None,
+            title=chat.title if chat and chat.title else "",
+            is_active=chat.is_active is not False if chat else True,
+            message_limit=chat.message_limit if chat and chat.message_limit else config.DEFAULT_MESSAGE_LIMIT,
+            exclude_words=exclude_words,
+            exclude_use_regex=exclude_use_regex,
+            banned_words=banned_words,
+            notifications=Database._merge_notifications(chat, settings),
+            min_message_length=min_message_length,
+            contact_link=settings.contact_link if settings else ""
+        )
+
+    async def get_chat_settings(self, chat_id: int) -> ChatSettingsSnapshot:
+        """
+        Получить действующие настройки чата
+
+        Снимок строится из записи чата и глобальных настроек из памяти и
+        хранится в памяти до ближайшего изменения настроек через методы БД.
+
+        Args:
+            chat_id: ID чата
+
+        Returns:
+            ChatSettingsSnapshot: неизменяемый снимок настроек
+        """
+        snapshot = chat_settings.get(chat_id)
+        if snapshot is not None:
+            return snapshot
+
+        # Штамп фиксируем до чтения, чтобы изменение во время загрузки сбросило запись
+        stamp = chat_settings.stamp(chat_id)
+        settings = await self.get_global_settings()
+        chat = None
+
+        if self.async_session and self.is_valid_chat_id(chat_id):
+            try:
+                async with self.async_session() as session:
+                    chat = await session.get(Chat, chat_id)
+            except Exception as e:
+                logger.warning("⚠️ Ошибка получения настроек чата %s: %s", chat_id, e)
+                # Значения по умолчанию из-за ошибки не кэшируем
+                return self._build_chat_settings(chat_id, None, settings)
+
+        snapshot = self._build_chat_settings(chat_id, chat, settings)
+        chat_settings.put(chat_id, stamp, snapshot)
+        return snapshot
+
+    async def get_min_message_length(self, chat_id: int) -> int:
+        """Получить минимальную длину сообщения для чата"""
+        snapshot = await self.get_chat_settings(chat_id)
+        return snapshot.min_message_length
+
+    async def set_chat_active(self, chat_id: int, is_active: bool) -> bool:
+        """Включить/выключить работу бота в чате"""
+        if not self.is_valid_chat_id(chat_id):
+            return False
+
+        if not self.async_session:
+            return False
+
+        try:
+            async with self.async_session() as session:
+                result = await session.execute(
+                    update(Chat)
+                    .where(Chat.id == chat_id)
+                    .values(is_active=is_active, updated_at=datetime.utcnow())
+                )
+                await session.commit()
+                self._settings_changed(chat_id)
+                return result.rowcount > 0
+        except Exception as e:
+            logger.warning("⚠️ Ошибка изменения статуса чата %s: %s", chat_id, e)
+            return False
+
+    async def get_active_chat_ids(self) -> list:
+        """ID активных чатов (без загрузки записей целиком)"""
+        if not self.async_session:
+            return []
+
+        try:
+            async with self.async_session() as session:
+                result = await session.execute(
+                    select(Chat.id).where(Chat.id < -99).where(Chat.is_active != False)
+                )
+                return [chat_id for chat_id in result.scalars().all() if self.is_valid_chat_id(chat_id)]
+        except Exception as e:
+            logger.warning("⚠️ Ошибка при получении активных чатов: %s", e)
+            return []
+
+    async def deactivate_chats(self, chat_ids: list) -> int:
+        """
+        Выключить бота сразу в нескольких чатах
+
+        Args:
+            chat_ids: ID чатов
+
+        Returns:
+            Количество выключенных чатов
+        """
+        chat_ids = [chat_id for chat_id in chat_ids if self.is_valid_chat_id(chat_id)]
+        if not chat_ids or not self.async_session:
+            return 0
+
+        chunk_size = config.MAINTENANCE_CHUNK_SIZE
+        deactivated = 0
+        try:
+            async with self.async_session() as session:
+                for i in range(0, len(chat_ids), chunk_size):
+                    result = await session.execute(
+                        update(Chat)
+                        .where(Chat.id.in_(chat_ids[i:i + chunk_size]))
+                        .where(Chat.is_active != False)
+                        .values(is_active=False, updated_at=datetime.utcnow())
+                    )
+                    deactivated += result.rowcount
+                await session.commit()
+        except Exception as e:
+            logger.warning("⚠️ Ошибка выключения чатов: %s", e)
+            return 0
+
+        for chat_id in chat_ids:
+            self._settings_changed(chat_id)
+        return deactivated
+
     async def update_chat_limit(self, chat_id: int, new_limit: int) -> bool:
         """Обновить лимит сообщений для чата"""
         if not self.is_valid_chat_id(chat_id):
@@ -499,10 +1155,11 @@ class Database:
                 if chat:
                     chat.message_limit = new_limit
                     await session.commit()
+                    self._settings_changed(chat_id)
                     return True
                 return False
         except Exception as e:
-            print(f"⚠️ Ошибка при обновлении лимита чата: {e}")
+            logger.warning("⚠️ Ошибка при обновлении лимита чата: %s", e)
             return False
     
     async def update_user_limit(self, user_id: int, chat_id: int, new_limit: int = None) -> bool:
@@ -535,7 +1192,7 @@ class Database:
                 await session.commit()
                 return True
         except Exception as e:
-            print(f"⚠️ Ошибка при обновлении лимита пользователя: {e}")
+            logger.warning("⚠️ Ошибка при обновлении лимита пользователя: %s", e)
             return False
     
     async def get_user_limit(self, user_id: int, chat_id: int) -> int:
@@ -568,11 +1225,11 @@ class Database:
                     if user_chat_data.custom_limit_expires_at:
                         if datetime.utcnow() < user_chat_data.custom_limit_expires_at:
                             # Временный лимит активен
-                            print(f"   ✅ Временный лимит активен: {user_chat_data.custom_limit} до {user_chat_data.custom_limit_expires_at}")
+                            logger.debug("   ✅ Временный лимит активен: %s до %s", user_chat_data.custom_limit, user_chat_data.custom_limit_expires_at)
                             return user_chat_data.custom_limit
                         else:
                             # Временный лимит истек
-                            print(f"   ⏰ Временный лимит истек")
+                            logger.debug("   ⏰ Временный лимит истек")
                             user_chat_data.custom_limit = None
                             user_chat_data.custom_limit_expires_at = None
                             user_chat_data.is_custom_limit_active = False
@@ -581,19 +1238,19 @@ class Database:
                             user_chat_data.last_reset_date = datetime.utcnow()
                         
                             await session.commit()
-                            print(f"   🔄 Счетчик сброшен после истечения временного лимита")
+                            logger.debug("   🔄 Счетчик сброшен после истечения временного лимита")
                             return chat_limit
                     else:
                         # Постоянный индивидуальный лимит (старая логика)
-                        print(f"   ⭐ Постоянный лимит: {user_chat_data.custom_limit}")
+                        logger.debug("   ⭐ Постоянный лимит: %s", user_chat_data.custom_limit)
                         return user_chat_data.custom_limit
 
                 # Возвращаем лимит чата или дефолтный
-                print(f"   📊 Лимит чата: {chat_limit}")
+                logger.debug("   📊 Лимит чата: %s", chat_limit)
                 return chat_limit
 
         except Exception as e:
-            print(f"❌ Ошибка получения лимита пользователя: {e}")
+            logger.error("❌ Ошибка получения лимита пользователя: %s", e)
             return 5
     
     async def get_user_data_with_days(self, user_id: int, chat_id: int) -> dict:
@@ -656,7 +1313,7 @@ class Database:
                 }
     
         except Exception as e:
-            print(f"❌ Ошибка получения данных пользователя: {e}")
+            logger.error("❌ Ошибка получения данных пользователя: %s", e)
             return None
 
     async def _get_user_limit_internal(self, session, user_id, chat_id, user_chat_data, chat):
@@ -721,25 +1378,33 @@ class Database:
                 return chat.message_limit if chat else 5
         
         except Exception as e:
-            print(f"❌ Ошибка получения лимита пользователя: {e}")
+            logger.error("❌ Ошибка получения лимита пользователя: %s", e)
             return 5
-    async def get_global_settings(self):
-        """Получить глобальные настройки"""
-        print(f"🔧 DEBUG get_global_settings: Запрос настроек")
-    
+    async def get_global_settings(self) -> Optional[GlobalSettingsView]:
+        """
+        Получить глобальные настройки
+
+        Настройки читаются из БД один раз и хранятся в памяти до ближайшего
+        update_global_*. Возвращается копия только для чтения.
+
+        Returns:
+            Optional[GlobalSettingsView]: настройки или None при ошибке
+        """
+        view = global_settings.get()
+        if view is not None:
+            return view
+
         if not self.async_session:
-            print("   ⚠️ Нет сессии, возвращаю None")
             return None
         
+        # Версию фиксируем до чтения, чтобы запись во время загрузки сбросила копию
+        version = global_settings.version
         try:
             async with self.async_session() as session:
-                # Используем session.get для получения объекта
                 settings = await session.get(GlobalSettings, 1)
             
-                print(f"   🔧 Настройки найдены: {settings is not None}")
-            
                 if not settings:
-                    print("ℹ️ Настроек нет, создаю")
+                    logger.info("ℹ️ Настроек нет, создаю")
                     settings = GlobalSettings(
                         default_message_limit=config.DEFAULT_MESSAGE_LIMIT,
                         default_exclude_words=config.DEFAULT_EXCLUDE_WORDS,
@@ -754,12 +1419,14 @@ class Database:
                     session.add(settings)
                     await session.commit()
                     await session.refresh(settings)
-                    print(f"✅ Созданы настройки: empty_message = {settings.default_notifications.get('empty_message', 'НЕТ')[0:30]}...")
-            
-                print(f"   📊 Возвращаю настройки: empty_message = {settings.default_notifications.get('empty_message', 'НЕТ')[0:30]}...")
-                return settings
+                    self._settings_changed()
+                    version = global_settings.version
+
+                view = GlobalSettingsView.from_model(settings)
+                global_settings.put(version, view)
+                return view
         except Exception as e:
-            print(f"⚠️ Ошибка получения глобальных настроек: {e}")
+            logger.warning("⚠️ Ошибка получения глобальных настроек: %s", e)
             return None
     
     async def update_global_settings(self, contact_link: str = None, default_limit: int = None, 
@@ -791,11 +1458,34 @@ class Database:
                 
                 settings.updated_at = datetime.utcnow()
                 await session.commit()
+                self._settings_changed()
                 return True
         except Exception as e:
-            print(f"⚠️ Ошибка обновления глобальных настроек: {e}")
+            logger.warning("⚠️ Ошибка обновления глобальных настроек: %s", e)
             return False
     
+    async def update_global_min_message_length(self, length: int) -> bool:
+        """Обновить минимальную длину сообщения (глобально)"""
+        if not self.async_session:
+            return False
+
+        try:
+            async with self.async_session() as session:
+                settings = await session.get(GlobalSettings, 1)
+
+                if not settings:
+                    settings = GlobalSettings(id=1)
+                    session.add(settings)
+
+                settings.default_min_message_length = length
+                settings.updated_at = datetime.utcnow()
+                await session.commit()
+                self._settings_changed()
+                return True
+        except Exception as e:
+            logger.warning("⚠️ Ошибка обновления минимальной длины: %s", e)
+            return False
+
     async def update_global_exceptions(self, exceptions: list, use_regex: bool = None) -> bool:
         """Обновить глобальные исключения"""
         if not self.async_session:
@@ -817,54 +1507,35 @@ class Database:
                 
                 settings.updated_at = datetime.utcnow()
                 await session.commit()
+                self._settings_changed()
                 return True
         except Exception as e:
-            print(f"⚠️ Ошибка обновления глобальных исключений: {e}")
+            logger.warning("⚠️ Ошибка обновления глобальных исключений: %s", e)
             return False
     
     async def update_global_notifications(self, notifications: dict) -> bool:
         """Обновить глобальные уведомления"""
-        print(f"🔄 DEBUG [update_global_notifications]: Начало, сессия: {self.async_session is not None}")
-    
         if not self.async_session:
-            print("❌ DEBUG: Нет сессии")
             return False
         
         try:
             async with self.async_session() as session:
-                print("🔧 DEBUG: Сессия создана")
-            
                 result = await session.execute(select(GlobalSettings))
                 settings = result.scalar_one_or_none()
             
-                print(f"🔧 DEBUG: Настройки найдены: {settings is not None}")
-            
                 if not settings:
-                    print("ℹ️ DEBUG: Создаем новые настройки")
                     settings = GlobalSettings()
                     session.add(settings)
             
-                print(f"🔧 DEBUG: Старые уведомления: {settings.default_notifications}")
-                print(f"🔧 DEBUG: Новые уведомления: {notifications}")
-            
                 settings.default_notifications = notifications
                 settings.updated_at = datetime.utcnow()
             
                 await session.commit()
-                print("✅ DEBUG: Коммит успешен")
-            
-                # Обновляем объект после коммита
-                await session.refresh(settings)
-                print(f"✅ DEBUG: Проверка после коммита: {settings.default_notifications}")
-            
+                self._settings_changed()
                 return True
-            
         except Exception as e:
-            print(f"❌ DEBUG: Ошибка обновления глобальных уведомлений: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.warning("⚠️ Ошибка обновления глобальных уведомлений: %s", e)
             return False
-            
     
     async def init_global_settings(self):
         """Инициализация глобальных настроек"""
@@ -891,7 +1562,7 @@ class Database:
                     )
                     session.add(settings)
                     await session.commit()
-                    print("✅ Глобальные настройки созданы с полным набором уведомлений")
+                    logger.info("✅ Глобальные настройки созданы с полным набором уведомлений")
                 else:
                     # Проверяем и добавляем НОВЫЕ уведомления если их нет
                     if settings.default_notifications:
@@ -906,71 +1577,31 @@ class Database:
 
                         settings.default_notifications = current_notifications
                         await session.commit()
-                        print("✅ Добавлены новые уведомления в существующие настройки")
+                        logger.info("✅ Добавлены новые уведомления в существующие настройки")
                 
                     # Проверяем default_banned_words (старое)
                     if not hasattr(settings, 'default_banned_words'):
-                        settings.default_banned_words = ["хуй", "пизда", "еблан", "мудак", "сука", "блять"]
-                        await session.commit()
-                        print("✅ Добавлено поле default_banned_words")
-        except Exception as e:
-            print(f"⚠️ Ошибка инициализации настроек: {e}")
-
-    async def get_chat_exceptions(self, chat_id: int) -> list:
-        """Получить список исключений для чата"""
-        if not self.is_valid_chat_id(chat_id):
-            return []
-            
-        if not self.async_session:
-            return config.DEFAULT_EXCLUDE_WORDS
-            
-        try:
-            async with self.async_session() as session:
-                result = await session.execute(
-                    select(Chat).where(Chat.id == chat_id)
-                )
-                chat = result.scalar_one_or_none()
-                
-                if chat and chat.exclude_words:
-                    return chat.exclude_words
-                
-                # Если в чате нет исключений, возвращаем глобальные
-                settings = await self.get_global_settings()
-                if settings and settings.default_exclude_words:
-                    return settings.default_exclude_words
-                    
-                return config.DEFAULT_EXCLUDE_WORDS
-        except Exception as e:
-            print(f"⚠️ Ошибка получения исключений: {e}")
-            return config.DEFAULT_EXCLUDE_WORDS
-    
-    async def get_chat_exclude_regex(self, chat_id: int) -> bool:
-        """Получить настройку использования regex для исключений чата"""
-        if not self.is_valid_chat_id(chat_id):
-            return config.DEFAULT_EXCLUDE_USE_REGEX
-            
-        if not self.async_session:
-            return config.DEFAULT_EXCLUDE_USE_REGEX
-            
-        try:
-            async with self.async_session() as session:
-                result = await session.execute(
-                    select(Chat).where(Chat.id == chat_id)
-                )
-                chat = result.scalar_one_or_none()
-                
-                if chat and chat.exclude_use_regex is not None:
-                    return chat.exclude_use_regex
-                    
-                # Если в чате нет настройки, возвращаем глобальную
-                settings = await self.get_global_settings()
-                if settings and settings.default_exclude_use_regex is not None:
-                    return settings.default_exclude_use_regex
-                    
-                return config.DEFAULT_EXCLUDE_USE_REGEX
+                        settings.default_banned_words = ["хуй", "пизда", "еблан", "мудак", "сука", "блять"]
+                        await session.commit()
+                        logger.info("✅ Добавлено поле default_banned_words")
         except Exception as e:
-            print(f"⚠️ Ошибка получения настроек regex: {e}")
+            logger.warning("⚠️ Ошибка инициализации настроек: %s", e)
+
+    async def get_chat_exceptions(self, chat_id: int) -> list:
+        """Получить список исключений для чата"""
+        if not self.is_valid_chat_id(chat_id):
+            return []
+
+        snapshot = await self.get_chat_settings(chat_id)
+        return list(snapshot.exclude_words)
+    
+    async def get_chat_exclude_regex(self, chat_id: int) -> bool:
+        """Получить настройку использования regex для исключений чата"""
+        if not self.is_valid_chat_id(chat_id):
             return config.DEFAULT_EXCLUDE_USE_REGEX
+
+        snapshot = await self.get_chat_settings(chat_id)
+        return snapshot.exclude_use_regex
     
     async def update_chat_exceptions(self, chat_id: int, exceptions: list, use_regex: bool = None) -> bool:
         """Обновить исключения для чата"""
@@ -996,9 +1627,10 @@ class Database:
                     chat.exclude_use_regex = use_regex
                 
                 await session.commit()
+                self._settings_changed(chat_id)
                 return True
         except Exception as e:
-            print(f"⚠️ Ошибка обновления исключений чата: {e}")
+            logger.warning("⚠️ Ошибка обновления исключений чата: %s", e)
             return False
     
     async def add_exception_word(self, chat_id: int, word: str) -> bool:
@@ -1028,11 +1660,12 @@ class Database:
                 if word_lower not in [w.lower() for w in chat.exclude_words]:
                     chat.exclude_words.append(word)
                     await session.commit()
+                    self._settings_changed(chat_id)
                     return True
                 
                 return False
         except Exception as e:
-            print(f"⚠️ Ошибка добавления исключения: {e}")
+            logger.warning("⚠️ Ошибка добавления исключения: %s", e)
             return False
     
     async def remove_exception_word(self, chat_id: int, word: str) -> bool:
@@ -1060,11 +1693,12 @@ class Database:
                 if len(new_exclude_words) != len(chat.exclude_words):
                     chat.exclude_words = new_exclude_words
                     await session.commit()
+                    self._settings_changed(chat_id)
                     return True
                 
                 return False
         except Exception as e:
-            print(f"⚠️ Ошибка удаления исключения: {e}")
+            logger.warning("⚠️ Ошибка удаления исключения: %s", e)
             return False
     
     async def reset_chat_exceptions(self, chat_id: int) -> bool:
@@ -1095,64 +1729,16 @@ class Database:
                     chat.exclude_use_regex = config.DEFAULT_EXCLUDE_USE_REGEX
                 
                 await session.commit()
+                self._settings_changed(chat_id)
                 return True
         except Exception as e:
-            print(f"⚠️ Ошибка сброса исключений: {e}")
+            logger.warning("⚠️ Ошибка сброса исключений: %s", e)
             return False
     
     async def get_chat_notifications(self, chat_id: int) -> dict:
         """Получить настройки уведомлений для чата"""
-        print(f"🔧 DEBUG get_chat_notifications: Запрос для чата {chat_id}")
-    
-        if not self.is_valid_chat_id(chat_id):
-            print("   ⚠️ Невалидный ID чата, возвращаю глобальные")
-            settings = await self.get_global_settings()
-            result = settings.default_notifications if settings else config.DEFAULT_NOTIFICATIONS
-            print(f"   📊 Результат: {list(result.keys())}")
-            return result
-        
-        if not self.async_session:
-            print("   ⚠️ Нет сессии, возвращаю глобальные")
-            settings = await self.get_global_settings()
-            result = settings.default_notifications if settings else config.DEFAULT_NOTIFICATIONS
-            print(f"   📊 Результат: {list(result.keys())}")
-            return result
-        
-        try:
-            async with self.async_session() as session:
-                result = await session.execute(
-                    select(Chat).where(Chat.id == chat_id)
-                )
-                chat = result.scalar_one_or_none()
-            
-                # Получаем глобальные настройки
-                global_settings = await self.get_global_settings()
-                print(f"   🔧 Глобальные настройки найдены: {global_settings is not None}")
-            
-                if global_settings:
-                    print(f"   📝 Глобальные уведомления: {global_settings.default_notifications.get('empty_message', 'НЕТ')[0:30]}...")
-            
-                base_notifications = global_settings.default_notifications if global_settings else config.DEFAULT_NOTIFICATIONS
-            
-                if chat and chat.custom_notifications:
-                    print(f"   🔧 У чата есть custom_notifications: {chat.custom_notifications}")
-                    # Объединяем с глобальными настройками
-                    notifications = base_notifications.copy()
-                    notifications.update(chat.custom_notifications)
-                    print(f"   📊 Объединенный результат: {notifications.get('empty_message', 'НЕТ')[0:30]}...")
-                    return notifications
-                elif chat and chat.notification_texts:
-                    print(f"   🔧 У чата есть notification_texts: {chat.notification_texts}")
-                    return chat.notification_texts
-                else:
-                    print(f"   🔧 У чата нет кастомных уведомлений, возвращаю глобальные")
-                    print(f"   📊 Глобальные уведомления: {base_notifications.get('empty_message', 'НЕТ')[0:30]}...")
-                    return base_notifications
-        except Exception as e:
-            print(f"⚠️ Ошибка получения уведомлений чата: {e}")
-            settings = await self.get_global_settings()
-            result = settings.default_notifications if settings else config.DEFAULT_NOTIFICATIONS
-            return result
+        snapshot = await self.get_chat_settings(chat_id)
+        return dict(snapshot.notifications)
     
     async def update_chat_notifications(self, chat_id: int, notifications: dict) -> bool:
         """Обновить настройки уведомлений для чата"""
@@ -1172,10 +1758,11 @@ class Database:
                 if chat:
                     chat.custom_notifications = notifications
                     await session.commit()
+                    self._settings_changed(chat_id)
                     return True
                 return False
         except Exception as e:
-            print(f"⚠️ Ошибка обновления уведомлений чата: {e}")
+            logger.warning("⚠️ Ошибка обновления уведомлений чата: %s", e)
             return False
     
     async def update_chat_banned_words(self, chat_id: int, words: list) -> bool:
@@ -1198,34 +1785,18 @@ class Database:
             
                 chat.banned_words = words
                 await session.commit()
+                self._settings_changed(chat_id)
                 return True
         except Exception as e:
-            print(f"⚠️ Ошибка обновления запрещенных слов чата: {e}")
+            logger.warning("⚠️ Ошибка обновления запрещенных слов чата: %s", e)
             return False
     async def get_chat_banned_words(self, chat_id: int) -> list:
         """Получить запрещенные слова для чата"""
         if not self.is_valid_chat_id(chat_id):
             return []
-        
-        try:
-            async with self.async_session() as session:
-                from sqlalchemy import select
-                from .models.schemas import Chat
-            
-                result = await session.execute(
-                    select(Chat).where(Chat.id == chat_id)
-                )
-                chat = result.scalar_one_or_none()
-            
-            if chat and hasattr(chat, 'banned_words') and chat.banned_words:
-                    return chat.banned_words
-            
-                # Если нет в чате, возвращаем глобальные
-            return await self.get_global_banned_words()
-        except Exception as e:
-            print(f"⚠️ Ошибка получения запрещенных слов чата: {e}")
-            return await self.get_global_banned_words()
-    
+
+        snapshot = await self.get_chat_settings(chat_id)
+        return list(snapshot.banned_words)
 
     async def reset_chat_notifications(self, chat_id: int) -> bool:
         """Сбросить уведомления чата к стандартным"""
@@ -1245,47 +1816,169 @@ class Database:
                 if chat:
                     chat.custom_notifications = {}
                     await session.commit()
+                    self._settings_changed(chat_id)
                     return True
                 return False
         except Exception as e:
-            print(f"⚠️ Ошибка сброса уведомлений: {e}")
+            logger.warning("⚠️ Ошибка сброса уведомлений: %s", e)
             return False
     
+    async def match_exception(self, text: str, chat_id: int) -> Optional[str]:
+        """
+        Найти исключение, под которое попадает текст
+
+        Правила берутся из снимка настроек чата и компилируются один раз
+        на снимок.
+
+        Args:
+            text: текст сообщения
+            chat_id: ID чата
+
+        Returns:
+            Optional[str]: сработавшее правило или None
+        """
+        if not text:
+            return None
+
+        snapshot = await self.get_chat_settings(chat_id)
+        rules = exception_rules.get(chat_id, snapshot)
+        if rules is None:
+            rules = exception_rules.put(
+                chat_id, snapshot, snapshot.exclude_words, snapshot.exclude_use_regex
+            )
+
+        return rules.match(text)
+
     async def check_exception_match(self, text: str, chat_id: int) -> bool:
         """Проверить, попадает ли текст под исключения"""
-        if not text:
+        return await self.match_exception(text, chat_id) is not None
+    
+    async def save_pending_deletions(self, items: list) -> bool:
+        """Сохранить отложенные удаления: [(chat_id, message_id, delete_at), ...]"""
+        if not self.async_session or not items:
             return False
-        
-        exceptions = await self.get_chat_exceptions(chat_id)
-        if not exceptions:
+
+        try:
+            async with self.async_session() as session:
+                await session.execute(
+                    insert(PendingDeletion),
+                    [
+                        {"chat_id": chat_id, "message_id": message_id, "delete_at": delete_at}
+                        for chat_id, message_id, delete_at in items
+                    ]
+                )
+                await session.commit()
+                return True
+        except Exception as e:
+            logger.warning("⚠️ Ошибка сохранения отложенных удалений: %s", e)
             return False
-        
-        use_regex = await self.get_chat_exclude_regex(chat_id)
-        text_lower = text.lower()
-        
-        for pattern in exceptions:
-            pattern = pattern.strip()
-            if not pattern:
-                continue
-                
-            if use_regex:
-                try:
-                    # Попробуем скомпилировать как regex
-                    if re.search(pattern, text, re.IGNORECASE):
-                        return True
-                except re.error:
-                    # Если не валидный regex, ищем как обычную строку
-                    if pattern.lower() in text_lower:
-                        return True
-            else:
-                if pattern.lower() in text_lower:
-                    return True
-        
-        return False
-    
+
+    async def remove_pending_deletions(self, chat_id: int, message_ids: list) -> bool:
+        """Отметить удаления выполненными"""
+        if not self.async_session or not message_ids:
+            return False
+
+        try:
+            async with self.async_session() as session:
+                await session.execute(
+                    delete(PendingDeletion).where(
+                        PendingDeletion.chat_id == chat_id,
+                        PendingDeletion.message_id.in_(message_ids)
+                    )
+                )
+                await session.commit()
+                return True
+        except Exception as e:
+            logger.warning("⚠️ Ошибка удаления записей автоудаления: %s", e)
+            return False
+
+    async def remove_stale_pending_deletions(self, before: datetime) -> int:
+        """Удалить записи, которые уже нельзя выполнить (сообщения слишком старые)"""
+        if not self.async_session:
+            return 0
+
+        try:
+            async with self.async_session() as session:
+                result = await session.execute(
+                    delete(PendingDeletion).where(PendingDeletion.delete_at < before)
+                )
+                await session.commit()
+                return result.rowcount or 0
+        except Exception as e:
+            logger.warning("⚠️ Ошибка очистки записей автоудаления: %s", e)
+            return 0
+
+    async def get_pending_deletions(self) -> list:
+        """Получить невыполненные удаления: [(chat_id, message_id, delete_at), ...]"""
+        if not self.async_session:
+            return []
+
+        try:
+            async with self.async_session() as session:
+                result = await session.execute(
+                    select(PendingDeletion.chat_id, PendingDeletion.message_id, PendingDeletion.delete_at)
+                    .order_by(PendingDeletion.delete_at)
+                )
+                return [tuple(row) for row in result.all()]
+        except Exception as e:
+            logger.warning("⚠️ Ошибка получения отложенных удалений: %s", e)
+            return []
+
+    async def get_fsm_states(self) -> list:
+        """Получить сохраненные состояния FSM: [(key, state, data, updated_at), ...]"""
+        if not self.async_session:
+            return []
+
+        try:
+            async with self.async_session() as session:
+                result = await session.execute(
+                    select(FsmState.key, FsmState.state, FsmState.data, FsmState.updated_at)
+                )
+                return [tuple(row) for row in result.all()]
+        except Exception as e:
+            logger.warning("⚠️ Ошибка получения состояний FSM: %s", e)
+            return []
+
+    async def save_fsm_state(self, key: str, state: Optional[str], data: dict) -> bool:
+        """Сохранить состояние FSM; сброшенное состояние без данных удаляется"""
+        if not self.async_session:
+            return False
+
+        try:
+            async with self.async_session() as session:
+                if state is None and not data:
+                    await session.execute(delete(FsmState).where(FsmState.key == key))
+                else:
+                    values = {"state": state, "data": data, "updated_at": datetime.utcnow()}
+                    stmt = self._dialect_insert(FsmState).values(key=key, **values)
+                    await session.execute(
+                        stmt.on_conflict_do_update(index_elements=[FsmState.key], set_=values)
+                    )
+                await session.commit()
+                return True
+        except Exception as e:
+            logger.warning("⚠️ Ошибка сохранения состояния FSM: %s", e)
+            return False
+
+    async def delete_expired_fsm_states(self, before: datetime) -> int:
+        """Удалить состояния FSM, не менявшиеся с момента before"""
+        if not self.async_session:
+            return 0
+
+        try:
+            async with self.async_session() as session:
+                result = await session.execute(
+                    delete(FsmState).where(FsmState.updated_at < before)
+                )
+                await session.commit()
+                return result.rowcount or 0
+        except Exception as e:
+            logger.warning("⚠️ Ошибка очистки состояний FSM: %s", e)
+            return 0
+
     async def log_action(self, action_type: str, user_id: int = None, 
                         chat_id: int = None, details: str = None) -> bool:
-        """Логирование действий"""
+        """Логирование действий (запись в БД пачками через action_log_writer)"""
         if not self.async_session:
             return False
             
@@ -1295,170 +1988,295 @@ class Database:
             if settings and not settings.security_log_enabled:
                 return True
             
+            log_entry = {
+                "action_type": action_type,
+                "user_id": user_id,
+                "chat_id": chat_id,
+                "details": details,
+                "created_at": datetime.utcnow()
+            }
+            
+            if action_log_writer.running:
+                queued = await action_log_writer.add(log_entry)
+            else:
+                # Фоновая запись не запущена (скрипты, миграции) - пишем сразу
+                queued = await self.insert_action_logs([log_entry])
+            
+            # Также пишем в лог (уровень DEBUG)
+            colors = {
+                "message_received": "📨",
+                "user_blocked": "🔒",
+                "warning_sent": "⚠️",
+                "empty_message_deleted": "🗑️",
+                "message_excepted": "📝",
+                "bot_added_to_chat": "🤖",
+                "bot_removed_from_chat": "❌"
+            }
+            
+            icon = colors.get(action_type, "📋")
+            logger.debug(
+                "%s [LOG] %s", icon, action_type,
+                extra={"user_id": user_id, "chat_id": chat_id, "details": details}
+            )
+            return queued
+        except Exception as e:
+            logger.warning("⚠️ Ошибка логирования: %s", e)
+            return False
+    
+    async def insert_action_logs(self, entries: list) -> bool:
+        """Записать пачку записей журнала одним INSERT"""
+        if not self.async_session or not entries:
+            return False
+
+        try:
             async with self.async_session() as session:
-                from sqlalchemy import insert
-                
-                log_entry = {
-                    "action_type": action_type,
-                    "user_id": user_id,
-                    "chat_id": chat_id,
-                    "details": details,
-                    "created_at": datetime.utcnow()
-                }
-                
-                await session.execute(
-                    insert(ActionLog).values(**log_entry)
-                )
+                await session.execute(insert(ActionLog), entries)
                 await session.commit()
-                
-                # Также пишем в консоль с цветами
-                colors = {
-                    "message_received": "📨",
-                    "user_blocked": "🔒",
-                    "warning_sent": "⚠️",
-                    "empty_message_deleted": "🗑️",
-                    "message_excepted": "📝",
-                    "bot_added_to_chat": "🤖",
-                    "bot_removed_from_chat": "❌"
-                }
-                
-                icon = colors.get(action_type, "📋")
-                print(f"{icon} [LOG] {action_type}: user={user_id}, chat={chat_id}, details={details}")
                 return True
         except Exception as e:
-            print(f"⚠️ Ошибка логирования: {e}")
+            logger.warning("⚠️ Ошибка записи журнала (%s записей): %s", len(entries), e)
             return False
     
     async def get_general_statistics(self) -> dict:
-        """Получить общую статистику"""
+        """Получить общую статистику (все показатели считаются на сервере одним запросом)"""
         if not self.async_session:
             return {}
             
         try:
             async with self.async_session() as session:
-                # Общее количество сообщений
-                result = await session.execute(
-                    select(func.sum(UserChatData.message_count))
-                )
-                total_messages = result.scalar() or 0
-                
-                # Количество пользователей
-                result = await session.execute(
-                    select(func.count(UserChatData.user_id.distinct()))
-                )
-                total_users = result.scalar() or 0
-                
-                # Количество чатов
-                result = await session.execute(
-                    select(func.count(Chat.id))
-                )
-                total_chats = result.scalar() or 0
-                
-                # Заблокированные пользователи
                 result = await session.execute(
-                    select(func.count(UserChatData.id))
-                    .where(UserChatData.is_muted == True)
+                    select(
+                        # Общее количество сообщений
+                        select(func.coalesce(func.sum(UserChatData.message_count), 0)).scalar_subquery(),
+                        # Количество пользователей
+                        select(func.count(UserChatData.user_id.distinct())).scalar_subquery(),
+                        # Количество чатов
+                        select(func.count(Chat.id)).scalar_subquery(),
+                        # Заблокированные пользователи
+                        select(func.count(UserChatData.id))
+                        .where(UserChatData.is_muted == True)
+                        .scalar_subquery()
+                    )
                 )
-                blocked_users = result.scalar() or 0
+                total_messages, total_users, total_chats, blocked_users = result.one()
                 
                 return {
-                    "total_messages": total_messages,
-                    "total_users": total_users,
-                    "total_chats": total_chats,
-                    "blocked_users": blocked_users,
+                    "total_messages": total_messages or 0,
+                    "total_users": total_users or 0,
+                    "total_chats": total_chats or 0,
+                    "blocked_users": blocked_users or 0,
                     "timestamp": datetime.now().strftime("%d.%m.%Y %H:%M")
                 }
         except Exception as e:
-            print(f"⚠️ Ошибка получения статистики: {e}")
+            logger.warning("⚠️ Ошибка получения статистики: %s", e)
             return {}
     
+    async def get_monthly_statistics(self, months: int = 6) -> dict:
+        """
+        Активность и блокировки по месяцам (группировка на стороне БД)
+        
+        Args:
+            months: сколько последних месяцев, включая текущий
+            
+        Returns:
+            {"YYYY-MM": {"messages": N, "blocks": N}} от нового месяца к старому
+        """
+        now = datetime.utcnow()
+        periods = []
+        year, month = now.year, now.month
+        for _ in range(months):
+            periods.append(year * 100 + month)
+            year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+        stats = {period: {"messages": 0, "blocks": 0} for period in periods}
+        
+        if self.async_session:
+            since = datetime(year, month, 1) + timedelta(days=32)
+            since = since.replace(day=1)  # начало самого старого из месяцев
+            try:
+                async with self.async_session() as session:
+                    period = self._period_expr(UserChatData.updated_at)
+                    result = await session.execute(
+                        select(period, func.count(UserChatData.id))
+                        .where(UserChatData.updated_at >= since)
+                        .group_by(period)
+                    )
+                    for key, count in result.all():
+                        if key in stats:
+                            stats[key]["messages"] = count
+                    
+                    period = self._period_expr(ActionLog.created_at)
+                    result = await session.execute(
+                        select(period, func.count(ActionLog.id))
+                        .where(ActionLog.action_type == "user_blocked")
+                        .where(ActionLog.created_at >= since)
+                        .group_by(period)
+                    )
+                    for key, count in result.all():
+                        if key in stats:
+                            stats[key]["blocks"] = count
+            except Exception as e:
+                logger.warning("⚠️ Ошибка получения статистики по месяцам: %s", e)
+        
+        return {f"{period // 100}-{period % 100:02d}": stats[period] for period in periods}
+    
+    async def _update_user_data_in_chunks(self, condition, values: dict, chunk_size: int = None):
+        """
+        Set-based UPDATE user_chat_data порциями по первичному ключу
+
+        Каждая порция - отдельный UPDATE ... WHERE id IN (SELECT ... LIMIT n)
+        RETURNING и отдельная транзакция, поэтому блокировка записи держится
+        недолго, а строки не загружаются в ORM.
+
+        Args:
+            condition: условие отбора строк
+            values: новые значения столбцов
+            chunk_size: размер порции (по умолчанию MAINTENANCE_CHUNK_SIZE)
+
+        Returns:
+            Список (user_id, chat_id) обновленных строк
+        """
+        chunk_size = chunk_size or config.MAINTENANCE_CHUNK_SIZE
+        affected = []
+        last_id = 0
+        chunk = 0
+
+        while True:
+            chunk += 1
+            # Идем по id вперед: условие может не меняться после обновления
+            chunk_ids = (
+                select(UserChatData.id)
+                .where(condition)
+                .where(UserChatData.id > last_id)
+                .order_by(UserChatData.id)
+                .limit(chunk_size)
+                .scalar_subquery()
+            )
+            async with self.async_session() as session:
+                result = await session.execute(
+                    update(UserChatData)
+                    .where(UserChatData.id.in_(chunk_ids))
+                    .values(**values)
+                    .returning(UserChatData.id, UserChatData.user_id, UserChatData.chat_id)
+                    .execution_options(synchronize_session=False)
+                )
+                rows = result.all()
+                await session.commit()
+            counter_store.forget()
+            logger.debug("   🔁 Порция %s: обновлено строк %s", chunk, len(rows))
+
+            if not rows:
+                break
+
+            last_id = max(row.id for row in rows)
+            affected.extend((row.user_id, row.chat_id) for row in rows)
+            if len(rows) < chunk_size:
+                break
+
+        return affected
+
+    async def _log_actions_bulk(self, action_type: str, targets: list, details: str = None) -> int:
+        """Записать в журнал по записи на каждую пару (user_id, chat_id) без вывода в консоль"""
+        if not targets:
+            return 0
+
+        settings = await self.get_global_settings()
+        if settings and not settings.security_log_enabled:
+            return 0
+
+        now = datetime.utcnow()
+        entries = [
+            {
+                "action_type": action_type,
+                "user_id": user_id,
+                "chat_id": chat_id,
+                "details": details,
+                "created_at": now
+            }
+            for user_id, chat_id in targets
+        ]
+
+        if action_log_writer.running:
+            for entry in entries:
+                await action_log_writer.add(entry)
+            return len(entries)
+
+        chunk_size = config.MAINTENANCE_CHUNK_SIZE
+        written = 0
+        for i in range(0, len(entries), chunk_size):
+            chunk = entries[i:i + chunk_size]
+            if await self.insert_action_logs(chunk):
+                written += len(chunk)
+        return written
+
     async def auto_unblock_users(self) -> int:
         """Автоматическая разблокировка пользователей"""
         if not self.async_session:
             return 0
             
         try:
-            async with self.async_session() as session:
-                settings = await self.get_global_settings()
-                auto_unblock_days = settings.auto_unblock_days if settings else 30
-                
-                # Находим пользователей, заблокированных более N дней
-                cutoff_date = datetime.utcnow() - timedelta(days=auto_unblock_days)
-                
-                result = await session.execute(
-                    select(UserChatData)
-                    .where(UserChatData.is_muted == True)
-                    .where(UserChatData.mute_until <= cutoff_date)
+            settings = await self.get_global_settings()
+            auto_unblock_days = settings.auto_unblock_days if settings else 30
+            
+            # Пользователи, заблокированные более N дней
+            cutoff_date = datetime.utcnow() - timedelta(days=auto_unblock_days)
+            
+            unblocked = await self._update_user_data_in_chunks(
+                and_(UserChatData.is_muted == True, UserChatData.mute_until <= cutoff_date),
+                {"is_muted": False, "mute_until": None, "message_count": 0}
+            )
+            
+            if unblocked:
+                await self._log_actions_bulk(
+                    "auto_unblock", unblocked,
+                    details=f"Авторазблокировка через {auto_unblock_days} дней"
                 )
-                users_to_unblock = result.scalars().all()
-                
-                unblocked_count = 0
-                for user_data in users_to_unblock:
-                    user_data.is_muted = False
-                    user_data.mute_until = None
-                    user_data.message_count = 0
-                    unblocked_count += 1
-                    
-                    # Логируем авторазблокировку
-                    await self.log_action("auto_unblock", user_id=user_data.user_id, 
-                                        chat_id=user_data.chat_id, 
-                                        details=f"Авторазблокировка через {auto_unblock_days} дней")
-                
-                if unblocked_count > 0:
-                    await session.commit()
-                    print(f"✅ Автоматически разблокировано {unblocked_count} пользователей")
-                
-                return unblocked_count
+                logger.info("✅ Автоматически разблокировано %s пользователей", len(unblocked))
+            
+            return len(unblocked)
         except Exception as e:
-            print(f"⚠️ Ошибка авторазблокировки: {e}")
+            logger.warning("⚠️ Ошибка авторазблокировки: %s", e)
             return 0
     
     async def monthly_reset_counts(self) -> int:
-        """Ежемесячный сброс счетчиков (только стандартных лимитов)"""
+        """
+        Досрочный сброс счетчиков прошлых месяцев (только стандартных лимитов)
+
+        Основной сброс выполняется лениво в admit_message по count_period;
+        здесь обнуляются счетчики пользователей, еще не писавших в этом
+        месяце, чтобы статистика и админ-панель не показывали старые значения.
+        Повторный запуск не затрагивает уже сброшенные строки.
+        """
         if not self.async_session:
             return 0
             
         try:
-            async with self.async_session() as session:
-                # Сбрасываем только пользователей со стандартными лимитами
-                result = await session.execute(
-                    select(UserChatData)
-                    .where(UserChatData.custom_limit == None)
-                    .where(UserChatData.is_muted == True)
-                )
-                users_to_reset = result.scalars().all()
-                
-                reset_count = 0
-                for user_data in users_to_reset:
-                    user_data.message_count = 0
-                    user_data.last_reset_date = datetime.utcnow()
-                    user_data.is_muted = False
-                    user_data.mute_until = None
-                    reset_count += 1
-                
-                # Также сбрасываем счетчики у активных пользователей со стандартными лимитами
-                result = await session.execute(
-                    select(UserChatData)
-                    .where(UserChatData.custom_limit == None)
-                    .where(UserChatData.is_muted == False)
-                )
-                active_users = result.scalars().all()
-                
-                for user_data in active_users:
-                    user_data.message_count = 0
-                    user_data.last_reset_date = datetime.utcnow()
-                    reset_count += 1
-                
-                if reset_count > 0:
-                    await session.commit()
-                    print(f"✅ Ежемесячный сброс: обновлено {reset_count} пользователей")
-                
-                # Логируем сброс
-                await self.log_action("monthly_reset", details=f"Сброшено {reset_count} пользователей")
-                
-                return reset_count
+            period = current_period()
+            # Сбрасываем только пользователей со стандартными лимитами
+            # (заблокированных и активных) - одним проходом
+            reset = await self._update_user_data_in_chunks(
+                and_(
+                    UserChatData.custom_limit == None,
+                    or_(UserChatData.count_period == None, UserChatData.count_period != period)
+                ),
+                {
+                    "message_count": 0,
+                    "last_reset_date": datetime.utcnow(),
+                    "count_period": period,
+                    "is_muted": False,
+                    "mute_until": None
+                }
+            )
+            reset_count = len(reset)
+            
+            if reset_count > 0:
+                logger.info("✅ Ежемесячный сброс: обновлено %s пользователей", reset_count)
+            
+            # Логируем сброс
+            await self.log_action("monthly_reset", details=f"Сброшено {reset_count} пользователей")
+            
+            return reset_count
         except Exception as e:
-            print(f"⚠️ Ошибка ежемесячного сброса: {e}")
+            logger.warning("⚠️ Ошибка ежемесячного сброса: %s", e)
             await self.log_action("monthly_reset_error", details=f"Ошибка: {str(e)}")
             return 0
     
@@ -1468,50 +2286,38 @@ class Database:
             return 0
             
         try:
-            async with self.async_session() as session:
-                reset_count = 0
-                
-                # Находим пользователей с ручными лимитами
-                result = await session.execute(
-                    select(UserChatData)
-                    .where(UserChatData.custom_limit != None)
+            # Ручной лимит сбрасывается 1-го числа месяца, следующего за
+            # last_custom_reset_date, т.е. истекли лимиты, сброшенные до начала
+            # текущего месяца - и только если лимит исчерпан
+            month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            
+            expired = await self._update_user_data_in_chunks(
+                and_(
+                    UserChatData.custom_limit != None,
+                    UserChatData.last_custom_reset_date != None,
+                    UserChatData.last_custom_reset_date < month_start,
+                    UserChatData.message_count >= UserChatData.custom_limit
+                ),
+                {
+                    "custom_limit": None,
+                    "is_custom_limit_active": False,
+                    "last_custom_reset_date": None,
+                    "message_count": 0,
+                    "last_reset_date": datetime.utcnow(),
+                    "count_period": current_period()
+                }
+            )
+            
+            if expired:
+                await self._log_actions_bulk(
+                    "custom_limit_expired", expired,
+                    details="Ручной лимит истек и сброшен"
                 )
-                users_with_custom = result.scalars().all()
-                
-                for user_data in users_with_custom:
-                    if not user_data.last_custom_reset_date:
-                        continue
-                    
-                    # Рассчитываем следующую дату сброса для ручного лимита
-                    next_reset = user_data.last_custom_reset_date.replace(day=28) + timedelta(days=4)
-                    next_reset = next_reset.replace(day=1)
-                    
-                    # Если дата сброса наступила
-                    if datetime.utcnow() >= next_reset:
-                        # Проверяем, не превышен ли лимит
-                        if user_data.custom_limit is not None and user_data.message_count >= user_data.custom_limit:
-                            # Сбрасываем ручной лимит
-                            user_data.custom_limit = None
-                            user_data.is_custom_limit_active = False
-                            user_data.last_custom_reset_date = None
-                            user_data.message_count = 0
-                            user_data.last_reset_date = datetime.utcnow()
-                            reset_count += 1
-                            
-                            await self.log_action(
-                                "custom_limit_expired", 
-                                user_id=user_data.user_id, 
-                                chat_id=user_data.chat_id,
-                                details="Ручной лимит истек и сброшен"
-                            )
-                
-                if reset_count > 0:
-                    await session.commit()
-                    print(f"✅ Сброшено истекших ручных лимитов: {reset_count}")
-                
-                return reset_count
+                logger.info("✅ Сброшено истекших ручных лимитов: %s", len(expired))
+            
+            return len(expired)
         except Exception as e:
-            print(f"⚠️ Ошибка проверки ручных лимитов: {e}")
+            logger.warning("⚠️ Ошибка проверки ручных лимитов: %s", e)
             return 0
     
     async def reset_user_custom_limit(self, user_id: int, chat_id: int) -> bool:
@@ -1543,7 +2349,7 @@ class Database:
                 await session.commit()
                 return True
         except Exception as e:
-            print(f"⚠️ Ошибка сброса ручного лимита: {e}")
+            logger.warning("⚠️ Ошибка сброса ручного лимита: %s", e)
             return False
         
     async def update_global_banned_words(self, words: list) -> bool:
@@ -1563,9 +2369,11 @@ class Database:
                 settings.default_banned_words = words
                 settings.updated_at = datetime.utcnow()
                 await session.commit()
+                # Чаты без собственного списка используют глобальный
+                self._settings_changed()
                 return True
         except Exception as e:
-            print(f"⚠️ Ошибка обновления запрещенных слов: {e}")
+            logger.warning("⚠️ Ошибка обновления запрещенных слов: %s", e)
         return False
 
     async def get_global_banned_words(self) -> list:
@@ -1575,17 +2383,14 @@ class Database:
             return ["хуй", "пизда", "еблан", "мудак", "сука", "блять"]
         
         try:
-            async with self.async_session() as session:
-                result = await session.execute(select(GlobalSettings))
-                settings = result.scalar_one_or_none()
-            
-                if settings and hasattr(settings, 'default_banned_words'):
-                    return settings.default_banned_words or []
+            settings = await self.get_global_settings()
+            if settings:
+                return settings.default_banned_words or []
             
-                # Если нет в БД, возвращаем базовый
-                return ["хуй", "пизда", "еблан", "мудак", "сука", "блять"]
+            # Если нет в БД, возвращаем базовый
+            return ["хуй", "пизда", "еблан", "мудак", "сука", "блять"]
         except Exception as e:
-            print(f"⚠️ Ошибка получения запрещенных слов: {e}")
+            logger.warning("⚠️ Ошибка получения запрещенных слов: %s", e)
             return ["хуй", "пизда", "еблан", "мудак", "сука", "блять"]
     async def safe_get_chat_exceptions(self, chat_id: int) -> list:
         """Безопасное получение исключений для чата"""
@@ -1596,10 +2401,10 @@ class Database:
             elif isinstance(result, list):
                 return result
             else:
-                print(f"⚠️ Исключения не список: {type(result)}")
+                logger.warning("⚠️ Исключения не список: %s", type(result))
                 return list(result)
         except Exception as e:
-            print(f"⚠️ Ошибка safe_get_chat_exceptions: {e}")
+            logger.warning("⚠️ Ошибка safe_get_chat_exceptions: %s", e)
             return []
 
     async def safe_get_global_banned_words(self) -> list:
@@ -1611,10 +2416,10 @@ class Database:
             elif isinstance(result, list):
                 return result
             else:
-                print(f"⚠️ Запрещенные слова не список: {type(result)}")
+                logger.warning("⚠️ Запрещенные слова не список: %s", type(result))
                 return list(result)
         except Exception as e:
-            print(f"⚠️ Ошибка safe_get_global_banned_words: {e}")
+            logger.warning("⚠️ Ошибка safe_get_global_banned_words: %s", e)
             return ["хуй", "пизда", "еблан", "мудак", "сука", "блять"]
     async def set_temporary_user_limit(self, user_id: int, chat_id: int, limit: int, days: int) -> bool:
         """Установка временного лимита для пользователя на N дней"""
@@ -1652,7 +2457,7 @@ class Database:
             if key in user_empty_message_counters:
                 del user_empty_message_counters[key]
         except Exception as e:
-            print(f"❌ Ошибка установки временного лимита: {e}")
+            logger.error("❌ Ошибка установки временного лимита: %s", e)
             return False
 
     def check_banned_words(text: str, banned_words: list) -> bool:
@@ -1661,15 +2466,15 @@ class Database:
             return False
     
         text_lower = text.lower()
-        print(f"🔍 Проверка запрещенных слов: текст='{text_lower[:50]}...', запрещенные слова={banned_words}")
+        logger.debug("🔍 Проверка запрещенных слов: текст='%s...', запрещенные слова=%s", text_lower[:50], banned_words)
     
         for word in banned_words:
             word_lower = word.lower().strip()
             if word_lower and word_lower in text_lower:
-                print(f"   🚫 Найдено запрещенное слово: '{word_lower}'")
+                logger.debug("   🚫 Найдено запрещенное слово: '%s'", word_lower)
                 return True
     
-        print(f"   ✅ Запрещенных слов не найдено")
+        logger.debug("   ✅ Запрещенных слов не найдено")
         return False
     
 
@@ -1708,11 +2513,11 @@ class Database:
                     user_chat_data.last_reset_date = datetime.utcnow()
 
                 await session.commit()
-                print(f"✅ Установлен временный лимит {limit} на {days} дней для user={user_id}, chat={chat_id}")
+                logger.info("✅ Установлен временный лимит %s на %s дней для user=%s, chat=%s", limit, days, user_id, chat_id)
                 return True
 
         except Exception as e:
-            print(f"❌ Ошибка установки временного лимита: {e}")
+            logger.error("❌ Ошибка установки временного лимита: %s", e)
             return False
         
     async def reset_message_count_for_user(user_id: int, chat_id: int) -> None:
@@ -1732,7 +2537,7 @@ class Database:
                 if user_chat_data:
                     user_chat_data.message_count = 0
                     await session.commit()
-                    print(f"✅ Счетчик сообщений сброшен для пользователя {user_id} в чате {chat_id}")
+                    logger.info("✅ Счетчик сообщений сброшен для пользователя %s в чате %s", user_id, chat_id)
         except Exception as e:
-            print(f"⚠️ Ошибка сброса счетчика сообщений: {e}")
+            logger.warning("⚠️ Ошибка сброса счетчика сообщений: %s", e)
 db = Database()
\ No newline at end of file
@@ -4,6 +4,7 @@ from aiogram.filters import StateFilter
 from datetime import datetime, timedelta
 import html
 import json
+import logging
 
 from ..keyboards.admin import (
     get_main_menu_keyboard, 
@@ -22,6 +23,9 @@ from ..database import db
 from bot.states import AdminStates
 from ..config import config
 from ..utils.admin_check import is_admin
+
+logger = logging.getLogger(__name__)
+
 # В файл callbacks.py, после существующих импортов, добавить:
 
 from aiogram.filters import Command
@@ -277,10 +281,7 @@ async def process_notification_text(message: types.Message, state: FSMContext):
             # Сохраняем в глобальных настройках
             settings = await db.get_global_settings()
             if settings:
-                if not settings.default_notifications:
-                    settings.default_notifications = {}
-                
-                new_notifications = settings.default_notifications.copy()
+                new_notifications = settings.default_notifications or {}
                 new_notifications[db_key] = new_text
                 
                 success = await db.update_global_notifications(new_notifications)
@@ -337,7 +338,7 @@ async def safe_edit_message(callback: types.CallbackQuery, text: str,
         if "message is not modified" in str(e):
             await callback.answer()
         else:
-            print(f"❌ Ошибка редактирования сообщения: {e}")
+            logger.error("❌ Ошибка редактирования сообщения: %s", e)
             await callback.answer("❌ Ошибка обновления сообщения")
 
 async def get_exceptions_for_display(chat_id: int = None):
@@ -415,7 +416,7 @@ async def show_user_limits_message(message: types.Message):
         await message.answer(text, reply_markup=builder.as_markup())
         
     except Exception as e:
-        print(f"❌ Ошибка показа лимитов пользователя: {e}")
+        logger.error("❌ Ошибка показа лимитов пользователя: %s", e)
         await message.answer(
             "❌ Ошибка загрузки информации\n\n"
             "Попробуйте позже или обратитесь к администратору"
@@ -499,7 +500,7 @@ async def show_user_limits_callback(callback: types.CallbackQuery):
         await callback.message.edit_text(text, reply_markup=builder.as_markup(), parse_mode="HTML")
         
     except Exception as e:
-        print(f"❌ Ошибка показа лимитов пользователя: {e}")
+        logger.error("❌ Ошибка показа лимитов пользователя: %s", e)
         await callback.message.edit_text(
             "❌ Ошибка загрузки информации\n\n"
             "Попробуйте позже или обратитесь к администратору"
@@ -613,7 +614,7 @@ async def user_refresh_callback(callback: types.CallbackQuery):
         await callback.answer("✅ Обновлено")
         
     except Exception as e:
-        print(f"❌ Ошибка обновления лимитов пользователя: {e}")
+        logger.error("❌ Ошибка обновления лимитов пользователя: %s", e)
         await callback.answer("❌ Ошибка обновления")
 
 # ===== ЗАЩИЩЕННЫЕ ОБРАБОТЧИКИ ДЛЯ АДМИНОВ =====
@@ -797,7 +798,7 @@ async def chat_manage_callback(callback: types.CallbackQuery, state: FSMContext)
             await chat_list_callback(callback)
             
     except Exception as e:
-        print(f"❌ Ошибка управления чатом: {e}")
+        logger.error("❌ Ошибка управления чатом: %s", e)
         await callback.answer("❌ Ошибка")
     finally:
         await callback.answer()
@@ -805,22 +806,9 @@ async def chat_manage_callback(callback: types.CallbackQuery, state: FSMContext)
 async def toggle_chat_status(chat_id: int, current_status: bool) -> bool:
     """Переключить статус чата (активен/неактивен)"""
     try:
-        async with db.async_session() as session:
-            from sqlalchemy import select
-            from ..models.schemas import Chat
-            
-            result = await session.execute(
-                select(Chat).where(Chat.id == chat_id)
-            )
-            chat = result.scalar_one_or_none()
-            
-            if chat:
-                chat.is_active = not current_status
-                await session.commit()
-                return True
-        return False
+        return await db.set_chat_active(chat_id, not current_status)
     except Exception as e:
-        print(f"❌ Ошибка изменения статуса чата: {e}")
+        logger.error("❌ Ошибка изменения статуса чата: %s", e)
         return False
 
 async def show_chat_users(callback: types.CallbackQuery, chat_id: int, chat_title: str):
@@ -1270,7 +1258,7 @@ async def notification_settings_callback(callback: types.CallbackQuery):
         await callback.answer("⏳ В разработке")
         
     except Exception as e:
-        print(f"❌ Ошибка: {e}")
+        logger.error("❌ Ошибка: %s", e)
         await callback.answer("❌ Ошибка")
 
 '''@router.callback_query(F.data == "admin:notification_settings")
@@ -1701,46 +1689,12 @@ async def stats_callback(callback: types.CallbackQuery):
         elif stats_type == "monthly":
             # ЕЖЕМЕСЯЧНАЯ СТАТИСТИКА
             async with db.async_session() as session:
-                from sqlalchemy import select, func, extract
+                from sqlalchemy import select, func
                 from datetime import datetime, timedelta
                 from ..models.schemas import UserChatData, Chat, ActionLog, User
                 
-                # Текущий месяц и год
-                now = datetime.now()
-                current_month = now.month
-                current_year = now.year
-                
-                # Сообщения по месяцам (последние 6 месяцев)
-                monthly_stats = {}
-                for i in range(6):
-                    month_date = now - timedelta(days=30*i)
-                    month_key = f"{month_date.year}-{month_date.month:02d}"
-                    
-                    # Считаем сообщения за месяц
-                    result = await session.execute(
-                        select(func.count(UserChatData.id))
-                        .where(
-                            extract('year', UserChatData.updated_at) == month_date.year,
-                            extract('month', UserChatData.updated_at) == month_date.month
-                        )
-                    )
-                    message_count = result.scalar() or 0
-                    
-                    # Блокировки за месяц
-                    result = await session.execute(
-                        select(func.count(ActionLog.id))
-                        .where(
-                            ActionLog.action_type == "user_blocked",
-                            extract('year', ActionLog.created_at) == month_date.year,
-                            extract('month', ActionLog.created_at) == month_date.month
-                        )
-                    )
-                    blocks_count = result.scalar() or 0
-                    
-                    monthly_stats[month_key] = {
-                        "messages": message_count,
-                        "blocks": blocks_count
-                    }
+                # Сообщения и блокировки по месяцам (последние 6 месяцев)
+                monthly_stats = await db.get_monthly_statistics(6)
                 
                 # Формируем текст статистики
                 stats_text = ""
@@ -2026,11 +1980,11 @@ async def unblock_user(bot, user_id: int, chat_id: int) -> bool:
         await db.log_action("manual_unblock", user_id=user_id, chat_id=chat_id, 
                           details="Ручная разблокировка администратором")
         
-        print(f"✅ Пользователь {user_id} разблокирован в чате {chat_id}")
+        logger.info("✅ Пользователь %s разблокирован в чате %s", user_id, chat_id)
         
         return True
     except Exception as e:
-        print(f"❌ Ошибка разблокировки пользователя {user_id}: {e}")
+        logger.error("❌ Ошибка разблокировки пользователя %s: %s", user_id, e)
         await db.log_action("unblock_error", user_id=user_id, chat_id=chat_id, 
                           details=f"Ошибка: {str(e)}")
         return False
@@ -2239,7 +2193,7 @@ async def process_user_limit(message: types.Message, state: FSMContext):
                                     )
                                     
                                 except Exception as e:
-                                    print(f"⚠️ Не удалось автоматически разблокировать пользователя: {e}")
+                                    logger.warning("⚠️ Не удалось автоматически разблокировать пользователя: %s", e)
                         
                     else:
                         await message.answer("❌ Ошибка сохранения временного лимита")
@@ -2395,7 +2349,7 @@ async def process_user_limit(message: types.Message, state: FSMContext):
                                 )
                                 
                             except Exception as e:
-                                print(f"⚠️ Не удалось автоматически разблокировать пользователя: {e}")
+                                logger.warning("⚠️ Не удалось автоматически разблокировать пользователя: %s", e)
                         
                     else:
                         await message.answer("❌ Ошибка сохранения в БД")
@@ -2446,17 +2400,14 @@ async def process_exception_word(message: types.Message, state: FSMContext):
             # Добавляем запрещенное слово
             settings = await db.get_global_settings()
             if settings:
-                if not hasattr(settings, 'default_banned_words'):
-                    settings.default_banned_words = []
+                banned_words = settings.default_banned_words or []
                 
-                if new_word.lower() not in [w.lower() for w in settings.default_banned_words]:
-                    new_banned_words = settings.default_banned_words + [new_word]
+                if new_word.lower() not in [w.lower() for w in banned_words]:
+                    new_banned_words = banned_words + [new_word]
                     
                     try:
-                        settings.default_banned_words = new_banned_words
-                        async with db.async_session() as session:
-                            await session.merge(settings)
-                            await session.commit()
+                        if not await db.update_global_banned_words(new_banned_words):
+                            raise RuntimeError("не удалось сохранить запрещенные слова")
                         
                         await message.answer(
                             f"✅ Добавлено запрещенное слово: {new_word}\n\n"
@@ -2464,7 +2415,7 @@ async def process_exception_word(message: types.Message, state: FSMContext):
                             f"Применяется ко всем чатам."
                         )
                     except Exception as e:
-                        print(f"❌ Ошибка сохранения запрещенного слова: {e}")
+                        logger.error("❌ Ошибка сохранения запрещенного слова: %s", e)
                         await message.answer("❌ Ошибка сохранения")
                 else:
                     await message.answer(f"ℹ️ Запрещенное слово {new_word} уже существует")
@@ -2475,11 +2426,10 @@ async def process_exception_word(message: types.Message, state: FSMContext):
             # Добавляем обычное исключение
             settings = await db.get_global_settings()
             if settings:
-                if settings.default_exclude_words is None:
-                    settings.default_exclude_words = []
+                exclude_words = settings.default_exclude_words or []
                 
-                if new_word.lower() not in [w.lower() for w in settings.default_exclude_words]:
-                    new_exceptions = settings.default_exclude_words + [new_word]
+                if new_word.lower() not in [w.lower() for w in exclude_words]:
+                    new_exceptions = exclude_words + [new_word]
                     success = await db.update_global_exceptions(new_exceptions)
                     
                     if success:
@@ -2696,10 +2646,8 @@ async def process_min_length(message: types.Message, state: FSMContext):
                 return
             
             try:
-                settings.default_min_message_length = new_length
-                async with db.async_session() as session:
-                    await session.merge(settings)
-                    await session.commit()
+                if not await db.update_global_min_message_length(new_length):
+                    raise RuntimeError("не удалось сохранить минимальную длину")
                 
                 await message.answer(
                     f"✅ Минимальная длина сообщений изменена на {new_length} символов\n\n"
@@ -2708,7 +2656,7 @@ async def process_min_length(message: types.Message, state: FSMContext):
                 )
                 
             except Exception as e:
-                print(f"❌ Ошибка сохранения длины: {e}")
+                logger.error("❌ Ошибка сохранения длины: %s", e)
                 await message.answer("❌ Ошибка сохранения")
         else:
             await message.answer("❌ Длина должна быть от 5 до 100 символов")
@@ -3039,7 +2987,7 @@ async def ensure_user_in_chat(user_id: int, chat_id: int, username: str = None,
         return user_chat_data
         
     except Exception as e:
-        print(f"⚠️ Ошибка сохранения пользователя: {e}")
+        logger.warning("⚠️ Ошибка сохранения пользователя: %s", e)
         return None
     
 @router.callback_query(F.data == "admin:notification_settings")
@@ -3211,10 +3159,7 @@ async def process_notification_text(message: types.Message, state: FSMContext):
             # Сохраняем в глобальных настройках
             settings = await db.get_global_settings()
             if settings:
-                if not settings.default_notifications:
-                    settings.default_notifications = {}
-                
-                new_notifications = settings.default_notifications.copy()
+                new_notifications = settings.default_notifications or {}
                 new_notifications[db_key] = new_text
                 
                 success = await db.update_global_notifications(new_notifications)
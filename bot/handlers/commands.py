@@ -4,7 +4,6 @@ from aiogram.fsm.context import FSMContext
 
 from ..database import db
 from ..utils.admin_check import is_admin
-from .callbacks import show_user_limits_message
 
 router = Router()
 
@@ -15,6 +14,7 @@ router = Router()
 async def cmd_search(message: types.Message, state: FSMContext):
     """Поиск чатов и пользователей"""
     if not is_admin(message.from_user.id):
+        from .callbacks import show_user_limits_message
         await show_user_limits_message(message)
         return
     
@@ -40,6 +40,7 @@ async def main_menu_handler(message: types.Message):
     user_id = message.from_user.id
     
     if not is_admin(user_id):
+        from .callbacks import show_user_limits_message
         await show_user_limits_message(message)
         return
     
@@ -60,6 +61,7 @@ async def cmd_start(message: types.Message, state: FSMContext):
     # Проверяем, является ли пользователь администратором
     if not is_admin(user_id):
         # Показываем обычному пользователю только его лимиты
+        from .callbacks import show_user_limits_message
         await show_user_limits_message(message)
         return
     
@@ -1,3 +1,4 @@
+import logging
 import re
 import traceback
 from aiogram import Router, types, F
@@ -9,6 +10,8 @@ from ..states import AdminStates
 from ..config import config
 from ..utils.admin_check import is_admin
 
+logger = logging.getLogger(__name__)
+
 router = Router()
 
 # ===== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ =====
@@ -36,27 +39,15 @@ async def get_banned_words_for_chat(chat_id: int) -> list:
                 "ебать", "выебан", "дрочить", "конча", "сперма"]
         
     except Exception as e:
-        print(f"⚠️ Ошибка получения запрещенных слов: {e}")
+        logger.warning("⚠️ Ошибка получения запрещенных слов: %s", e)
         return []
 
 async def get_min_message_length(chat_id: int) -> int:
     """Получает минимальную длину сообщения для чата"""
     try:
-        # Получаем настройки чата
-        chat = await db.get_chat_by_id(chat_id)
-        if chat and hasattr(chat, 'min_message_length') and chat.min_message_length:
-            return chat.min_message_length
-        
-        # Или глобальные настройки
-        settings = await db.get_global_settings()
-        if settings and hasattr(settings, 'default_min_message_length') and settings.default_min_message_length:
-            return settings.default_min_message_length
-        
-        # По умолчанию 20 символов
-        return 20
-        
+        return await db.get_min_message_length(chat_id)
     except Exception as e:
-        print(f"⚠️ Ошибка получения минимальной длины: {e}")
+        logger.warning("⚠️ Ошибка получения минимальной длины: %s", e)
         return 20
 
 # ===== ГЛАВНОЕ МЕНЮ УПРАВЛЕНИЯ ИСКЛЮЧЕНИЯМИ =====
@@ -604,14 +595,12 @@ async def banned_word_remove_callback(callback: types.CallbackQuery):
                 
                 # Обновляем атрибут (нужно будет добавить метод в БД)
                 try:
-                    settings.default_banned_words = new_banned_words
-                    async with db.async_session() as session:
-                        await session.merge(settings)
-                        await session.commit()
+                    if not await db.update_global_banned_words(new_banned_words):
+                        raise RuntimeError("не удалось сохранить запрещенные слова")
                     
                     await callback.answer(f"✅ Удалено запрещенное слово: {word}")
                 except Exception as e:
-                    print(f"❌ Ошибка удаления запрещенного слова: {e}")
+                    logger.error("❌ Ошибка удаления запрещенного слова: %s", e)
                     await callback.answer("❌ Ошибка удаления")
             else:
                 await callback.answer("⚠️ Нет запрещенных слов для удаления")
@@ -669,23 +658,10 @@ async def toggle_banned_case_callback(callback: types.CallbackQuery):
             await callback.answer("❌ Настройки не найдены")
             return
         
-        # Переключаем настройку
-        current_value = getattr(settings, 'banned_words_case_sensitive', True)
-        new_value = not current_value
-        
-        # Обновляем в БД
-        try:
-            settings.banned_words_case_sensitive = new_value
-            async with db.async_session() as session:
-                await session.merge(settings)
-                await session.commit()
-            
-            status = "включена" if new_value else "выключена"
-            await callback.answer(f"✅ Чувствительность к регистру {status}")
-            await banned_words_callback(callback)
-        except Exception as e:
-            print(f"❌ Ошибка обновления настроек регистра: {e}")
-            await callback.answer("❌ Ошибка обновления")
+        # В GlobalSettings нет поля для этой настройки: запрещенные слова
+        # всегда ищутся без учета регистра
+        await callback.answer("ℹ️ Запрещенные слова всегда проверяются без учета регистра")
+        await banned_words_callback(callback)
             
     except Exception as e:
         await callback.answer(f"❌ Ошибка: {e}")
@@ -706,15 +682,13 @@ async def banned_words_reset_callback(callback: types.CallbackQuery):
         default_words = ["хуй", "пизда", "еблан", "мудак", "сука", "блять"]
         
         try:
-            settings.default_banned_words = default_words
-            async with db.async_session() as session:
-                await session.merge(settings)
-                await session.commit()
+            if not await db.update_global_banned_words(default_words):
+                raise RuntimeError("не удалось сохранить запрещенные слова")
             
             await callback.answer("✅ Запрещенные слова сброшены к умолчанию")
             await banned_words_callback(callback)
         except Exception as e:
-            print(f"❌ Ошибка сброса запрещенных слов: {e}")
+            logger.error("❌ Ошибка сброса запрещенных слов: %s", e)
             await callback.answer("❌ Ошибка сброса")
             
     except Exception as e:
@@ -900,15 +874,13 @@ async def reset_length_callback(callback: types.CallbackQuery):
         
         # Устанавливаем значение по умолчанию
         try:
-            settings.default_min_message_length = 20
-            async with db.async_session() as session:
-                await session.merge(settings)
-                await session.commit()
+            if not await db.update_global_min_message_length(20):
+                raise RuntimeError("не удалось сохранить минимальную длину")
             
             await callback.answer("✅ Минимальная длина сброшена к 20 символам")
             await length_settings_callback(callback)
         except Exception as e:
-            print(f"❌ Ошибка сброса длины: {e}")
+            logger.error("❌ Ошибка сброса длины: %s", e)
             await callback.answer("❌ Ошибка сброса")
             
     except Exception as e:
@@ -1143,17 +1115,14 @@ async def process_exception_word(message: types.Message, state: FSMContext):
             # Добавляем запрещенное слово
             settings = await db.get_global_settings()
             if settings:
-                if not hasattr(settings, 'default_banned_words'):
-                    settings.default_banned_words = []
+                banned_words = settings.default_banned_words or []
                 
-                if new_word.lower() not in [w.lower() for w in settings.default_banned_words]:
-                    new_banned_words = settings.default_banned_words + [new_word]
+                if new_word.lower() not in [w.lower() for w in banned_words]:
+                    new_banned_words = banned_words + [new_word]
                     
                     try:
-                        settings.default_banned_words = new_banned_words
-                        async with db.async_session() as session:
-                            await session.merge(settings)
-                            await session.commit()
+                        if not await db.update_global_banned_words(new_banned_words):
+                            raise RuntimeError("не удалось сохранить запрещенные слова")
                         
                         await message.answer(
                             f"✅ Добавлено запрещенное слово: {new_word}\n\n"
@@ -1161,7 +1130,7 @@ async def process_exception_word(message: types.Message, state: FSMContext):
                             f"Применяется ко всем чатам."
                         )
                     except Exception as e:
-                        print(f"❌ Ошибка сохранения запрещенного слова: {e}")
+                        logger.error("❌ Ошибка сохранения запрещенного слова: %s", e)
                         await message.answer("❌ Ошибка сохранения")
                 else:
                     await message.answer(f"ℹ️ Запрещенное слово {new_word} уже существует")
@@ -1172,11 +1141,10 @@ async def process_exception_word(message: types.Message, state: FSMContext):
             # Добавляем обычное исключение
             settings = await db.get_global_settings()
             if settings:
-                if settings.default_exclude_words is None:
-                    settings.default_exclude_words = []
+                exclude_words = settings.default_exclude_words or []
                 
-                if new_word.lower() not in [w.lower() for w in settings.default_exclude_words]:
-                    new_exceptions = settings.default_exclude_words + [new_word]
+                if new_word.lower() not in [w.lower() for w in exclude_words]:
+                    new_exceptions = exclude_words + [new_word]
                     success = await db.update_global_exceptions(new_exceptions)
                     
                     if success:
@@ -1229,10 +1197,8 @@ async def process_min_length(message: types.Message, state: FSMContext):
                 return
             
             try:
-                settings.default_min_message_length = new_length
-                async with db.async_session() as session:
-                    await session.merge(settings)
-                    await session.commit()
+                if not await db.update_global_min_message_length(new_length):
+                    raise RuntimeError("не удалось сохранить минимальную длину")
                 
                 await message.answer(
                     f"✅ Минимальная длина сообщений изменена на {new_length} символов\n\n"
@@ -1241,7 +1207,7 @@ async def process_min_length(message: types.Message, state: FSMContext):
                 )
                 
             except Exception as e:
-                print(f"❌ Ошибка сохранения длины: {e}")
+                logger.error("❌ Ошибка сохранения длины: %s", e)
                 await message.answer("❌ Ошибка сохранения")
         else:
             await message.answer("❌ Длина должна быть от 5 до 100 символов")
@@ -7,26 +7,50 @@ from aiogram.filters.chat_member_updated import ChatMemberUpdatedFilter, JOIN_TR
 from datetime import datetime, timedelta
 import asyncio
 import html
+import logging
 import random
 import re
 import traceback
 
-from ..database import db
+from ..database import db, AdmissionDecision
 from ..config import config
+from ..services.admin_cache import admin_cache
+from ..services.banned_words import BannedWordMatcher, banned_word_matchers
+from ..services.auto_delete import auto_delete
+from ..services.album_aggregator import Album, ClosedAlbum, album_aggregator
+from ..services.cache import LRUCache, cache_stats
 from aiogram.filters.chat_member_updated import ChatMemberUpdatedFilter, LEAVE_TRANSITION
 
+logger = logging.getLogger(__name__)
 
 router = Router()
 
-# Глобальные переменные для хранения данных
-user_empty_message_counters = {}  # Счетчики пустых сообщений: {(user_id, chat_id): count}
-banned_words_cache = {}  # Кэш запрещенных слов: {chat_id: [words]}
-last_messages = {}  # Сохраняем последние сообщения для автоудаления: {(chat_id, user_id): message}
+# Счетчики пустых сообщений подряд: {(user_id, chat_id): count}
+user_empty_message_counters = LRUCache(
+    "empty_messages", config.EMPTY_COUNTER_MAX_SIZE, config.EMPTY_COUNTER_TTL
+)
 
-# Кэш для обработки альбомов - храним ID обработанных альбомов
-processed_albums = set()  # {(chat_id, media_group_id)}
-album_first_messages = {}  # {(chat_id, media_group_id): message_id}
 
+# ===== КЭШ АДМИНИСТРАТОРОВ =====
+
+async def track_admin_changes(handler, event: ChatMemberUpdated, data: dict):
+    """Обновляет кэш администраторов по каждому событию chat_member"""
+    try:
+        admin_cache.apply_member_update(
+            event.chat.id,
+            event.new_chat_member.user.id,
+            event.new_chat_member.status
+        )
+    except Exception as e:
+        logger.warning("⚠️ Ошибка обновления кэша администраторов: %s", e)
+    return await handler(event, data)
+
+router.chat_member.outer_middleware(track_admin_changes)
+
+@router.my_chat_member()
+async def on_bot_member_updated(event: ChatMemberUpdated):
+    """Права бота в чате изменились - список администраторов перечитаем при следующем сообщении"""
+    admin_cache.invalidate(event.chat.id)
 
 # ===== ОБРАБОТКА УДАЛЕНИЯ БОТА =====
 
@@ -38,7 +62,7 @@ async def on_bot_left_chat(event: ChatMemberUpdated):
     
     # Проверяем, что событие касается бота
     if event.new_chat_member.user.id == event.bot.id:
-        print(f"🚫 Бот покинул/удален из чата: {chat.title or 'Без названия'} (ID: {chat_id})")
+        logger.info("🚫 Бот покинул/удален из чата: %s (ID: %s)", chat.title or 'Без названия', chat_id)
         
         if db.is_valid_chat_id(chat_id):
             await handle_bot_removal(chat_id, chat.title)
@@ -47,15 +71,8 @@ async def handle_bot_removal(chat_id: int, chat_title: str = None):
     """Обработка удаления бота из чата"""
     try:
         # 1. Деактивируем чат в БД
-        chat_obj = await db.get_chat_by_id(chat_id)
-        
-        if chat_obj:
-            chat_obj.is_active = False
-            async with db.async_session() as session:
-                await session.merge(chat_obj)
-                await session.commit()
-            
-            print(f"✅ Чат {chat_id} деактивирован в БД")
+        if await db.set_chat_active(chat_id, False):
+            logger.info("✅ Чат %s деактивирован в БД", chat_id)
         
         # 2. Очищаем все кэши для этого чата
         await clear_chat_caches(chat_id)
@@ -70,37 +87,33 @@ async def handle_bot_removal(chat_id: int, chat_title: str = None):
             details=f"Чат: {chat_title or 'Неизвестно'}. Бот покинул чат."
         )
         
-        print(f"✅ Все данные чата {chat_id} очищены")
+        logger.info("✅ Все данные чата %s очищены", chat_id)
         
     except Exception as e:
-        print(f"❌ Ошибка при обработке удаления бота: {e}")
+        logger.error("❌ Ошибка при обработке удаления бота: %s", e)
 
 async def clear_chat_caches(chat_id: int):
     """Очистка всех кэшей для чата"""
-    global banned_words_cache, user_empty_message_counters, last_messages
+    global user_empty_message_counters
     
     try:
+        # Администраторы чата
+        admin_cache.invalidate(chat_id)
+        
         # Запрещенные слова
-        if chat_id in banned_words_cache:
-            del banned_words_cache[chat_id]
-            print(f"   🧹 Кэш запрещенных слов для чата {chat_id} очищен")
+        if chat_id in banned_word_matchers:
+            banned_word_matchers.invalidate(chat_id)
+            logger.debug("   🧹 Кэш запрещенных слов для чата %s очищен", chat_id)
         
         # Счетчики пустых сообщений
         keys_to_remove = [k for k in user_empty_message_counters.keys() if k[1] == chat_id]
         for key in keys_to_remove:
             del user_empty_message_counters[key]
         if keys_to_remove:
-            print(f"   🧹 Удалено {len(keys_to_remove)} счетчиков пустых сообщений")
-        
-        # Сохраненные сообщения
-        keys_to_remove = [k for k in last_messages.keys() if k[0] == chat_id]
-        for key in keys_to_remove:
-            del last_messages[key]
-        if keys_to_remove:
-            print(f"   🧹 Удалено {len(keys_to_remove)} сохраненных сообщений")
+            logger.debug("   🧹 Удалено %s счетчиков пустых сообщений", len(keys_to_remove))
             
     except Exception as e:
-        print(f"⚠️ Ошибка очистки кэшей: {e}")
+        logger.warning("⚠️ Ошибка очистки кэшей: %s", e)
 
 async def clear_chat_user_data(chat_id: int):
     """Очистка данных пользователей чата (опционально)"""
@@ -130,10 +143,10 @@ async def clear_chat_user_data(chat_id: int):
             await session.commit()
             
             if deleted_count > 0:
-                print(f"   🧹 Удалено/очищено {deleted_count} записей пользователей")
+                logger.debug("   🧹 Удалено/очищено %s записей пользователей", deleted_count)
                 
     except Exception as e:
-        print(f"⚠️ Ошибка очистки данных пользователей: {e}")
+        logger.warning("⚠️ Ошибка очистки данных пользователей: %s", e)
 
 # ===== КОМАНДА ДЛЯ РУЧНОЙ ОЧИСТКИ =====
 
@@ -168,9 +181,6 @@ async def cmd_clear_chat_data(message: types.Message):
         
         confirm_msg = await message.reply(confirm_text, parse_mode="HTML")
         
-        # Сохраняем для автоудаления
-        await save_last_message(chat_id, user_id, confirm_msg)
-        
         # Ждем подтверждение
         def check_confirm(m: types.Message):
             return m.from_user.id == user_id and m.text and m.text.upper() == "ДА"
@@ -188,12 +198,8 @@ async def cmd_clear_chat_data(message: types.Message):
             
             await confirmation.reply("✅ Данные чата успешно очищены")
             
-            # Автоудаление через 10 секунд
-            await asyncio.sleep(60)
-            try:
-                await confirmation.delete()
-            except:
-                pass
+            # Автоудаление через 60 секунд
+            auto_delete.schedule(confirmation, 60)
             
         except asyncio.TimeoutError:
             await message.reply("❌ Время ожидания подтверждения истекло")
@@ -201,31 +207,14 @@ async def cmd_clear_chat_data(message: types.Message):
     except Exception as e:
         await message.reply(f"❌ Ошибка: {e}")
 
-# Глобальные переменные для хранения данных
-user_empty_message_counters = {}  # Счетчики пустых сообщений: {(user_id, chat_id): count}
-banned_words_cache = {}  # Кэш запрещенных слов: {chat_id: [words]}
-last_messages = {}  # Сохраняем последние сообщения для автоудаления: {(chat_id, user_id): message}
-
 # ===== УТИЛИТЫ ДЛЯ СОХРАНЕНИЯ ПОЛЬЗОВАТЕЛЕЙ =====
 
 async def get_min_message_length(chat_id: int) -> int:
     """Получает минимальную длину сообщения для чата"""
     try:
-        # Получаем настройки чата
-        chat = await db.get_chat_by_id(chat_id)
-        if chat and hasattr(chat, 'min_message_length') and chat.min_message_length:
-            return chat.min_message_length
-        
-        # Или глобальные настройки
-        settings = await db.get_global_settings()
-        if settings and hasattr(settings, 'default_min_message_length') and settings.default_min_message_length:
-            return settings.default_min_message_length
-        
-        # По умолчанию 20 символов
-        return 20
-        
+        return await db.get_min_message_length(chat_id)
     except Exception as e:
-        print(f"⚠️ Ошибка получения минимальной длины: {e}")
+        logger.warning("⚠️ Ошибка получения минимальной длины: %s", e)
         return 20
 
 async def ensure_user_in_chat(message: types.Message, user_id: int, chat_id: int):
@@ -251,7 +240,7 @@ async def ensure_user_in_chat(message: types.Message, user_id: int, chat_id: int
         return user_chat_data, chat
         
     except Exception as e:
-        print(f"⚠️ Ошибка сохранения пользователя: {e}")
+        logger.warning("⚠️ Ошибка сохранения пользователя: %s", e)
         return None, None
 
 def get_text_from_message(message: types.Message) -> str:
@@ -270,12 +259,11 @@ def get_text_from_message(message: types.Message) -> str:
     
     return ""
 
-async def get_banned_words_for_chat(chat_id: int) -> list:
-    """Получает список запрещенных слов для чата"""
-    # Используем кэширование для производительности
-    if chat_id in banned_words_cache:
-        cached_words = banned_words_cache[chat_id]
-        return cached_words if isinstance(cached_words, list) else []
+async def get_banned_word_matcher(chat_id: int) -> BannedWordMatcher:
+    """Получает скомпилированный набор запрещенных слов для чата (из кэша)"""
+    matcher = banned_word_matchers.get(chat_id)
+    if matcher is not None:
+        return matcher
     
     try:
         # Получаем из БД
@@ -285,22 +273,23 @@ async def get_banned_words_for_chat(chat_id: int) -> list:
         if not isinstance(banned_words, list):
             banned_words = []
         
-        # Фильтруем только непустые строки
-        banned_words = [word.strip() for word in banned_words if isinstance(word, str) and word.strip()]
-        
-        # Кэшируем
-        banned_words_cache[chat_id] = banned_words
+        # Компилируем и кэшируем до изменения списка в БД
+        matcher = banned_word_matchers.put(chat_id, banned_words)
         
-        print(f"   📋 Получено запрещенных слов для чата {chat_id}: {len(banned_words)}")
-        if banned_words:
-            print(f"   📋 Список: {banned_words[:10]}{'...' if len(banned_words) > 10 else ''}")
+        logger.debug("   📋 Скомпилировано запрещенных слов для чата %s: %s", chat_id, len(matcher))
         
-        return banned_words
+        return matcher
         
     except Exception as e:
-        print(f"⚠️ Ошибка получения запрещенных слов: {e}")
-        # Возвращаем пустой список в случае ошибки
-        return []
+        logger.warning("⚠️ Ошибка получения запрещенных слов: %s", e)
+        # Пустой набор в случае ошибки (не кэшируем)
+        return BannedWordMatcher([])
+
+async def get_banned_words_for_chat(chat_id: int) -> list:
+    """Получает список запрещенных слов для чата"""
+    matcher = await get_banned_word_matcher(chat_id)
+    return matcher.words
+
 def count_non_space_chars(text: str) -> int:
     """Считает количество символов с учетом пробелов"""
     if not text:
@@ -319,112 +308,84 @@ async def check_message_requirements(text: str, chat_id: int) -> tuple:
     if not text:
         return False, False, None, None
     
-    print(f"   🔧 check_message_requirements: text='{text[:50]}...'")
-    print(f"   📏 Длина: {len(text)} символов, без пробелов: {count_non_space_chars(text)}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("   🔧 check_message_requirements: text='%s...'", text[:50])
+        logger.debug("   📏 Длина: %s символов, без пробелов: %s", len(text), count_non_space_chars(text))
     
     # 1. СНАЧАЛА проверяем на запрещенные слова (вне зависимости от длины)
-    banned_words = await get_banned_words_for_chat(chat_id)
+    matcher = await get_banned_word_matcher(chat_id)
+    banned_word = matcher.search(text)
     
-    if banned_words:
-        text_lower = text.lower()
-        
-        for banned_word in banned_words:
-            if banned_word and banned_word.strip():
-                # Ищем целые слова (с границами слова)
-                pattern = r'\b' + re.escape(banned_word.lower().strip()) + r'\b'
-                if re.search(pattern, text_lower):
-                    print(f"   🚫 Обнаружено запрещенное слово: '{banned_word}'")
-                    return False, True, f"banned_word_{banned_word}", f"Обнаружено запрещенное слово: {banned_word}"
+    if banned_word:
+        logger.debug("   🚫 Обнаружено запрещенное слово: '%s'", banned_word)
+        return False, True, f"banned_word_{banned_word}", f"Обнаружено запрещенное слово: {banned_word}"
     
     # 2. Если нет запрещенных слов, проверяем длину (для подсчета в лимит)
     non_space_chars = count_non_space_chars(text)
     min_length = await get_min_message_length(chat_id)
     
-    print(f"   📊 Минимальная длина для учета: {min_length} символов (без пробелов)")
+    logger.debug("   📊 Минимальная длина для учета: %s символов (без пробелов)", min_length)
     
     # Сообщения короче min_length НЕ УДАЛЯЮТСЯ, просто не учитываются в лимите
     if non_space_chars < min_length:
-        print(f"   ⚠️ Сообщение слишком короткое ({non_space_chars} < {min_length} символов), не учитывается в лимите")
+        logger.debug("   ⚠️ Сообщение слишком короткое (%s < %s символов), не учитывается в лимите", non_space_chars, min_length)
         return False, False, "short_message", f"Сообщение слишком короткое ({non_space_chars} < {min_length} символов)"
     
-    print(f"   ✅ Сообщение прошло проверки, будет учитываться в лимите")
+    logger.debug("   ✅ Сообщение прошло проверки, будет учитываться в лимите")
     return True, False, None, None
     
     # 2. Только если нет запрещенных слов, проверяем длину
     non_space_chars = count_non_space_chars(text)
     min_length = await get_min_message_length(chat_id)
     
-    print(f"   📊 Минимальная длина: {min_length} символов")
+    logger.debug("   📊 Минимальная длина: %s символов", min_length)
     
     if non_space_chars < min_length:
-        print(f"   ⚠️ Сообщение слишком короткое: {non_space_chars} < {min_length}")
+        logger.debug("   ⚠️ Сообщение слишком короткое: %s < %s", non_space_chars, min_length)
         return False, False, "short_message", f"Сообщение слишком короткое ({non_space_chars} < {min_length} символов)"
     
-    print(f"   ✅ Сообщение прошло проверки")
+    logger.debug("   ✅ Сообщение прошло проверки")
     return True, False, None, None
     
     # Получаем минимальную длину из настроек
     min_length = await get_min_message_length(chat_id)
-    print(f"   📊 Минимальная длина: {min_length} символов")
+    logger.debug("   📊 Минимальная длина: %s символов", min_length)
     
     if non_space_chars < min_length:
-        print(f"   ⚠️ Сообщение слишком короткое: {non_space_chars} < {min_length}")
+        logger.debug("   ⚠️ Сообщение слишком короткое: %s < %s", non_space_chars, min_length)
         return False, False, "short_message", f"Сообщение слишком короткое ({non_space_chars} меньше {min_length} символов)"
     
-    print(f"   ✅ Сообщение прошло проверки")
+    logger.debug("   ✅ Сообщение прошло проверки")
     return True, False, None, None
 
-async def save_last_message(chat_id: int, user_id: int, message: types.Message):
-    """Сохраняет последнее сообщение для автоудаления"""
-    key = (chat_id, user_id)
-    last_messages[key] = message
-
-async def delete_last_message(chat_id: int, user_id: int):
-    """Удаляет сохраненное сообщение"""
-    key = (chat_id, user_id)
-    if key in last_messages:
-        del last_messages[key]
-
-async def handle_empty_message(message: types.Message, user_id: int, chat_id: int):
+async def handle_empty_message(message: types.Message, decision: AdmissionDecision):
     """Обработка пустого сообщения (одиночного, не альбома) с ограничением на 3 попытки"""
     
     # Проверяем, не альбом ли это
     if message.media_group_id:
-        print(f"   ⏭️ Это альбом, будет обработан в handle_media_album")
+        logger.debug("   ⏭️ Это альбом, будет обработан в handle_media_album")
         return
     
-    user_chat_data = await db.get_or_create_user_chat_data(user_id, chat_id)
-    if user_chat_data and user_chat_data.is_muted:
-        print(f"   ⏭️ Пользователь уже заблокирован, пустое сообщение игнорируется")
-        try:
-            await message.delete()
-        except:
-            pass
+    user_id = decision.user_id
+    chat_id = decision.chat_id
+    
+    if decision.is_muted:
+        logger.debug("   ⏭️ Пользователь уже заблокирован, пустое сообщение игнорируется")
+        auto_delete.delete_soon(message)
         return
     
     key = (user_id, chat_id)
     
-    # Сохраняем пользователя в БД ДАЖЕ если он отправляет пустое сообщение
-    try:
-        user_chat_data, chat = await ensure_user_in_chat(message, user_id, chat_id)
-        if not user_chat_data:
-            print(f"⚠️ Не удалось сохранить пользователя в БД")
-    except Exception as e:
-        print(f"⚠️ Ошибка сохранения пользователя в БД: {e}")
-    
     # Увеличиваем счетчик пустых сообщений
     current_count = user_empty_message_counters.get(key, 0) + 1
     user_empty_message_counters[key] = current_count
     
-    # Удаляем медиа СРАЗУ
-    try:
-        await message.delete()
-        print(f"   🗑️ Пустое сообщение (одиночное) удалено сразу")
-    except Exception as e:
-        print(f"⚠️ Не удалось удалить пустое сообщение: {e}")    
-    # Получаем уведомление из БД
+    # Удаляем медиа СРАЗУ (удаления в чате объединяются в один deleteMessages)
+    auto_delete.delete_soon(message)
+    logger.debug("   🗑️ Пустое сообщение (одиночное) отправлено на удаление")
+    # Получаем уведомление из решения о допуске
     try:
-        notifications = await db.get_chat_notifications(chat_id)
+        notifications = decision.notifications
         warning_text = notifications.get("empty_message", 
             "⚠️ <b>Внимание!</b>\n"
             "Просто картинки/стикеры/видео без текста нельзя отправлять в чат.\n"
@@ -436,10 +397,10 @@ async def handle_empty_message(message: types.Message, user_id: int, chat_id: in
         if f"Предупреждение {current_count}/3" not in warning_text:
             warning_text += f"\n\nПредупреждение {current_count}/3"
         
-        print(f"   📝 Используется уведомление из БД: {warning_text[:50]}...")
+        logger.debug("   📝 Используется уведомление из БД: %s...", warning_text[:50])
         
     except Exception as e:
-        print(f"⚠️ Ошибка получения уведомления: {e}")
+        logger.warning("⚠️ Ошибка получения уведомления: %s", e)
         # Fallback текст
         warning_text = (
             "⚠️ <b>Внимание!</b>\n"
@@ -456,9 +417,6 @@ async def handle_empty_message(message: types.Message, user_id: int, chat_id: in
             parse_mode="HTML"
         )
         
-        # Сохраняем предупреждение для автоудаления (только для пользователя)
-        await save_last_message(chat_id, user_id, warning_msg)
-        
         # Проверяем лимит (3 пустых сообщения) и мутим НЕМЕДЛЕННО
         if current_count >= 3:
             mute_until = datetime.now() + timedelta(days=3)
@@ -474,8 +432,7 @@ async def handle_empty_message(message: types.Message, user_id: int, chat_id: in
                 
                 # Получаем уведомление о блокировке из БД (НОВЫЙ КЛЮЧ)
                 try:
-                    notifications = await db.get_chat_notifications(chat_id)
-                    mute_text = notifications.get("empty_message_blocked",
+                    mute_text = decision.notifications.get("empty_message_blocked",
                         "🚫 <b>Блокировка за пустые сообщения</b>\n\n"
                         "Вы отправили 3 пустых медиа-сообщения подряд без текста.\n"
                         f"Заблокирован до: {mute_until.strftime('%d.%m.%Y %H:%M')}\n\n"
@@ -490,7 +447,7 @@ async def handle_empty_message(message: types.Message, user_id: int, chat_id: in
                         mute_text += f"\n\nЗаблокирован до: {mute_until.strftime('%d.%m.%Y %H:%M')}"
                     
                 except Exception as e:
-                    print(f"⚠️ Ошибка получения уведомления о блокировке: {e}")
+                    logger.warning("⚠️ Ошибка получения уведомления о блокировке: %s", e)
                     mute_text = (
                         "🚫 <b>Блокировка за пустые сообщения</b>\n\n"
                         "Вы отправили 3 пустых медиа-сообщения подряд без текста.\n"
@@ -508,43 +465,11 @@ async def handle_empty_message(message: types.Message, user_id: int, chat_id: in
                 # Сбрасываем счетчик после мута
                 user_empty_message_counters[key] = 0
                 
-                # Автоудаление уведомления о муте через 10 секунд
-                await asyncio.sleep(60)
-                try:
-                    await mute_msg.delete()
-                except Exception as e:
-                    print(f"⚠️ Не удалось удалить уведомление о муте: {e}")
+                # Автоудаление через 60 секунд
+                auto_delete.schedule(mute_msg, 60)
                 
                 # Обновляем статус в БД
-                try:
-                    async with db.async_session() as session:
-                        from sqlalchemy import select
-                        from ..models.schemas import UserChatData
-                        
-                        result = await session.execute(
-                            select(UserChatData)
-                            .where(UserChatData.user_id == user_id)
-                            .where(UserChatData.chat_id == chat_id)
-                        )
-                        user_chat_data = result.scalar_one_or_none()
-                        
-                        if user_chat_data:
-                            user_chat_data.is_muted = True
-                            user_chat_data.mute_until = mute_until
-                            await session.commit()
-                        else:
-                            user_chat_data = UserChatData(
-                                user_id=user_id,
-                                chat_id=chat_id,
-                                is_muted=True,
-                                mute_until=mute_until,
-                                message_count=0,
-                                last_reset_date=datetime.utcnow()
-                            )
-                            session.add(user_chat_data)
-                            await session.commit()
-                except Exception as e:
-                    print(f"⚠️ Не удалось обновить статус мута в БД: {e}")
+                await db.set_user_muted(user_id, chat_id, mute_until)
                 
                 await db.log_action(
                     action_type="empty_message_mute",
@@ -553,10 +478,10 @@ async def handle_empty_message(message: types.Message, user_id: int, chat_id: in
                     details=f"3 пустых сообщения подряд. Мут до {mute_until}"
                 )
                 
-                print(f"✅ Пользователь {user_id} заблокирован за 3 пустых сообщения до {mute_until}")
+                logger.info("✅ Пользователь %s заблокирован за 3 пустых сообщения до %s", user_id, mute_until)
                 
             except Exception as e:
-                print(f"❌ Ошибка при муте пользователя за пустые сообщения: {e}")
+                logger.error("❌ Ошибка при муте пользователя за пустые сообщения: %s", e)
                 await db.log_action(
                     "mute_error",
                     user_id=user_id,
@@ -564,16 +489,11 @@ async def handle_empty_message(message: types.Message, user_id: int, chat_id: in
                     details=f"Ошибка мута: {str(e)}"
                 )
         
-        # Удаляем предупреждение через 10 секунд
-        await asyncio.sleep(60)
-        try:
-            await warning_msg.delete()
-            await delete_last_message(chat_id, user_id)
-        except Exception as e:
-            print(f"⚠️ Не удалось удалить предупреждение: {e}")
+        # Автоудаление через 60 секунд
+        auto_delete.schedule(warning_msg, 60)
     
     except Exception as e:
-        print(f"❌ Общая ошибка обработки пустого сообщения: {e}")
+        logger.error("❌ Общая ошибка обработки пустого сообщения: %s", e)
 async def check_empty_message(message: types.Message) -> bool:
     """Проверяем, является ли сообщение 'пустым'"""
     # Получаем текст или подпись
@@ -644,11 +564,11 @@ async def restrict_user(bot, chat_id: int, user_id: int) -> bool:
             until_date=int(unblock_date.timestamp())
         )
         
-        print(f"✅ Пользователь {user_id} заблокирован до {unblock_date.strftime('%d.%m.%Y %H:%M')}")
+        logger.info("✅ Пользователь %s заблокирован до %s", user_id, unblock_date.strftime('%d.%m.%Y %H:%M'))
         return True
         
     except Exception as e:
-        print(f"❌ Ошибка блокировки пользователя {user_id}: {e}")
+        logger.error("❌ Ошибка блокировки пользователя %s: %s", user_id, e)
         return False
 
 async def block_for_swear_word(bot, chat_id: int, user_id: int, word: str):
@@ -673,7 +593,7 @@ async def block_for_swear_word(bot, chat_id: int, user_id: int, word: str):
         return block_text, mute_until
         
     except Exception as e:
-        print(f"❌ Ошибка блокировки за запрещенное слово: {e}")
+        logger.error("❌ Ошибка блокировки за запрещенное слово: %s", e)
         return None, None
 
 async def handle_swear_word_block(message: types.Message, user_id: int, chat_id: int, block_reason: str):
@@ -682,22 +602,15 @@ async def handle_swear_word_block(message: types.Message, user_id: int, chat_id:
     
     # Получаем текст сообщения и маскируем его
     original_text = get_text_from_message(message)
-    banned_words_list = await get_banned_words_for_chat(chat_id)
+    matcher = await get_banned_word_matcher(chat_id)
     
-    # Проверяем что banned_words_list является списком
-    if not isinstance(banned_words_list, list):
-        banned_words_list = []
-    
-    masked_text, found_words = mask_swear_words(original_text, banned_words_list)
+    masked_text, found_words = matcher.mask(original_text)
     
     block_text, mute_until = await block_for_swear_word(message.bot, chat_id, user_id, banned_word)
     
     if block_text and mute_until:
         # Удаляем сообщение СРАЗУ
-        try:
-            await message.delete()
-        except:
-            pass
+        auto_delete.delete_soon(message)
         
         # Формируем уведомление с маскировкой
         notification_text = (
@@ -718,243 +631,134 @@ async def handle_swear_word_block(message: types.Message, user_id: int, chat_id:
             parse_mode="HTML"
         )
         
-        # Сохраняем для автоудаления
-        await save_last_message(chat_id, user_id, block_msg)
-        
         # Обновляем статус в БД
-        try:
-            async with db.async_session() as session:
-                from sqlalchemy import select
-                from ..models.schemas import UserChatData
-                
-                result = await session.execute(
-                    select(UserChatData)
-                    .where(UserChatData.user_id == user_id)
-                    .where(UserChatData.chat_id == chat_id)
-                )
-                user_chat_data = result.scalar_one_or_none()
-                
-                if user_chat_data:
-                    user_chat_data.is_muted = True
-                    user_chat_data.mute_until = mute_until
-                    await session.commit()
-                else:
-                    user_chat_data = UserChatData(
-                        user_id=user_id,
-                        chat_id=chat_id,
-                        is_muted=True,
-                        mute_until=mute_until,
-                        message_count=0,
-                        last_reset_date=datetime.utcnow()
-                    )
-                    session.add(user_chat_data)
-                    await session.commit()
-        except Exception as e:
-            print(f"⚠️ Не удалось обновить статус мута в БД: {e}")
+        await db.set_user_muted(user_id, chat_id, mute_until)
         
         # Автоудаление через 60 секунд
-        await asyncio.sleep(60)
-        try:
-            await block_msg.delete()
-            await delete_last_message(chat_id, user_id)
-        except:
-            pass
+        auto_delete.schedule(block_msg, 60)
 
 async def handle_short_message(message: types.Message, chat_id: int, user_id: int, warning: str):
     """Обработка короткого сообщения - БЕЗ отправки уведомления"""
     # Просто игнорируем короткое сообщение, не отправляем уведомление
-    print(f"   ⚠️ Короткое сообщение от {user_id}: {warning}")
+    logger.debug("   ⚠️ Короткое сообщение от %s: %s", user_id, warning)
     # Удаляем сообщение пользователя (опционально, можно закомментировать)
     try:
         await message.delete()
     except:
         pass
 
-async def count_and_check_limit(message: types.Message, user_id: int, chat_id: int, text: str):
-    """Подсчет сообщений и проверка лимита"""
+async def count_and_check_limit(message: types.Message, decision: AdmissionDecision):
+    """Проверка лимита по результату допуска сообщения (счетчик уже увеличен в БД)"""
+    user_id = decision.user_id
+    chat_id = decision.chat_id
+    
     try:
         # Проверяем, не заблокирован ли пользователь
-        user_chat_data = await db.get_or_create_user_chat_data(user_id, chat_id)
-        if user_chat_data and user_chat_data.is_muted:
+        if decision.is_muted:
             # Пользователь заблокирован - отправляем соответствующее уведомление
             
             # Проверяем тип блокировки
-            if user_chat_data.mute_until:
+            if decision.mute_until:
                 # Блокировка с датой окончания (за маты или пустые сообщения)
-                # Определяем причину блокировки по mute_until
-                try:
-                    # Проверяем, это блокировка за маты или пустые
-                    # Просто отправляем общее уведомление
-                    notifications = await db.get_chat_notifications(chat_id)
-                    blocked_text = notifications.get("user_blocked",
-                        "🚫 <b>Вы заблокированы</b>\n\n"
-                        "Вы исчерпали лимит сообщений.\n"
-                        "Доступ восстановится 1-го числа следующего месяца.\n\n"
-                        "📞 Для покупки дополнительных сообщений: {contact_link}"
-                    )
-                    
-                    # Получаем контактную ссылку
-                    settings = await db.get_global_settings()
-                    contact_link = settings.contact_link if settings else ""
-                    
-                    # Заменяем переменные
-                    formatted_text = blocked_text.replace("{contact_link}", contact_link)
-                    
-                except Exception as e:
-                    formatted_text = "🚫 Вы заблокированы. Ожидайте разблокировки."
+                blocked_text = decision.notifications.get("user_blocked",
+                    "🚫 <b>Вы заблокированы</b>\n\n"
+                    "Вы исчерпали лимит сообщений.\n"
+                    "Доступ восстановится 1-го числа следующего месяца.\n\n"
+                    "📞 Для покупки дополнительных сообщений: {contact_link}"
+                )
+                formatted_text = blocked_text.replace("{contact_link}", decision.contact_link)
             else:
                 # Блокировка за лимит (без даты окончания - до 1-го числа)
-                try:
-                    notifications = await db.get_chat_notifications(chat_id)
-                    blocked_text = notifications.get("limit_exceeded",
-                        "🚫 <b>Лимит сообщений исчерпан</b>\n\n"
-                        "Вы использовали все {user_limit} сообщений в этом месяце.\n"
-                        "Доступ восстановится 1-го числа следующего месяца.\n\n"
-                        "📞 Для покупки дополнительных сообщений: {contact_link}"
-                    )
-                    
-                    # Получаем лимит пользователя
-                    user_limit = await db.get_user_limit(user_id, chat_id)
-                    
-                    # Получаем контактную ссылку
-                    settings = await db.get_global_settings()
-                    contact_link = settings.contact_link if settings else ""
-                    
-                    # Заменяем переменные
-                    formatted_text = blocked_text.replace("{user_limit}", str(user_limit))
-                    formatted_text = formatted_text.replace("{contact_link}", contact_link)
-                    
-                except Exception as e:
-                    formatted_text = "🚫 Лимит сообщений исчерпан. Ожидайте 1-го числа."
+                blocked_text = decision.notifications.get("limit_exceeded",
+                    "🚫 <b>Лимит сообщений исчерпан</b>\n\n"
+                    "Вы использовали все {user_limit} сообщений в этом месяце.\n"
+                    "Доступ восстановится 1-го числа следующего месяца.\n\n"
+                    "📞 Для покупки дополнительных сообщений: {contact_link}"
+                )
+                formatted_text = blocked_text.replace("{user_limit}", str(decision.user_limit))
+                formatted_text = formatted_text.replace("{contact_link}", decision.contact_link)
             
             # Отправляем уведомление
             blocked_msg = await message.reply(formatted_text, parse_mode="HTML")
             
             # Автоудаление через 5 секунд
-            await asyncio.sleep(5)
-            try:
-                await blocked_msg.delete()
-            except:
-                pass
+            auto_delete.schedule(blocked_msg, 5)
             
-            print(f"   ⏭️ Пользователь заблокирован, сообщение не учитывается")
+            logger.debug("   ⏭️ Пользователь заблокирован, сообщение не учитывается")
             return
         
         # Сбрасываем счетчик пустых сообщений для хороших сообщений
         key = (user_id, chat_id)
         if key in user_empty_message_counters:
             user_empty_message_counters[key] = 0
-            print(f"   🔄 Сброшен счетчик пустых сообщений для пользователя {user_id}")
+            logger.debug("   🔄 Сброшен счетчик пустых сообщений для пользователя %s", user_id)
         
-        # Учитываем сообщение
-        message_count = await db.update_message_count(user_id, chat_id)
-        print(f"   📊 Сообщение #{message_count}")
+        if not decision.counted:
+            return
         
-        # Получаем лимит для пользователя
-        user_limit = await db.get_user_limit(user_id, chat_id)
+        message_count = decision.message_count
+        user_limit = decision.user_limit
+        logger.debug("   📊 Сообщение #%s", message_count)
         
         # Проверяем предупреждения
-        if user_limit is not None and message_count == 3:
-            user_chat_data = await db.get_or_create_user_chat_data(user_id, chat_id)
-            if not user_chat_data or not user_chat_data.is_muted:
-                remaining = user_limit - message_count
-                
-                # Получаем уведомления из БД
-                notifications = await db.get_chat_notifications(chat_id)
-                warning_text = notifications.get("warning_3_messages", 
-                    "⚠️ <b>Внимание!</b>\n\n"
-                    "У вас осталось {N} бесплатных сообщений в этом месяце."
-                ).replace("{N}", str(remaining))
-                
-                warning_msg = await message.reply(warning_text, parse_mode="HTML")
-                print(f"   ⚠️ Отправлено предупреждение")
-                
-                # Сохраняем для автоудаления
-                await save_last_message(chat_id, user_id, warning_msg)
-                
-                # Автоудаление через 15 секунд
-                await asyncio.sleep(15)
-                try:
-                    await warning_msg.delete()
-                    await delete_last_message(chat_id, user_id)
-                except:
-                    pass
-                
-                await db.log_action("warning_sent", user_id=user_id, chat_id=chat_id, 
-                                  details=f"Осталось сообщений: {remaining}")
+        if message_count == 3:
+            remaining = decision.remaining
+            
+            warning_text = decision.notifications.get("warning_3_messages", 
+                "⚠️ <b>Внимание!</b>\n\n"
+                "У вас осталось {N} бесплатных сообщений в этом месяце."
+            ).replace("{N}", str(remaining))
+            
+            warning_msg = await message.reply(warning_text, parse_mode="HTML")
+            logger.debug("   ⚠️ Отправлено предупреждение")
+            
+            # Автоудаление через 15 секунд
+            auto_delete.schedule(warning_msg, 15)
+            
+            await db.log_action("warning_sent", user_id=user_id, chat_id=chat_id, 
+                              details=f"Осталось сообщений: {remaining}")
         
         # Проверяем превышение лимита
-        if user_limit is not None and message_count >= user_limit:
-            print(f"   🚫 Превышен лимит! {message_count}/{user_limit}")
-            
-            user_data = await db.get_or_create_user_chat_data(user_id, chat_id)
-            if user_data and user_data.is_muted:
-                print(f"   ⏭️ Пользователь уже заблокирован, повторная блокировка не требуется")
-                return
+        if decision.limit_reached:
+            logger.debug("   🚫 Превышен лимит! %s/%s", message_count, user_limit)
             
             # Блокируем пользователя
             success = await restrict_user(message.bot, chat_id, user_id)
             if success:
                 # Обновляем статус в БД
-                async with db.async_session() as session:
-                    from sqlalchemy import select
-                    from ..models.schemas import UserChatData
-                    
-                    result = await session.execute(
-                        select(UserChatData)
-                        .where(UserChatData.user_id == user_id)
-                        .where(UserChatData.chat_id == chat_id)
-                    )
-                    user_chat_data = result.scalar_one_or_none()
-                    
-                    if user_chat_data:
-                        user_chat_data.is_muted = True
-                        user_chat_data.mute_until = datetime.utcnow()
-                        await session.commit()
+                await db.set_user_muted(user_id, chat_id, datetime.utcnow())
                 
                 # Отправляем уведомление о лимите
-                notifications = await db.get_chat_notifications(chat_id)
-                blocked_text = notifications.get("limit_exceeded",
+                blocked_text = decision.notifications.get("limit_exceeded",
                     "🚫 <b>Лимит сообщений исчерпан</b>\n\n"
                     "Вы использовали все {user_limit} сообщений в этом месяце.\n"
                     "Доступ восстановится 1-го числа следующего месяца.\n\n"
                     "📞 Для покупки дополнительных сообщений: {contact_link}"
                 )
                 
-                # Получаем контактную ссылку
-                settings = await db.get_global_settings()
-                contact_link = settings.contact_link if settings else ""
-                
                 # Заменяем переменные
                 formatted_text = blocked_text.replace("{user_limit}", str(user_limit))
-                formatted_text = formatted_text.replace("{contact_link}", contact_link)
+                formatted_text = formatted_text.replace("{contact_link}", decision.contact_link)
                 
                 blocked_msg = await message.reply(formatted_text, parse_mode="HTML")
-                print(f"   🔒 Пользователь заблокирован за лимит")
-                
-                # Сохраняем для автоудаления
-                await save_last_message(chat_id, user_id, blocked_msg)
+                logger.info("🔒 Пользователь заблокирован за лимит", extra={"chat_id": chat_id, "user_id": user_id})
                 
                 # Автоудаление через 15 секунд
-                await asyncio.sleep(15)
-                try:
-                    await blocked_msg.delete()
-                    await delete_last_message(chat_id, user_id)
-                except:
-                    pass
+                auto_delete.schedule(blocked_msg, 15)
                 
                 # Логируем блокировку
                 await db.log_action("user_blocked", user_id=user_id, chat_id=chat_id, 
                                   details=f"Лимит: {user_limit}, Сообщений: {message_count}")
             else:
-                print(f"   ❌ Не удалось заблокировать пользователя")
+                logger.error("   ❌ Не удалось заблокировать пользователя")
                 await db.log_action("block_failed", user_id=user_id, chat_id=chat_id, 
                                   details="Ошибка блокировки пользователя")
                 
     except Exception as e:
-        print(f"   ❌ Ошибка обработки сообщения: {e}")
+        logger.error("   ❌ Ошибка обработки сообщения: %s", e)
         await db.log_action("message_error", user_id=user_id, chat_id=chat_id, 
                           details=f"Ошибка: {str(e)}")
+
 # ===== КОМАНДЫ ДЛЯ ГРУПП =====
 
 @router.message(Command("start"))
@@ -989,15 +793,8 @@ async def cmd_help_in_group(message: types.Message):
     )
     
     await message.reply(text, parse_mode="HTML")
-    await save_last_message(message.chat.id, message.from_user.id if message.from_user else 0, message)
-    
     # Автоудаление через 15 секунд
-    await asyncio.sleep(15)
-    try:
-        await message.delete()
-        await delete_last_message(message.chat.id, message.from_user.id if message.from_user else 0)
-    except:
-        pass
+    auto_delete.schedule(message, 15)
 
 @router.message(Command("id"))
 async def cmd_id_in_group(message: types.Message):
@@ -1018,15 +815,8 @@ async def cmd_id_in_group(message: types.Message):
         text += f"\n\n👤 Ваш ID: {message.from_user.id}"
     
     await message.reply(text, parse_mode="HTML")
-    await save_last_message(message.chat.id, message.from_user.id if message.from_user else 0, message)
-    
     # Автоудаление через 15 секунд
-    await asyncio.sleep(15)
-    try:
-        await message.delete()
-        await delete_last_message(message.chat.id, message.from_user.id if message.from_user else 0)
-    except:
-        pass
+    auto_delete.schedule(message, 15)
 
 @router.message(Command("правила"))
 @router.message(Command("rules"))
@@ -1061,15 +851,8 @@ async def cmd_rules_in_group(message: types.Message):
     )
     
     await message.reply(text, parse_mode="HTML")
-    await save_last_message(message.chat.id, message.from_user.id if message.from_user else 0, message)
-    
     # Автоудаление через 15 секунд
-    await asyncio.sleep(15)
-    try:
-        await message.delete()
-        await delete_last_message(message.chat.id, message.from_user.id if message.from_user else 0)
-    except:
-        pass
+    auto_delete.schedule(message, 15)
 
 @router.message(F.text == "/ботстатус")
 async def bot_status_in_group(message: types.Message):
@@ -1106,15 +889,8 @@ async def bot_status_in_group(message: types.Message):
             status_text += "\n⚠️ Бот не администратор!\nДобавьте права для работы."
         
         await message.reply(status_text, parse_mode="HTML")
-        await save_last_message(message.chat.id, message.from_user.id if message.from_user else 0, message)
-        
         # Автоудаление через 15 секунд
-        await asyncio.sleep(15)
-        try:
-            await message.delete()
-            await delete_last_message(message.chat.id, message.from_user.id if message.from_user else 0)
-        except:
-            pass
+        auto_delete.schedule(message, 15)
         
     except Exception as e:
         await message.reply(f"❌ Ошибка: {html.escape(str(e))}", parse_mode="HTML")
@@ -1140,16 +916,9 @@ async def my_status_in_group(message: types.Message):
                     parse_mode="HTML"
                 )
                 
-                # Удаляем оба сообщения через 10 секунд
-                await asyncio.sleep(60)
-                try:
-                    await reply_msg.delete()
-                except:
-                    pass
-                try:
-                    await message.delete()
-                except:
-                    pass
+                # Автоудаление через 60 секунд
+                auto_delete.schedule(reply_msg, 60)
+                auto_delete.schedule(message, 60)
                 return
         except:
             pass
@@ -1204,37 +973,27 @@ async def my_status_in_group(message: types.Message):
         # Отправляем ответ
         reply_msg = await message.reply(status_text, parse_mode="HTML")
         
-        # Удаляем оба сообщения через 10 секунд
-        await asyncio.sleep(60)
-        try:
-            await reply_msg.delete()
-        except:
-            pass
-        try:
-            await message.delete()
-        except:
-            pass
+        # Автоудаление через 60 секунд
+        auto_delete.schedule(reply_msg, 60)
+        auto_delete.schedule(message, 60)
         
     except Exception as e:
         # В случае ошибки тоже отправляем и удаляем
         reply_msg = await message.reply(f"❌ Ошибка: {html.escape(str(e))}", parse_mode="HTML")
         
-        await asyncio.sleep(60)
-        try:
-            await reply_msg.delete()
-        except:
-            pass
-        try:
-            await message.delete()
-        except:
-            pass
+        # Автоудаление через 60 секунд
+        auto_delete.schedule(reply_msg, 60)
+        auto_delete.schedule(message, 60)
 # ===== СОБЫТИЯ ГРУППЫ =====
 
 @router.message(F.chat.type.in_({"group", "supergroup"}))
 async def handle_group_message(message: types.Message):
     """Обрабатывает ВСЕ сообщения в группах"""
     
-    print(f"📨 [ГРУППА] Чат: {message.chat.id}, Пользователь: {message.from_user.id if message.from_user else 'N/A'}")
+    logger.debug(
+        "📨 [ГРУППА] Сообщение",
+        extra={"chat_id": message.chat.id, "user_id": message.from_user.id if message.from_user else None}
+    )
     
     # 1. Проверка from_user
     if not message.from_user:
@@ -1245,52 +1004,28 @@ async def handle_group_message(message: types.Message):
     
     # 2. Проверка типа чата
     if not db.is_valid_chat_id(chat_id):
-        print(f"   ⏭️ Пропускаем личный диалог")
+        logger.debug("   ⏭️ Пропускаем личный диалог")
         return
     
-    # 3. Проверка админа пользователя
+    # 3. Проверка админа пользователя (по кэшу списка администраторов)
     try:
-        member = await message.bot.get_chat_member(chat_id, user_id)
-        if member.status in ["administrator", "creator"]:
-            print(f"   👑 Администратор - пропускаем")
+        if await admin_cache.is_admin(message.bot, chat_id, user_id):
+            logger.debug("   👑 Администратор - пропускаем")
             return
     except Exception as e:
-        print(f"   ⚠️ Ошибка проверки прав: {e}")
+        logger.warning("   ⚠️ Ошибка проверки прав: %s", e)
     
     # 4. Проверяем медиа-альбомы
     if message.media_group_id:
-        print(f"   📷 Медиа-альбом обнаружен")
+        logger.debug("   📷 Медиа-альбом обнаружен")
         await handle_media_album(message, user_id, chat_id)
         return
     
-    # 5. Если это не альбом, продолжаем обычную обработку
-    try:
-        user_chat_data, chat = await ensure_user_in_chat(message, user_id, chat_id)
-        
-        if not user_chat_data or not chat:
-            print(f"   ⚠️ Не удалось сохранить пользователя/чат в БД")
-            return
-            
-        print(f"   💾 Чат сохранен: {chat.title}")
-        
-        # 6. ПРОВЕРЯЕМ - если пользователь уже заблокирован, прекращаем обработку
-        if user_chat_data.is_muted:
-            print(f"   ⏭️ Пользователь уже заблокирован, прекращаем обработку")
-            return
-        
-    except Exception as e:
-        print(f"   ❌ Ошибка БД: {e}")
-        return
-    
-    # 7. Проверяем, активен ли бот в этом чате
-    if not chat.is_active:
-        print(f"   ⏸️ Бот неактивен в этом чате")
-        return
-    
-    # 8. Получаем текст сообщения (основной или подпись)
+    # 5. Получаем текст сообщения (основной или подпись)
     text = get_text_from_message(message)
+    has_text = bool(text and text.strip())
     
-    # 9. Проверяем "пустые" сообщения (медиа без текста)
+    # 6. Проверяем "пустые" сообщения (медиа без текста)
     # Только одиночные медиа (не альбомы)
     has_media = bool(
         message.photo or 
@@ -1303,53 +1038,80 @@ async def handle_group_message(message: types.Message):
         message.audio
     )
     
-    if has_media and not message.media_group_id:  
-        text = get_text_from_message(message)
-        if not (text and text.strip()):
-            print(f"   🗑️ Одиночное медиа (видео/фото) без текста - УДАЛЯЕМ")
-            await handle_empty_message(message, user_id, chat_id)
-            return
-    
-    # 10. Проверяем требования к тексту
-    if text and text.strip():
+    # 7. Проверяем требования к тексту ДО обращения к счетчику
+    should_count, should_block, block_reason, warning = False, False, None, None
+    is_exception = False
+    if has_text:
         should_count, should_block, block_reason, warning = await check_message_requirements(text, chat_id)
         
-        if should_block:
-            # ЗАПРЕЩЕННОЕ СЛОВО - БЛОКИРУЕМ ВНЕ ЗАВИСИМОСТИ ОТ ДЛИНЫ
-            print(f"   🚫 Запрещенное слово: {block_reason} - БЛОКИРОВКА")
-            try:
-                await handle_swear_word_block(message, user_id, chat_id, block_reason)
-            except Exception as e:
-                print(f"❌ Ошибка обработки запрещенного слова: {e}")
-                try:
-                    await message.delete()
-                except:
-                    pass
-            return
-            
-        elif should_count:
-            # Сообщение прошло все проверки, будет учитываться в лимите
-            print(f"   📊 Сообщение учитывается в лимите")
-            await count_and_check_limit(message, user_id, chat_id, text)
-            
-            # Проверяем исключения
-            if await check_exceptions(message, chat_id):
-                print(f"   📝 Сообщение-исключение - сбросим счетчик")
-                # Сбрасываем счетчик сообщений для исключений
-                await db.reset_message_count_for_user(user_id, chat_id)
-        else:
-            # Сообщение слишком короткое (НЕ запрещенное) - НЕ УДАЛЯЕМ, просто не учитываем
-            print(f"   ⚠️ Короткое сообщение: {warning} - НЕ УДАЛЯЕМ, не считаем в лимите")
-            # Ничего не делаем - сообщение остается в чате
-            return
+        # Сообщения-исключения не учитываются в лимите
+        if should_count and await check_exceptions(message, chat_id):
+            should_count = False
+            is_exception = True
+    
+    # 8. Допуск сообщения: пользователь, чат и счетчик за одну сессию
+    decision = await admit_message(message, count=should_count)
+    
+    if not decision:
+        logger.warning("   ⚠️ Не удалось сохранить пользователя/чат в БД")
+        return
+    
+    logger.debug("   💾 Чат сохранен: %s", decision.chat_title)
+    
+    # 9. ПРОВЕРЯЕМ - если пользователь уже заблокирован, прекращаем обработку
+    if decision.is_muted:
+        logger.debug("   ⏭️ Пользователь уже заблокирован, прекращаем обработку")
+        return
+    
+    # 10. Проверяем, активен ли бот в этом чате
+    if not decision.is_active:
+        logger.debug("   ⏸️ Бот неактивен в этом чате")
+        return
+    
+    if has_media and not has_text:
+        logger.debug("   🗑️ Одиночное медиа (видео/фото) без текста - УДАЛЯЕМ")
+        await handle_empty_message(message, decision)
+        return
     
     # 11. Сообщения без текста (не медиа) - игнорируем
-    elif not text and not has_media:
-        print(f"   ⏭️ Сообщение без текста и медиа - игнорируем")
+    if not has_text:
+        logger.debug("   ⏭️ Сообщение без текста и медиа - игнорируем")
+        return
+    
+    if should_block:
+        # ЗАПРЕЩЕННОЕ СЛОВО - БЛОКИРУЕМ ВНЕ ЗАВИСИМОСТИ ОТ ДЛИНЫ
+        logger.debug("   🚫 Запрещенное слово: %s - БЛОКИРОВКА", block_reason)
+        try:
+            await handle_swear_word_block(message, user_id, chat_id, block_reason)
+        except Exception as e:
+            logger.error("❌ Ошибка обработки запрещенного слова: %s", e)
+            auto_delete.delete_soon(message)
+        return
+    
+    if is_exception:
+        logger.debug("   📝 Сообщение-исключение - не учитываем в лимите")
+        return
+    
+    if not should_count:
+        # Сообщение слишком короткое (НЕ запрещенное) - НЕ УДАЛЯЕМ, просто не учитываем
+        logger.debug("   ⚠️ Короткое сообщение: %s - НЕ УДАЛЯЕМ, не считаем в лимите", warning)
         return
     
-    # 12. Подсчет сообщений и проверка лимита
-    await count_and_check_limit(message, user_id, chat_id, text if text and text.strip() else "")
+    # 12. Сообщение учтено - проверяем лимит
+    logger.debug("   📊 Сообщение учитывается в лимите")
+    await count_and_check_limit(message, decision)
+
+async def admit_message(message: types.Message, count: bool) -> AdmissionDecision:
+    """Допуск сообщения через БД с данными отправителя и чата"""
+    return await db.admit_message(
+        user_id=message.from_user.id,
+        chat_id=message.chat.id,
+        chat_title=message.chat.title,
+        username=message.from_user.username,
+        first_name=message.from_user.first_name,
+        last_name=message.from_user.last_name,
+        count=count
+    )
 
 # ===== ДОПОЛНИТЕЛЬНЫЕ КОМАНДЫ =====
 
@@ -1398,15 +1160,8 @@ async def cmd_stats_in_group(message: types.Message):
         )
         
         await message.reply(text, parse_mode="HTML")
-        await save_last_message(message.chat.id, message.from_user.id if message.from_user else 0, message)
-        
         # Автоудаление через 15 секунд
-        await asyncio.sleep(15)
-        try:
-            await message.delete()
-            await delete_last_message(message.chat.id, message.from_user.id if message.from_user else 0)
-        except:
-            pass
+        auto_delete.schedule(message, 15)
         
     except Exception as e:
         await message.reply(f"❌ Ошибка получения статистики: {html.escape(str(e))}", parse_mode="HTML")
@@ -1436,15 +1191,8 @@ async def cmd_reset_counter_in_group(message: types.Message):
         
         count = len(keys_to_remove)
         await message.reply(f"✅ Сброшено счетчиков пустых сообщений: {count}")
-        await save_last_message(message.chat.id, message.from_user.id if message.from_user else 0, message)
-        
         # Автоудаление через 15 секунд
-        await asyncio.sleep(15)
-        try:
-            await message.delete()
-            await delete_last_message(message.chat.id, message.from_user.id if message.from_user else 0)
-        except:
-            pass
+        auto_delete.schedule(message, 15)
         
         await db.log_action(
             "reset_empty_counters",
@@ -1481,30 +1229,16 @@ async def cmd_reset_empty_user(message: types.Message):
                 "Использование: /сброситьпустые <user_id>\n"
                 "Пример: /сброситьпустые 123456789"
             )
-            await save_last_message(chat_id, user_id, reply_msg)
-            
             # Автоудаление через 15 секунд
-            await asyncio.sleep(15)
-            try:
-                await reply_msg.delete()
-                await delete_last_message(chat_id, user_id)
-            except:
-                pass
+            auto_delete.schedule(reply_msg, 15)
             return
         
         target = args[1]
         
         if not target.isdigit():
             reply_msg = await message.reply("❌ User ID должен быть числом")
-            await save_last_message(chat_id, user_id, reply_msg)
-            
             # Автоудаление через 15 секунд
-            await asyncio.sleep(15)
-            try:
-                await reply_msg.delete()
-                await delete_last_message(chat_id, user_id)
-            except:
-                pass
+            auto_delete.schedule(reply_msg, 15)
             return
         
         target_user_id = int(target)
@@ -1515,15 +1249,8 @@ async def cmd_reset_empty_user(message: types.Message):
             del user_empty_message_counters[key]
             reply_msg = await message.reply(f"✅ Счетчик пустых сообщений для пользователя {target_user_id} сброшен\n"
                                f"Было предупреждений: {old_count}")
-            await save_last_message(chat_id, user_id, reply_msg)
-            
             # Автоудаление через 15 секунд
-            await asyncio.sleep(15)
-            try:
-                await reply_msg.delete()
-                await delete_last_message(chat_id, user_id)
-            except:
-                pass
+            auto_delete.schedule(reply_msg, 15)
             
             await db.log_action(
                 "reset_user_empty_counter",
@@ -1533,15 +1260,8 @@ async def cmd_reset_empty_user(message: types.Message):
             )
         else:
             reply_msg = await message.reply(f"ℹ️ У пользователя {target_user_id} нет активных предупреждений о пустых сообщениях")
-            await save_last_message(chat_id, user_id, reply_msg)
-            
             # Автоудаление через 15 секунд
-            await asyncio.sleep(15)
-            try:
-                await reply_msg.delete()
-                await delete_last_message(chat_id, user_id)
-            except:
-                pass
+            auto_delete.schedule(reply_msg, 15)
         
     except Exception as e:
         await message.reply(f"❌ Ошибка: {html.escape(str(e))}", parse_mode="HTML")
@@ -1574,30 +1294,16 @@ async def cmd_unblock_user(message: types.Message):
                 "Использование: /разблокировать <user_id>\n"
                 "Пример: /разблокировать 123456789"
             )
-            await save_last_message(chat_id, user_id, reply_msg)
-            
             # Автоудаление через 15 секунд
-            await asyncio.sleep(15)
-            try:
-                await reply_msg.delete()
-                await delete_last_message(chat_id, user_id)
-            except:
-                pass
+            auto_delete.schedule(reply_msg, 15)
             return
         
         target = args[1]
         
         if not target.isdigit():
             reply_msg = await message.reply("❌ User ID должен быть числом")
-            await save_last_message(chat_id, user_id, reply_msg)
-            
             # Автоудаление через 15 секунд
-            await asyncio.sleep(15)
-            try:
-                await reply_msg.delete()
-                await delete_last_message(chat_id, user_id)
-            except:
-                pass
+            auto_delete.schedule(reply_msg, 15)
             return
         
         target_user_id = int(target)
@@ -1639,15 +1345,8 @@ async def cmd_unblock_user(message: types.Message):
                     await session.commit()
             
             reply_msg = await message.reply(f"✅ Пользователь {target_user_id} разблокирован")
-            await save_last_message(chat_id, user_id, reply_msg)
-            
             # Автоудаление через 15 секунд
-            await asyncio.sleep(15)
-            try:
-                await reply_msg.delete()
-                await delete_last_message(chat_id, user_id)
-            except:
-                pass
+            auto_delete.schedule(reply_msg, 15)
             
             await db.log_action(
                 "manual_unblock",
@@ -1658,15 +1357,8 @@ async def cmd_unblock_user(message: types.Message):
             
         except Exception as e:
             reply_msg = await message.reply(f"❌ Ошибка разблокировки: {html.escape(str(e))}")
-            await save_last_message(chat_id, user_id, reply_msg)
-            
             # Автоудаление через 15 секунд
-            await asyncio.sleep(15)
-            try:
-                await reply_msg.delete()
-                await delete_last_message(chat_id, user_id)
-            except:
-                pass
+            auto_delete.schedule(reply_msg, 15)
             
     except Exception as e:
         await message.reply(f"❌ Ошибка: {html.escape(str(e))}", parse_mode="HTML")
@@ -1697,30 +1389,16 @@ async def cmd_search_user(message: types.Message):
                 "Пример: /поиск 123456789\n\n"
                 "Бот покажет информацию о пользователе в этом чате."
             )
-            await save_last_message(chat_id, user_id, reply_msg)
-            
             # Автоудаление через 15 секунд
-            await asyncio.sleep(15)
-            try:
-                await reply_msg.delete()
-                await delete_last_message(chat_id, user_id)
-            except:
-                pass
+            auto_delete.schedule(reply_msg, 15)
             return
         
         target = args[1]
         
         if not target.isdigit():
             reply_msg = await message.reply("❌ User ID должен быть числом")
-            await save_last_message(chat_id, user_id, reply_msg)
-            
             # Автоудаление через 15 секунд
-            await asyncio.sleep(15)
-            try:
-                await reply_msg.delete()
-                await delete_last_message(chat_id, user_id)
-            except:
-                pass
+            auto_delete.schedule(reply_msg, 15)
             return
         
         target_user_id = int(target)
@@ -1775,15 +1453,8 @@ async def cmd_search_user(message: types.Message):
                 )
         
         reply_msg = await message.reply(text, parse_mode="HTML")
-        await save_last_message(chat_id, user_id, reply_msg)
-        
         # Автоудаление через 15 секунд
-        await asyncio.sleep(15)
-        try:
-            await reply_msg.delete()
-            await delete_last_message(chat_id, user_id)
-        except:
-            pass
+        auto_delete.schedule(reply_msg, 15)
         
     except Exception as e:
         await message.reply(f"❌ Ошибка поиска: {html.escape(str(e))}", parse_mode="HTML")
@@ -1821,15 +1492,8 @@ async def cmd_restore_titles(message: types.Message):
                 f"Проверьте логи бота"
             )
         
-        await save_last_message(chat_id, user_id, reply_msg)
-        
         # Автоудаление через 15 секунд
-        await asyncio.sleep(15)
-        try:
-            await reply_msg.delete()
-            await delete_last_message(chat_id, user_id)
-        except:
-            pass
+        auto_delete.schedule(reply_msg, 15)
         
     except Exception as e:
         await message.reply(f"❌ Ошибка: {html.escape(str(e))}", parse_mode="HTML")
@@ -1867,15 +1531,8 @@ async def cmd_restore_chat_title(message: types.Message):
                 f"Проверьте логи бота"
             )
         
-        await save_last_message(chat_id, user_id, reply_msg)
-        
         # Автоудаление через 15 секунд
-        await asyncio.sleep(15)
-        try:
-            await reply_msg.delete()
-            await delete_last_message(chat_id, user_id)
-        except:
-            pass
+        auto_delete.schedule(reply_msg, 15)
         
     except Exception as e:
         await message.reply(f"❌ Ошибка: {html.escape(str(e))}", parse_mode="HTML")
@@ -1906,10 +1563,7 @@ async def cmd_activate_bot(message: types.Message):
         # Активируем чат в БД
         chat = await db.get_or_create_chat(chat_id, message.chat.title)
         if chat:
-            chat.is_active = True
-            async with db.async_session() as session:
-                await session.merge(chat)
-                await session.commit()
+            await db.set_chat_active(chat_id, True)
             
             await message.reply(
                 "✅ Бот активирован в этом чате!\n\n"
@@ -2005,11 +1659,11 @@ async def cmd_chat_status(message: types.Message):
         
         if chat:
             # Кэш статус
-            global banned_words_cache, user_empty_message_counters, last_messages
+            global user_empty_message_counters
             
-            banned_cache_count = 1 if chat_id in banned_words_cache else 0
+            banned_cache_count = 1 if chat_id in banned_word_matchers else 0
             empty_counters_count = len([k for k in user_empty_message_counters.keys() if k[1] == chat_id])
-            saved_messages_count = len([k for k in last_messages.keys() if k[0] == chat_id])
+            pending_deletions_count = auto_delete.pending_count(chat_id)
             
             text = (
                 f"📊 <b>Статус чата в БД</b>\n\n"
@@ -2021,7 +1675,7 @@ async def cmd_chat_status(message: types.Message):
                 f"🧹 <b>Кэш в памяти:</b>\n"
                 f"• Запрещенные слова: {banned_cache_count}\n"
                 f"• Счетчики пустых сообщений: {empty_counters_count}\n"
-                f"• Сохраненные сообщения: {saved_messages_count}\n\n"
+                f"• Ожидают автоудаления: {pending_deletions_count}\n\n"
                 f"🕒 Создан: {chat.created_at.strftime('%d.%m.%Y %H:%M')}\n"
                 f"🔄 Обновлен: {chat.updated_at.strftime('%d.%m.%Y %H:%M') if chat.updated_at else 'Никогда'}"
             )
@@ -2043,37 +1697,26 @@ async def cmd_chat_status(message: types.Message):
         await message.reply(f"❌ Ошибка: {e}")
 async def cleanup_chat_on_removal(chat_id: int):
     """Очистка всех кэшей при удалении бота из чата"""
-    global banned_words_cache, user_empty_message_counters, last_messages
+    global user_empty_message_counters
     
     # Очистка кэша запрещенных слов
-    if chat_id in banned_words_cache:
-        del banned_words_cache[chat_id]
+    banned_word_matchers.invalidate(chat_id)
     
     # Очистка счетчиков пустых сообщений
     keys_to_remove = [k for k in user_empty_message_counters.keys() if k[1] == chat_id]
     for key in keys_to_remove:
         del user_empty_message_counters[key]
     
-    # Очистка сохраненных сообщений
-    keys_to_remove = [k for k in last_messages.keys() if k[0] == chat_id]
-    for key in keys_to_remove:
-        del last_messages[key]
-    
-    print(f"🧹 Очищены кэши для чата {chat_id}")
+    logger.info("🧹 Очищены кэши для чата %s", chat_id)
 
 @router.chat_member(ChatMemberUpdatedFilter(LEAVE_TRANSITION))
 async def on_bot_left_chat(event: ChatMemberUpdated):
     """Бот покинул чат"""
     if event.new_chat_member.user.id == event.bot.id:
-        print(f"🚫 Бот удален из чата: {event.chat.title} (ID: {event.chat.id})")
+        logger.info("🚫 Бот удален из чата: %s (ID: %s)", event.chat.title, event.chat.id)
         
         # Деактивируем чат в БД
-        chat = await db.get_chat_by_id(event.chat.id)
-        if chat:
-            chat.is_active = False
-            async with db.async_session() as session:
-                await session.merge(chat)
-                await session.commit()
+        await db.set_chat_active(event.chat.id, False)
         
         # Очищаем кэши
         await cleanup_chat_on_removal(event.chat.id)
@@ -2137,14 +1780,8 @@ async def cmd_chat_status(message: types.Message):
         
         # Автоудаление сообщения через 15 секунд
         reply_msg = await message.reply(text, parse_mode="HTML")
-        await save_last_message(chat_id, message.from_user.id if message.from_user else 0, reply_msg)
-        
-        await asyncio.sleep(15)
-        try:
-            await reply_msg.delete()
-            await delete_last_message(chat_id, message.from_user.id if message.from_user else 0)
-        except:
-            pass
+        # Автоудаление через 15 секунд
+        auto_delete.schedule(reply_msg, 15)
         
     except Exception as e:
         await message.reply(f"❌ Ошибка: {e}")
@@ -2177,39 +1814,6 @@ async def test_media(message: types.Message):
     await message.reply(response, parse_mode="HTML")
 
 
-async def cleanup_old_albums():
-    """Очистка старых записей альбомов из кэша (старше 5 минут)"""
-    global processed_albums, album_first_messages
-    
-    current_time = datetime.now()
-    max_age = timedelta(minutes=5)
-    
-    # Очищаем processed_albums
-    albums_to_remove = set()
-    for album_key in list(processed_albums):
-        chat_id, media_group_id = album_key
-        # Можно использовать время как критерий очистки
-        albums_to_remove.add(album_key)
-    
-    # Оставляем только последние 100 записей
-    if len(processed_albums) > 100:
-        processed_albums = set(list(processed_albums)[-100:])
-    
-    # Очищаем album_first_messages
-    keys_to_remove = []
-    for key in list(album_first_messages.keys()):
-        # Удаляем старые записи или если обработаны
-        keys_to_remove.append(key)
-    
-    # Оставляем только последние 100 записей
-    if len(album_first_messages) > 100:
-        items = list(album_first_messages.items())
-        album_first_messages = dict(items[-100:])
-    
-    print(f"   🧹 Очищен кэш альбомов, осталось: {len(processed_albums)} альбомов, {len(album_first_messages)} первых сообщений")
-    
-    print(f"   🧹 Очищен кэш альбомов, осталось: {len(processed_albums)}")
-
 @router.message(Command("статус_альбомов"))
 async def cmd_album_status(message: types.Message):
     """Показать статус кэша альбомов"""
@@ -2229,17 +1833,20 @@ async def cmd_album_status(message: types.Message):
     except:
         return
     
+    caches = "\n".join(
+        f"• {name}: {stats['size']}/{stats['maxsize']}, ~{stats['bytes'] // 1024} КБ"
+        for name, stats in cache_stats().items()
+    )
     status = (
         f"📊 Статус кэша альбомов\n\n"
-        f"• Обработанных альбомов: {len(processed_albums)}\n"
-        f"• Сохраненных первых сообщений: {len(album_first_messages)}\n"
+        f"• Собираются альбомов: {album_aggregator.open_count()}\n"
         f"• Счетчиков пустых сообщений: {len(user_empty_message_counters)}\n"
-        f"• Сохраненных сообщений: {len(last_messages)}\n\n"
-        f"💡 Кэш очищается автоматически при превышении 1000 записей"
+        f"• Ожидают автоудаления: {auto_delete.pending_count()}\n\n"
+        f"🗂 Кэши:\n{caches}\n\n"
+        f"💡 Кэши ограничены по размеру, устаревшие записи удаляются автоматически"
     )
     
     await message.reply(status, parse_mode="HTML")
-    await save_last_message(chat_id, user_id, message)
 
 def mask_swear_words(text: str, banned_words: list) -> tuple:
     """
@@ -2248,54 +1855,17 @@ def mask_swear_words(text: str, banned_words: list) -> tuple:
     if not text or not banned_words:
         return text, []  # ВАЖНО: возвращаем кортеж (text, []), а не text
     
-    text_lower = text.lower()
-    found_words = []
-    masked_text = text
-    
-    for banned_word in banned_words:
-        if not banned_word or not isinstance(banned_word, str):
-            continue
-            
-        banned_word_lower = banned_word.lower().strip()
-        if not banned_word_lower:
-            continue
-            
-        if banned_word_lower in text_lower:
-            found_words.append(banned_word)
-            # Создаем маску из звездочек
-            mask = '*' * len(banned_word)
-            # Заменяем слово на маску (сохраняя регистр)
-            masked_text = re.sub(
-                re.escape(banned_word), 
-                mask, 
-                masked_text, 
-                flags=re.IGNORECASE
-            )
-    
-    return masked_text, found_words  # ВАЖНО: возвращаем кортеж
-async def cleanup_old_albums():
-    """Очистка старых записей альбомов из кэша"""
-    global processed_albums, album_first_messages
-    
-    # Оставляем только свежие записи (последние 100)
-    if len(processed_albums) > 100:
-        albums_list = list(processed_albums)
-        processed_albums = set(albums_list[-100:])
-    
-    if len(album_first_messages) > 100:
-        # Удаляем старые записи
-        items = list(album_first_messages.items())
-        album_first_messages = dict(items[-100:])
-    
-    print(f"   🧹 Очищен кэш альбомов, осталось: {len(processed_albums)}")
+    return BannedWordMatcher(banned_words).mask(text)
 
-async def handle_empty_message_for_album(message: types.Message, user_id: int, chat_id: int, album_size: int = 1):
+async def handle_empty_message_for_album(message: types.Message, decision: AdmissionDecision, album_size: int = 1):
     """Обработка пустого альбома (без текста) - только для альбомов без текста"""
-    print(f"   📊 Обработка пустого альбома, size={album_size}")
+    logger.debug("   📊 Обработка пустого альбома, size=%s", album_size)
+    
+    user_id = decision.user_id
+    chat_id = decision.chat_id
     
-    user_chat_data = await db.get_or_create_user_chat_data(user_id, chat_id)
-    if user_chat_data and user_chat_data.is_muted:
-        print(f"   ⏭️ Пользователь уже заблокирован, пустой альбом игнорируется")
+    if decision.is_muted:
+        logger.debug("   ⏭️ Пользователь уже заблокирован, пустой альбом игнорируется")
         return
     
     key = (user_id, chat_id)
@@ -2305,9 +1875,9 @@ async def handle_empty_message_for_album(message: types.Message, user_id: int, c
     current_count = user_empty_message_counters.get(key, 0) + 1
     user_empty_message_counters[key] = current_count
     
-    # Получаем уведомление из БД
+    # Получаем уведомление из решения о допуске
     try:
-        notifications = await db.get_chat_notifications(chat_id)
+        notifications = decision.notifications
         warning_text = notifications.get("empty_message", 
             "⚠️ <b>Внимание!</b>\n"
             "Просто картинки/стикеры/видео без текста нельзя отправлять в чат.\n"
@@ -2319,10 +1889,10 @@ async def handle_empty_message_for_album(message: types.Message, user_id: int, c
         if f"Предупреждение {current_count}/3" not in warning_text:
             warning_text += f"\n\nПредупреждение {current_count}/3"
         
-        print(f"   📝 Используется уведомление из БД: {warning_text[:50]}...")
+        logger.debug("   📝 Используется уведомление из БД: %s...", warning_text[:50])
         
     except Exception as e:
-        print(f"⚠️ Ошибка получения уведомления: {e}")
+        logger.warning("⚠️ Ошибка получения уведомления: %s", e)
         # Fallback текст
         warning_text = (
             "⚠️ <b>Внимание!</b>\n"
@@ -2339,9 +1909,6 @@ async def handle_empty_message_for_album(message: types.Message, user_id: int, c
             parse_mode="HTML"
         )
         
-        # Сохраняем предупреждение для автоудаления (только для пользователя)
-        await save_last_message(chat_id, user_id, warning_msg)
-        
         # Проверяем лимит (3 пустых сообщения) и мутим НЕМЕДЛЕННО
         if current_count >= 3:
             mute_until = datetime.now() + timedelta(days=3)
@@ -2357,8 +1924,7 @@ async def handle_empty_message_for_album(message: types.Message, user_id: int, c
                 
                 # Получаем уведомление о блокировке из БД (НОВЫЙ КЛЮЧ)
                 try:
-                    notifications = await db.get_chat_notifications(chat_id)
-                    mute_text = notifications.get("empty_message_blocked",
+                    mute_text = decision.notifications.get("empty_message_blocked",
                         "🚫 <b>Блокировка за пустые сообщения</b>\n\n"
                         "Вы отправили 3 пустых медиа-сообщения подряд без текста.\n"
                         f"Заблокирован до: {mute_until.strftime('%d.%m.%Y %H:%M')}\n\n"
@@ -2373,7 +1939,7 @@ async def handle_empty_message_for_album(message: types.Message, user_id: int, c
                         mute_text += f"\n\nЗаблокирован до: {mute_until.strftime('%d.%m.%Y %H:%M')}"
                     
                 except Exception as e:
-                    print(f"⚠️ Ошибка получения уведомления о блокировке: {e}")
+                    logger.warning("⚠️ Ошибка получения уведомления о блокировке: %s", e)
                     mute_text = (
                         "🚫 <b>Блокировка за пустые сообщения</b>\n\n"
                         "Вы отправили 3 пустых медиа-сообщения подряд без текста.\n"
@@ -2391,43 +1957,11 @@ async def handle_empty_message_for_album(message: types.Message, user_id: int, c
                 # Сбрасываем счетчик после мута
                 user_empty_message_counters[key] = 0
                 
-                # Автоудаление уведомления о муте через 60 секунд
-                await asyncio.sleep(60)
-                try:
-                    await mute_msg.delete()
-                except Exception as e:
-                    print(f"⚠️ Не удалось удалить уведомление о муте: {e}")
+                # Автоудаление через 60 секунд
+                auto_delete.schedule(mute_msg, 60)
                 
                 # Обновляем статус в БД
-                try:
-                    async with db.async_session() as session:
-                        from sqlalchemy import select
-                        from ..models.schemas import UserChatData
-                        
-                        result = await session.execute(
-                            select(UserChatData)
-                            .where(UserChatData.user_id == user_id)
-                            .where(UserChatData.chat_id == chat_id)
-                        )
-                        user_chat_data = result.scalar_one_or_none()
-                        
-                        if user_chat_data:
-                            user_chat_data.is_muted = True
-                            user_chat_data.mute_until = mute_until
-                            await session.commit()
-                        else:
-                            user_chat_data = UserChatData(
-                                user_id=user_id,
-                                chat_id=chat_id,
-                                is_muted=True,
-                                mute_until=mute_until,
-                                message_count=0,
-                                last_reset_date=datetime.utcnow()
-                            )
-                            session.add(user_chat_data)
-                            await session.commit()
-                except Exception as e:
-                    print(f"⚠️ Не удалось обновить статус мута в БД: {e}")
+                await db.set_user_muted(user_id, chat_id, mute_until)
                 
                 await db.log_action(
                     action_type="empty_message_mute",
@@ -2436,10 +1970,10 @@ async def handle_empty_message_for_album(message: types.Message, user_id: int, c
                     details=f"3 пустых сообщения подряд. Мут до {mute_until}"
                 )
                 
-                print(f"✅ Пользователь {user_id} заблокирован за 3 пустых сообщения до {mute_until}")
+                logger.info("✅ Пользователь %s заблокирован за 3 пустых сообщения до %s", user_id, mute_until)
                 
             except Exception as e:
-                print(f"❌ Ошибка при муте пользователя за пустые сообщения: {e}")
+                logger.error("❌ Ошибка при муте пользователя за пустые сообщения: %s", e)
                 await db.log_action(
                     "mute_error",
                     user_id=user_id,
@@ -2447,16 +1981,11 @@ async def handle_empty_message_for_album(message: types.Message, user_id: int, c
                     details=f"Ошибка мута: {str(e)}"
                 )
         
-        # Удаляем предупреждение через 60 секунд
-        await asyncio.sleep(60)
-        try:
-            await warning_msg.delete()
-            await delete_last_message(chat_id, user_id)
-        except Exception as e:
-            print(f"⚠️ Не удалось удалить предупреждение: {e}")
+        # Автоудаление через 60 секунд
+        auto_delete.schedule(warning_msg, 60)
     
     except Exception as e:
-        print(f"❌ Общая ошибка обработки пустого альбома: {e}")
+        logger.error("❌ Общая ошибка обработки пустого альбома: %s", e)
 async def check_exceptions(message: types.Message, chat_id: int) -> bool:
     """Проверяем, попадает ли сообщение под исключения"""
     text = get_text_from_message(message)
@@ -2464,135 +1993,50 @@ async def check_exceptions(message: types.Message, chat_id: int) -> bool:
     if not text:
         return False
     
-    try:
-        exceptions = await db.get_chat_exceptions(chat_id)
-        if exceptions is None:
-            exceptions = []
-    except Exception as e:
-        print(f"⚠️ Ошибка получения исключений: {e}")
-        exceptions = config.DEFAULT_EXCLUDE_WORDS
-    
-    text_lower = text.lower()
-    for word in exceptions:
-        if word and word.lower() in text_lower:
-            return True
+    matched_rule = await db.match_exception(text, chat_id)
+    if matched_rule is None:
+        return False
     
-    return False
+    logger.debug("   ✅ Исключение: сработало правило '%s'", matched_rule)
+    return True
 
 # ===== ОБРАБОТКА АЛЬБОМОВ =====
 
 
-async def handle_media_album_subsequent(message: types.Message, user_id: int, chat_id: int):
-    """Обработка последующих сообщений альбома"""
-    media_group_id = message.media_group_id
-    album_key = (chat_id, media_group_id)
-    
-    # Проверяем информацию об альбоме
-    if album_key in album_first_messages:
-        # Увеличиваем счетчик размера альбома
-        album_first_messages[album_key]['album_size'] += 1
-        
-        print(f"   📸 Последующее сообщение альбома {media_group_id}, размер={album_first_messages[album_key]['album_size']}")
-        
-        # Если альбом без текста и помечен на удаление - удаляем это сообщение
-        if album_first_messages[album_key].get('deleted', False):
-            try:
-                await message.delete()
-                album_first_messages[album_key]['deleted_messages'].append(message.message_id)
-                print(f"   🗑️ Удалено сообщение пустого альбома")
-                
-                # Проверяем, все ли сообщения альбома удалены
-                if len(album_first_messages[album_key]['deleted_messages']) >= album_first_messages[album_key]['album_size']:
-                    # Все сообщения альбома удалены, отправляем одно предупреждение
-                    await handle_empty_album_warning(message, user_id, chat_id, album_first_messages[album_key]['album_size'])
-                    
-            except Exception as e:
-                print(f"⚠️ Не удалось удалить сообщение альбома: {e}")
-        # Если альбом с текстом - НИЧЕГО НЕ ДЕЛАЕМ
-
-# Глобальные переменные для обработки альбомов
-active_albums = {}  # {album_key: {"messages": [], "has_text": bool, "text": str, "timer": task, "user_id": int, "chat_id": int}}
-MAX_ALBUM_SIZE = 10  # Максимальный размер альбома (по спецификации Telegram)
-
 async def handle_media_album(message: types.Message, user_id: int, chat_id: int):
-    """Обработка медиа-альбомов с таймером ожидания"""
-    media_group_id = message.media_group_id
-    album_key = (chat_id, media_group_id)
-    
+    """Добавляет часть медиа-альбома; альбом обрабатывается целиком в process_album"""
     text = get_text_from_message(message)
-    has_text = bool(text and text.strip())
-    
-    print(f"📸 Альбом сообщение: album_key={album_key}, has_text={has_text}, text={text[:50] if text else ''}")
-    
-    if album_key not in active_albums:
-        # Новый альбом
-        active_albums[album_key] = {
-            "messages": [message],
-            "has_text": has_text,
-            "text": text or "",
-            "user_id": user_id,
-            "chat_id": chat_id,
-            "start_time": datetime.now(),
-            "processed": False
-        }
-        
-        print(f"   🆕 Новый альбом, сообщений: 1, текст: {'есть' if has_text else 'нет'}")
-        
-        # Запускаем таймер на обработку альбома
-        asyncio.create_task(process_album_after_delay(album_key))
-    else:
-        # Добавляем сообщение в существующий альбом
-        active_albums[album_key]["messages"].append(message)
-        
-        # Обновляем информацию о тексте (берем из первого сообщения)
-        if not active_albums[album_key]["has_text"] and has_text:
-            active_albums[album_key]["has_text"] = has_text
-            active_albums[album_key]["text"] = text
-        
-        print(f"   ➕ Добавлено в альбом, всего сообщений: {len(active_albums[album_key]['messages'])}")
+    logger.debug("📸 Альбом сообщение: album_key=%s, text=%s", (chat_id, message.media_group_id), text[:50] if text else '')
+    album_aggregator.add(message, user_id, chat_id, text, process_album, process_late_album_part)
 
-async def process_album_after_delay(album_key, delay_seconds=1.5):
-    """Обработка альбома после задержки (ждем все сообщения)"""
-    await asyncio.sleep(delay_seconds)
-    
-    if album_key not in active_albums:
-        print(f"   ⏭️ Альбом уже обработан или удален")
-        return
-    
-    album_data = active_albums[album_key]
+async def process_album(album: Album):
+    """Обработка собранного альбома"""
+    messages = album.messages
+    has_text = album.has_text
+    text = album.text
+    user_id = album.user_id
+    chat_id = album.chat_id
     
-    if album_data.get("processed", False):
-        print(f"   ⏭️ Альбом уже обработан")
-        return
-    
-    album_data["processed"] = True
-    
-    messages = album_data["messages"]
-    has_text = album_data["has_text"]
-    text = album_data["text"]
-    user_id = album_data["user_id"]
-    chat_id = album_data["chat_id"]
-    
-    print(f"   🔄 Обработка альбома {album_key}: {len(messages)} сообщений, текст: {'есть' if has_text else 'нет'}")
+    logger.debug("   🔄 Обработка альбома %s: %s сообщений, текст: %s", album.key, len(messages), 'есть' if has_text else 'нет')
     
     if not has_text:
         # Альбом без текста - удаляем все сообщения
-        print(f"   🗑️ Альбом без текста, удаляем все сообщения")
-        deleted_count = 0
-        
-        for msg in messages:
-            try:
-                await msg.delete()
-                deleted_count += 1
-            except Exception as e:
-                print(f"   ⚠️ Не удалось удалить сообщение: {e}")
+        logger.debug("   🗑️ Альбом без текста, удаляем все сообщения")
+        # Весь альбом - одним запросом deleteMessages
+        deleted_count = await auto_delete.delete_now(
+            chat_id, [msg.message_id for msg in messages], messages[0].bot
+        )
         
         if deleted_count > 0:
-            # Отправляем одно предупреждение за весь альбом
-            await handle_empty_album_warning(messages[0], user_id, chat_id, deleted_count)
+            # Отправляем одно предупреждение за весь альбом (альбом в лимите не учитывается)
+            decision = await admit_message(messages[0], count=False)
+            if not decision:
+                logger.warning("   ⚠️ Не удалось сохранить пользователя/чат в БД")
+                return
+            await handle_empty_album_warning(messages[0], decision, deleted_count)
     else:
         # Альбом с текстом - проверяем требования
-        print(f"   📝 Альбом с текстом, проверяем требования")
+        logger.debug("   📝 Альбом с текстом, проверяем требования")
         
         # Используем первый message для проверки
         first_message = messages[0]
@@ -2600,29 +2044,35 @@ async def process_album_after_delay(album_key, delay_seconds=1.5):
         should_count, should_block, block_reason, warning = await check_message_requirements(text, chat_id)
         
         if should_block:
-            print(f"   🚫 Запрещенное слово в альбоме: {block_reason}")
+            logger.debug("   🚫 Запрещенное слово в альбоме: %s", block_reason)
             # Обрабатываем как мат
             await handle_swear_word_block(first_message, user_id, chat_id, block_reason)
         elif should_count:
             # Альбом проходит проверку, учитываем его
-            print(f"   📊 Альбом с допустимым текстом, учитываем")
-            await count_and_check_limit(first_message, user_id, chat_id, text)
+            logger.debug("   📊 Альбом с допустимым текстом, учитываем")
+            decision = await admit_message(first_message, count=True)
+            if decision and decision.is_active:
+                await count_and_check_limit(first_message, decision)
         else:
             # Альбом с коротким текстом - НЕ удаляем, просто игнорируем
-            print(f"   ⚠️ Альбом с коротким текстом: {warning}")
-    
-    # Очищаем альбом из активных
-    if album_key in active_albums:
-        del active_albums[album_key]
-        print(f"   🧹 Альбом удален из активных")
+            logger.debug("   ⚠️ Альбом с коротким текстом: %s", warning)
 
-async def handle_empty_album_warning(message: types.Message, user_id: int, chat_id: int, album_size: int):
+async def process_late_album_part(album: ClosedAlbum, message: types.Message):
+    """Часть уже обработанного альбома: второй раз альбом не учитывается и не предупреждает"""
+    if not album.has_text:
+        # Остальные части пустого альбома уже удалены - удаляем и эту
+        logger.debug("   🗑️ Поздняя часть пустого альбома %s, удаляем", album.key)
+        auto_delete.delete_soon(message)
+
+async def handle_empty_album_warning(message: types.Message, decision: AdmissionDecision, album_size: int):
     """Отправка одного предупреждения за весь альбом без текста"""
-    print(f"   ⚠️ Отправка предупреждения за пустой альбом ({album_size} сообщений)")
+    logger.debug("   ⚠️ Отправка предупреждения за пустой альбом (%s сообщений)", album_size)
+    
+    user_id = decision.user_id
+    chat_id = decision.chat_id
     
-    user_chat_data = await db.get_or_create_user_chat_data(user_id, chat_id)
-    if user_chat_data and user_chat_data.is_muted:
-        print(f"   ⏭️ Пользователь уже заблокирован, пустой альбом игнорируется")
+    if decision.is_muted:
+        logger.debug("   ⏭️ Пользователь уже заблокирован, пустой альбом игнорируется")
         return
     
     key = (user_id, chat_id)
@@ -2632,9 +2082,9 @@ async def handle_empty_album_warning(message: types.Message, user_id: int, chat_
     current_count = user_empty_message_counters.get(key, 0) + 1
     user_empty_message_counters[key] = current_count
     
-    # Получаем уведомление из БД
+    # Получаем уведомление из решения о допуске
     try:
-        notifications = await db.get_chat_notifications(chat_id)
+        notifications = decision.notifications
         warning_text = notifications.get("empty_message", 
             "⚠️ <b>Внимание!</b>\n"
             "Просто картинки/видео без текста нельзя отправлять в чат.\n"
@@ -2647,7 +2097,7 @@ async def handle_empty_album_warning(message: types.Message, user_id: int, chat_
             warning_text += f"\n\nПредупреждение {current_count}/3"
         
     except Exception as e:
-        print(f"⚠️ Ошибка получения уведомления: {e}")
+        logger.warning("⚠️ Ошибка получения уведомления: %s", e)
         warning_text = (
             "⚠️ <b>Внимание!</b>\n"
             "Просто картинки/видео без текста нельзя отправлять в чат.\n"
@@ -2664,7 +2114,6 @@ async def handle_empty_album_warning(message: types.Message, user_id: int, chat_
         )
         
         # Сохраняем предупреждение для автоудаления
-        await save_last_message(chat_id, user_id, warning_msg)
         
         # Проверяем лимит (3 пустых сообщения) и мутим НЕМЕДЛЕННО
         if current_count >= 3:
@@ -2696,48 +2145,22 @@ async def handle_empty_album_warning(message: types.Message, user_id: int, chat_
                 # Сбрасываем счетчик после мута
                 user_empty_message_counters[key] = 0
                 
-                # Автоудаление уведомления о муте через 60 секунд
-                await asyncio.sleep(60)
-                try:
-                    await mute_msg.delete()
-                except Exception as e:
-                    print(f"⚠️ Не удалось удалить уведомление о муте: {e}")
+                # Автоудаление через 60 секунд
+                auto_delete.schedule(mute_msg, 60)
                 
                 # Обновляем статус в БД
-                try:
-                    async with db.async_session() as session:
-                        from sqlalchemy import select
-                        from ..models.schemas import UserChatData
-                        
-                        result = await session.execute(
-                            select(UserChatData)
-                            .where(UserChatData.user_id == user_id)
-                            .where(UserChatData.chat_id == chat_id)
-                        )
-                        user_chat_data = result.scalar_one_or_none()
-                        
-                        if user_chat_data:
-                            user_chat_data.is_muted = True
-                            user_chat_data.mute_until = mute_until
-                            await session.commit()
-                except Exception as e:
-                    print(f"⚠️ Не удалось обновить статус мута в БД: {e}")
+                await db.set_user_muted(user_id, chat_id, mute_until)
                 
-                print(f"✅ Пользователь {user_id} заблокирован за 3 пустых сообщения до {mute_until}")
+                logger.info("✅ Пользователь %s заблокирован за 3 пустых сообщения до %s", user_id, mute_until)
                 
             except Exception as e:
-                print(f"❌ Ошибка при муте пользователя за пустые сообщения: {e}")
+                logger.error("❌ Ошибка при муте пользователя за пустые сообщения: %s", e)
         
-        # Удаляем предупреждение через 60 секунд
-        await asyncio.sleep(60)
-        try:
-            await warning_msg.delete()
-            await delete_last_message(chat_id, user_id)
-        except Exception as e:
-            print(f"⚠️ Не удалось удалить предупреждение: {e}")
+        # Автоудаление через 60 секунд
+        auto_delete.schedule(warning_msg, 60)
     
     except Exception as e:
-        print(f"❌ Ошибка отправки предупреждения: {e}")
+        logger.error("❌ Ошибка отправки предупреждения: %s", e)
 @router.message(Command("тестпроверки"))
 async def cmd_test_check(message: types.Message):
     """Тест проверки сообщений"""
@@ -2795,5 +2218,4 @@ async def cmd_test_check(message: types.Message):
         f"<b>Результаты:</b>\n" + "\n".join(results)
     )
     
-    await message.reply(response, parse_mode="HTML")
-    await save_last_message(chat_id, user_id, message)
\ No newline at end of file
+    await message.reply(response, parse_mode="HTML")
\ No newline at end of file
@@ -2,41 +2,41 @@
 Инициализация базы данных
 """
 import asyncio
+import logging
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import text
-from sqlalchemy.schema import CreateTable
+from sqlalchemy import inspect
 
 from .database import db
 from .models.schemas import Base, TemporaryLimit, Chat, User, UserChatData, GlobalSettings, ActionLog, Statistics
 
+logger = logging.getLogger(__name__)
+
 async def create_tables_if_not_exist():
     """Создает все таблицы, если они не существуют"""
     try:
-        print("📊 Инициализация базы данных...")
+        logger.info("📊 Инициализация базы данных...")
         
         # Используем стандартный метод создания всех таблиц
         async with db.engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
         
-        print("✅ Все таблицы БД созданы/проверены")
+        logger.info("✅ Все таблицы БД созданы/проверены")
         
-        # Дополнительная проверка для временных лимитов
-        async with db.async_session() as session:
-            result = await session.execute(
-                text("SELECT name FROM sqlite_master WHERE type='table' AND name='temporary_limits'")
+        # Дополнительная проверка для временных лимитов (SQLite и PostgreSQL)
+        async with db.engine.begin() as conn:
+            table_exists = await conn.run_sync(
+                lambda sync_conn: inspect(sync_conn).has_table("temporary_limits")
             )
-            table_exists = result.scalar() is not None
             
             if not table_exists:
-                print("📊 Создаю таблицу временных лимитов...")
-                await session.execute(CreateTable(TemporaryLimit.__table__))
-                await session.commit()
-                print("✅ Таблица временных лимитов создана")
+                logger.info("📊 Создаю таблицу временных лимитов...")
+                await conn.run_sync(TemporaryLimit.__table__.create)
+                logger.info("✅ Таблица временных лимитов создана")
             else:
-                print("✅ Таблица временных лимитов уже существует")
+                logger.info("✅ Таблица временных лимитов уже существует")
                 
     except Exception as e:
-        print(f"⚠️ Ошибка создания таблиц БД: {e}")
+        logger.warning("⚠️ Ошибка создания таблиц БД: %s", e)
         raise
 
 async def init_database():
@@ -48,9 +48,9 @@ async def init_database():
         # Инициализируем глобальные настройки
         await db.init_global_settings()
         
-        print("✅ База данных полностью инициализирована")
+        logger.info("✅ База данных полностью инициализирована")
         return True
         
     except Exception as e:
-        print(f"❌ Ошибка инициализации БД: {e}")
+        logger.error("❌ Ошибка инициализации БД: %s", e)
         return False
\ No newline at end of file
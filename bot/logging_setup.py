@@ -0,0 +1,126 @@
+"""
+Настройка логирования: запись в консоль и файл из отдельного потока
+"""
+import atexit
+import copy
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from .config import config
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Атрибуты, которые есть у любой записи; остальные пришли через extra=
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_listener: Optional[QueueListener] = None
+
+
+class KeyValueFormatter(logging.Formatter):
+    """
+    Формат записи + поля из extra= в виде key=value.
+
+    logger.info("🔒 Пользователь заблокирован", extra={"chat_id": 1, "user_id": 2})
+    -> "... 🔒 Пользователь заблокирован chat_id=1 user_id=2"
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = " ".join(
+            f"{key}={value}" for key, value in vars(record).items()
+            if key not in _RECORD_ATTRS and not key.startswith("_")
+        )
+        return f"{line} {fields}" if fields else line
+
+
+class _QueueHandler(QueueHandler):
+    """
+    Передает запись в очередь с уже подставленными аргументами.
+
+    Как и стандартный QueueHandler, подставляет аргументы ("... %s", x) в
+    потоке вызова: изменяемые аргументы (словари, списки, объекты ORM) к
+    моменту записи в потоке QueueListener могут измениться. В отличие от
+    него не применяет формат обработчика, поэтому поля extra= остаются в
+    записи для KeyValueFormatter.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Трассировку нужно снять, пока исключение еще доступно в этом потоке
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """
+    Уровни по модулям из строки вида "bot.handlers.group=DEBUG,aiogram=WARNING"
+
+    Returns:
+        {имя логгера: уровень}
+    """
+    levels = {}
+    for item in (spec or "").split(","):
+        name, _, level = item.partition("=")
+        name, level = name.strip(), level.strip().upper()
+        if name and level:
+            levels[name] = logging.getLevelName(level) if not level.isdigit() else int(level)
+    return {name: level for name, level in levels.items() if isinstance(level, int)}
+
+
+def setup_logging(level: str = None, log_file: str = None, module_levels: str = None) -> QueueListener:
+    """
+    Направляет все логи через очередь в консоль и файл
+
+    Логгеры в потоке событийного цикла подставляют аргументы в сообщение и
+    кладут запись в очередь; формат записи и вывод в stdout/файл выполняет
+    поток QueueListener. Записи ниже уровня логгера отбрасываются до
+    подстановки, поэтому отладочные сообщения с аргументами ("... %s", x)
+    ничего не стоят.
+
+    Args:
+        level: общий уровень (по умолчанию config.LOG_LEVEL)
+        log_file: файл лога (по умолчанию config.LOG_FILE, пусто - без файла)
+        module_levels: уровни отдельных логгеров (по умолчанию config.LOG_LEVELS)
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    formatter = KeyValueFormatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler(sys.stdout)]
+    log_file = config.LOG_FILE if log_file is None else log_file
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_QueueHandler(log_queue))
+    root.setLevel((level or config.LOG_LEVEL).upper())
+
+    module_levels = config.LOG_LEVELS if module_levels is None else module_levels
+    for name, module_level in parse_levels(module_levels).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Дописывает очередь логов и останавливает поток записи"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
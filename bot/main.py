@@ -1,8 +1,10 @@
 import asyncio
+import importlib
 import logging
 import sys
-from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+import time
+from contextlib import contextmanager
+from aiogram import Bot, Dispatcher, Router
 from aiogram.client.default import DefaultBotProperties
 from datetime import datetime, timedelta
 
@@ -11,120 +13,280 @@ from datetime import datetime, timedelta
 if sys.platform == 'win32':
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler("bot.log", encoding="utf-8")
-    ]
-)
+# Настройка логирования: консоль и файл пишутся из отдельного потока,
+# уровни - LOG_LEVEL / LOG_LEVELS
+from .logging_setup import setup_logging, stop_logging
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Импорт БД будет внутри функций
 db = None
 
+# Фоновые задачи запуска (ссылки держим, чтобы задачи не собрал GC)
+_background_tasks = set()
+
+# Типы обновлений, которые обрабатывают лениво подключаемые админские роутеры
+ADMIN_UPDATE_TYPES = {"message", "callback_query"}
+# Модули админских роутеров (импортируются в отдельном потоке после начала опроса)
+ADMIN_ROUTER_MODULES = ("bot.handlers.callbacks", "bot.handlers.exceptions", "bot.handlers.notifications")
+
+
+def _spawn(coro):
+    """Запускает фоновую задачу и держит ссылку на нее до завершения"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+@contextmanager
+def _phase(name: str, timings: dict):
+    """Замеряет длительность этапа запуска и пишет ее в лог"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - started) * 1000
+        timings[name] = elapsed
+        logger.info("   ⏱️ %s: %.0f мс", name, elapsed)
+
+
+class _AdminRouters:
+    """
+    Админские обработчики (кнопки, исключения, уведомления), подключаемые после старта
+
+    Роутер-заглушка включается в диспетчер на место админских роутеров, поэтому
+    порядок обработки не меняется. Модули импортируются в отдельном потоке уже
+    после начала опроса, событийный цикл в это время обрабатывает группы.
+    Пока модули не загружены, на входе в заглушку ждут только кнопки и
+    сообщения личных чатов (админ-панель); сообщения групп проходят дальше сразу.
+    """
+
+    def __init__(self):
+        self.router = Router(name="admin")
+        self._loaded = asyncio.Event()
+        for update_type in ADMIN_UPDATE_TYPES:
+            self.router.observers[update_type].outer_middleware(self._wait_loaded)
+
+    async def _wait_loaded(self, handler, event, data):
+        # Ждут нажатия кнопок и сообщения в личных чатах; группы идут дальше
+        chat = getattr(event, "chat", None)
+        if not self._loaded.is_set() and (chat is None or chat.type == "private"):
+            await self._loaded.wait()
+        return await handler(event, data)
+
+    async def load(self):
+        timings = {}
+        try:
+            with _phase("админские обработчики", timings):
+                for module_name in ADMIN_ROUTER_MODULES:
+                    module = await asyncio.to_thread(importlib.import_module, module_name)
+                    self.router.include_router(module.router)
+            logger.info("   ✅ Callback-обработчики зарегистрированы")
+        except Exception as e:
+            import traceback
+            logger.error("❌ ОШИБКА регистрации админских обработчиков: %s: %s", type(e).__name__, e)
+            logger.error(traceback.format_exc())
+        finally:
+            # Даже при ошибке не держим обновления - их обработают остальные роутеры
+            self._loaded.set()
+
 async def cleanup_old_caches():
-    """Очистка старых кэшей"""
-    print("🧹 Очистка старых кэшей...")
-    
-    # Здесь можно добавить логику очистки
-    # Например, кэши старше 24 часов
-    
-    print("✅ Очистка кэшей завершена")
+    """Очистка просроченных записей кэшей (дальше - по расписанию)"""
+    from .services.cache import sweep_caches
+    removed = sweep_caches()
+    logger.info("✅ Очистка кэшей завершена, удалено записей: %s", removed)
+
+class _RateLimiter:
+    """Не больше rate запросов в секунду; пауза для всех после retry_after"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            delay = self._next_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_at = max(self._next_at, loop.time()) + self.interval
+
+    def pause(self, seconds: float):
+        loop = asyncio.get_running_loop()
+        self._next_at = max(self._next_at, loop.time() + seconds)
+
+
+async def _probe_chat(bot, chat_id: int, semaphore: asyncio.Semaphore, limiter: _RateLimiter):
+    """
+    Проверяет права бота в чате
+
+    Returns:
+        Причина выключения чата или None, если чат в порядке или проверить не удалось
+    """
+    from aiogram.exceptions import TelegramRetryAfter
+
+    async with semaphore:
+        for _ in range(3):
+            await limiter.wait()
+            try:
+                bot_member = await bot.get_chat_member(chat_id, bot.id)
+            except TelegramRetryAfter as e:
+                # Telegram просит подождать - притормаживаем все проверки
+                limiter.pause(e.retry_after)
+                continue
+            except Exception as e:
+                error_msg = str(e).lower()
+                if "kicked" in error_msg or "forbidden" in error_msg:
+                    return f"бот удален (ошибка: {e})"
+                logger.warning("   ⚠️ Не могу проверить права в чате %s: %s", chat_id, e)
+                return None
+
+            if bot_member.status in ["kicked", "left"]:
+                return "бот удален из чата"
+            if bot_member.status not in ["administrator", "creator"]:
+                return "бот не админ"
+            return None
+
+        logger.warning("   ⚠️ Не могу проверить права в чате %s: превышено число повторов", chat_id)
+        return None
+
 
 async def check_inactive_chats(bot):
     """Проверяет чаты, где бот не является администратором и деактивирует их"""
+    from .config import config
+    
     try:
-        chats = await db.get_all_chats()
+        started = asyncio.get_running_loop().time()
+        chat_ids = await db.get_active_chat_ids()
         
-        for chat in chats:
-            if chat.is_active:
-                try:
-                    # Проверяем права бота в чате
-                    bot_member = await bot.get_chat_member(chat.id, bot.id)
-                    
-                    if bot_member.status in ["kicked", "left"]:
-                        # Бота удалили из чата
-                        logger.warning(f"   🚫 Бот удален из чата {chat.id}, деактивируем")
-                        chat.is_active = False
-                        async with db.async_session() as session:
-                            await session.merge(chat)
-                            await session.commit()
-                    
-                    elif bot_member.status not in ["administrator", "creator"]:
-                        # Бот не админ
-                        logger.warning(f"   ⚠️ Бот не админ в чате {chat.id}, деактивируем")
-                        chat.is_active = False
-                        async with db.async_session() as session:
-                            await session.merge(chat)
-                            await session.commit()
-                            
-                except Exception as e:
-                    error_msg = str(e).lower()
-                    if "kicked" in error_msg or "forbidden" in error_msg:
-                        # Бота удалили
-                        logger.warning(f"   🚫 Бот удален из чата {chat.id} (ошибка: {e}), деактивируем")
-                        chat.is_active = False
-                        async with db.async_session() as session:
-                            await session.merge(chat)
-                            await session.commit()
-                    else:
-                        # Другая ошибка
-                        logger.warning(f"   ⚠️ Не могу проверить права в чате {chat.id}: {e}")
+        semaphore = asyncio.Semaphore(config.INACTIVE_CHECK_CONCURRENCY)
+        limiter = _RateLimiter(config.INACTIVE_CHECK_RATE)
+        reasons = await asyncio.gather(
+            *(_probe_chat(bot, chat_id, semaphore, limiter) for chat_id in chat_ids)
+        )
+        
+        to_deactivate = []
+        for chat_id, reason in zip(chat_ids, reasons):
+            if reason:
+                logger.warning("   🚫 Чат %s: %s, деактивируем", chat_id, reason)
+                to_deactivate.append(chat_id)
+        
+        deactivated = await db.deactivate_chats(to_deactivate)
+        elapsed = asyncio.get_running_loop().time() - started
+        logger.info("   ✅ Проверено чатов: %s, деактивировано: %s (%.1f с)", len(chat_ids), deactivated, elapsed)
                     
     except Exception as e:
-        logger.error(f"⚠️ Ошибка проверки активных чатов: {e}")
+        logger.error("⚠️ Ошибка проверки активных чатов: %s", e)
 
-async def startup(bot):
-    """Действия при запуске бота"""
+async def startup_maintenance(bot):
+    """
+    Обслуживание после запуска, в фоне: опрос Telegram к этому моменту уже идет.
+
+    Все шаги идемпотентны и повторяются планировщиком, поэтому ошибка одного
+    шага только пишется в лог.
+    """
+    timings = {}
+    
+    try:
+        # Подхватываем незавершенные удаления из БД; новые удаления
+        # можно планировать и до этого - они просто ждут в очереди
+        with _phase("автоудаление", timings):
+            from .services.auto_delete import auto_delete
+            await auto_delete.start(bot, db)
+        logger.info("   ✅ Автоудаление сообщений запущено")
+    except Exception as e:
+        logger.error("⚠️ Ошибка запуска автоудаления: %s", e)
+    
+    # Очищаем старые кэши
+    await cleanup_old_caches()
+    
+    # Автоматическая разблокировка пользователей
+    with _phase("авторазблокировка", timings):
+        unblocked = await db.auto_unblock_users()
+    if unblocked > 0:
+        logger.info("✅ Автоматически разблокировано %s пользователей", unblocked)
+    
+    # Счетчики сбрасываются лениво при первом сообщении в новом месяце;
+    # здесь дочищаем счетчики прошлых месяцев (в т.ч. пропущенный сброс)
+    with _phase("ежемесячный сброс", timings):
+        reset_count = await db.monthly_reset_counts()
+    if reset_count > 0:
+        logger.info("✅ Ежемесячный сброс: обновлено %s пользователей", reset_count)
+    
+    # Проверяем истекшие ручные лимиты
+    with _phase("ручные лимиты", timings):
+        custom_limits_reset = await db.check_and_reset_expired_custom_limits()
+    if custom_limits_reset > 0:
+        logger.info("✅ Сброшено %s истекших ручных лимитов", custom_limits_reset)
+    
+    # Проверяем и деактивируем неактивные чаты (самый долгий шаг - запросы к Telegram)
+    with _phase("проверка чатов", timings):
+        await check_inactive_chats(bot)
+    
+    logger.info("🧹 Фоновое обслуживание завершено за %.0f мс", sum(timings.values()))
+
+async def startup(bot, storage=None):
+    """
+    Действия при запуске бота
+
+    Ждем только то, без чего нельзя обрабатывать сообщения: схему БД,
+    глобальные настройки и счетчики из журнала. Остальное - в startup_maintenance.
+    """
     global db
     
-    print("🤖 Инициализация бота...")
+    logger.info("🤖 Инициализация бота...")
+    timings = {}
     
     try:
-        # Инициализация БД
+        # Инициализация БД (модуль уже импортирован в main)
         from .database import db as database_module
         db = database_module
         
         # Создаем таблицы в БД
-        await db.create_tables()
+        with _phase("схема БД", timings):
+            await db.create_tables()
         logger.info("   ✅ Таблицы БД созданы/проверены")
         
+        storage_profile = await db.get_storage_profile()
+        if storage_profile:
+            logger.info("   💾 Хранилище: " + ", ".join(f"{k}={v}" for k, v in storage_profile.items()))
+        
         # Инициализируем глобальные настройки
-        await db.init_global_settings()
+        with _phase("глобальные настройки", timings):
+            await db.init_global_settings()
         logger.info("   ✅ Глобальные настройки инициализированы")
         
-        # Очищаем старые кэши
-        await cleanup_old_caches()
-        
-        # Проверяем и деактивируем неактивные чаты
-        await check_inactive_chats(bot)
-        
-        # Автоматическая разблокировка пользователей
-        unblocked = await db.auto_unblock_users()
-        if unblocked > 0:
-            print(f"✅ Автоматически разблокировано {unblocked} пользователей")
-        
-        # Ежемесячный сброс счетчиков (если сегодня 1-е число)
-        if datetime.now().day == 1:
-            reset_count = await db.monthly_reset_counts()
-            if reset_count > 0:
-                print(f"✅ Ежемесячный сброс: обновлено {reset_count} пользователей")
+        with _phase("фоновые сервисы", timings):
+            # Журнал действий пишется в БД пачками в фоне
+            from .services.action_log import action_log_writer
+            await action_log_writer.start(db)
+            
+            # Состояния диалогов админ-панели из БД
+            from .services.fsm_storage import SQLStorage
+            if isinstance(storage, SQLStorage):
+                await storage.start()
+            
+            # Счетчики сообщений в памяти (если включено); журнал досчитывается
+            # в БД до первого сообщения, иначе лимиты считались бы от старых значений
+            from .config import config
+            if config.COUNTER_WRITE_BEHIND:
+                from .services.counter_store import counter_store
+                await counter_store.start(db)
+                logger.info("   ✅ Счетчики сообщений в памяти (write-behind) включены")
         
-        # Проверяем истекшие ручные лимиты
-        custom_limits_reset = await db.check_and_reset_expired_custom_limits()
-        if custom_limits_reset > 0:
-            print(f"✅ Сброшено {custom_limits_reset} истекших ручных лимитов")
+        # Разблокировка, сбросы и проверка чатов - в фоне, опрос начинается сразу
+        _spawn(startup_maintenance(bot))
         
-        print("✅ Бот готов к работе!")
+        logger.info("   ⏱️ Инициализация до опроса: %.0f мс", sum(timings.values()))
+        logger.info("✅ Бот готов к работе!")
         
     except ImportError as e:
-        logger.error(f"❌ ОШИБКА импорта модулей: {e}")
+        logger.error("❌ ОШИБКА импорта модулей: %s", e)
         raise
     except Exception as e:
-        logger.error(f"❌ ОШИБКА инициализации: {e}")
+        logger.error("❌ ОШИБКА инициализации: %s", e)
         raise
 
 async def main():
@@ -146,21 +308,36 @@ async def main():
     # Инициализация бота
     logger.info("🤖 Инициализирую бота...")
     try:
+        # Все исходящие запросы идут через общий шлюз (лимиты, 429, дубли)
+        from aiogram.client.session.aiohttp import AiohttpSession
+        from aiogram.client.telegram import TelegramAPIServer
+        from .services.api_gateway import api_gateway
+        if config.TELEGRAM_API_URL:
+            session = AiohttpSession(api=TelegramAPIServer.from_base(config.TELEGRAM_API_URL))
+        else:
+            session = AiohttpSession()
+        session.middleware(api_gateway)
+        
         bot = Bot(
             token=config.BOT_TOKEN,
+            session=session,
             default=DefaultBotProperties(parse_mode="HTML")
         )
         me = await bot.get_me()
-        logger.info(f"✅ Бот подключен: @{me.username} (ID: {me.id})")
-        logger.info(f"📛 Имя бота: {me.first_name}")
+        logger.info("✅ Бот подключен: @%s (ID: %s)", me.username, me.id)
+        logger.info("📛 Имя бота: %s", me.first_name)
     except Exception as e:
-        logger.error(f"❌ ОШИБКА подключения бота: {e}")
+        logger.error("❌ ОШИБКА подключения бота: %s", e)
         logger.error("Проверьте токен и интернет-соединение")
         return
     
     # Инициализация диспетчера
     logger.info("🔄 Инициализирую диспетчер...")
-    storage = MemoryStorage()
+    with _phase("импорт БД", {}):
+        from .database import db as database_module
+    from .services.fsm_storage import create_fsm_storage
+    storage = create_fsm_storage(database_module)
+    logger.info("   💬 Хранилище состояний FSM: %s", type(storage).__name__)
     dp = Dispatcher(storage=storage)
     
     # Проверяем администраторов
@@ -169,58 +346,53 @@ async def main():
         from .utils.admin_check import get_admin_ids
         admin_ids = get_admin_ids()
         if admin_ids:
-            logger.info(f"   ✅ Найдено администраторов: {len(admin_ids)}")
+            logger.info("   ✅ Найдено администраторов: %s", len(admin_ids))
             for admin_id in admin_ids:
-                logger.info(f"      • ID: {admin_id}")
+                logger.info("      • ID: %s", admin_id)
         else:
             logger.warning("   ⚠️ Администраторы не найдены в ADMIN_ID.txt")
             logger.warning("   Бот будет доступен только для пользователей из ADMIN_ID.txt")
     except Exception as e:
-        logger.warning(f"   ⚠️ Ошибка загрузки администраторов: {e}")
+        logger.warning("   ⚠️ Ошибка загрузки администраторов: %s", e)
     
     # Регистрируем ВСЕ обработчики в правильном порядке
     logger.info("📝 Регистрирую обработчики...")
     
 # Попробуйте так:
+    admin_routers = _AdminRouters()
     try:
-        # Импортируем через модули
+        # Импортируем через модули; админские роутеры - лениво, после начала опроса
         from bot.handlers.commands import router as commands_router
-        from bot.handlers.callbacks import router as callbacks_router
         from bot.handlers.group import router as group_router
-        from bot.handlers.exceptions import router as exceptions_router
-        from bot.handlers.notifications import router as notifications_router
     
         # 1. Сначала команды (они должны обрабатываться первыми, ТОЛЬКО в личных сообщениях)
         dp.include_router(commands_router)
         logger.info("   ✅ Команды для личных сообщений зарегистрированы")
     
-        # 2. Затем callback-обработчики (кнопки)
-        dp.include_router(callbacks_router)
-        dp.include_router(exceptions_router)
-        dp.include_router(notifications_router)
-        logger.info("   ✅ Callback-обработчики зарегистрированы")
+        # 2. Затем callback-обработчики (кнопки) - заглушка, модули подключатся в фоне
+        dp.include_router(admin_routers.router)
     
         # 3. ПОСЛЕДНИМИ - обработчики групп (важен порядок!)
         dp.include_router(group_router)
         logger.info("   ✅ Групповые обработчики зарегистрированы")
     
     except ImportError as e:
-        logger.error(f"❌ ОШИБКА импорта обработчиков: {e}")
-        logger.error(f"❌ Импорт завершился с ошибкой: {type(e).__name__}: {e}")
+        logger.error("❌ ОШИБКА импорта обработчиков: %s", e)
+        logger.error("❌ Импорт завершился с ошибкой: %s: %s", type(e).__name__, e)
         import traceback
         logger.error(traceback.format_exc())
         return
     except Exception as e:
-        logger.error(f"❌ ОШИБКА регистрации обработчиков: {e}")
+        logger.error("❌ ОШИБКА регистрации обработчиков: %s", e)
         import traceback
         logger.error(traceback.format_exc())
         return
     
     # Запускаем инициализацию при старте
     try:
-        await startup(bot)
+        await startup(bot, storage)
     except Exception as e:
-        logger.error(f"❌ ОШИБКА инициализации при старте: {e}")
+        logger.error("❌ ОШИБКА инициализации при старте: %s", e)
         logger.error("Бот может работать некорректно")
     
     # Запуск планировщика задач
@@ -230,16 +402,16 @@ async def main():
         await start_scheduler()
         logger.info("   ✅ Планировщик запущен")
     except Exception as e:
-        logger.warning(f"⚠️ Ошибка планировщика: {e}")
+        logger.warning("⚠️ Ошибка планировщика: %s", e)
         logger.warning("Автоматические задачи не будут выполняться")
     
     # Показываем сводную информацию
     logger.info("="*50)
     logger.info("🎯 БОТ УСПЕШНО ЗАПЕЩЕН!")
     logger.info("="*50)
-    logger.info(f"🤖 Бот: @{me.username}")
-    logger.info(f"🔗 Ссылка: https://t.me/{me.username}")
-    logger.info(f"👮 Администраторов: {len(admin_ids) if 'admin_ids' in locals() else 0}")
+    logger.info("🤖 Бот: @%s", me.username)
+    logger.info("🔗 Ссылка: https://t.me/%s", me.username)
+    logger.info("👮 Администраторов: %s", len(admin_ids) if 'admin_ids' in locals() else 0)
     logger.info("="*50)
     logger.info("📱 КОМАНДЫ ДЛЯ ЛИЧНЫХ СООБЩЕНИЙ:")
     logger.info("• /start - Главное меню / Мои лимиты")
@@ -298,22 +470,66 @@ async def main():
     # Запускаем бота
     try:
         logger.info("🔄 Начинаю опрос сервера Telegram...")
-        await dp.start_polling(bot)
+        _spawn(admin_routers.load())
+        # Админские роутеры еще не подключены - их типы обновлений указываем явно
+        allowed_updates = sorted(set(dp.resolve_used_update_types()) | ADMIN_UPDATE_TYPES)
+        await dp.start_polling(bot, allowed_updates=allowed_updates)
         
     except KeyboardInterrupt:
         logger.info("\n⏹️ Бот остановлен пользователем")
     except Exception as e:
-        logger.error(f"❌ КРИТИЧЕСКАЯ ОШИБКА: {type(e).__name__}: {e}")
+        logger.error("❌ КРИТИЧЕСКАЯ ОШИБКА: %s: %s", type(e).__name__, e)
         import traceback
         logger.error(traceback.format_exc())
     finally:
+        for task in list(_background_tasks):
+            task.cancel()
+        
         logger.info("🔄 Останавливаю планировщик...")
         try:
             from .services.scheduler import stop_scheduler
             await stop_scheduler()
             logger.info("   ✅ Планировщик остановлен")
         except Exception as e:
-            logger.error(f"❌ Ошибка остановки планировщика: {e}")
+            logger.error("❌ Ошибка остановки планировщика: %s", e)
+        
+        try:
+            # Альбомы, которые еще собираются, обрабатываются до остановки автоудаления и БД
+            from .services.album_aggregator import album_aggregator
+            await album_aggregator.stop()
+            logger.info("   📸 Альбомы: %s", album_aggregator.get_stats())
+        except Exception as e:
+            logger.error("❌ Ошибка обработки альбомов: %s", e)
+        
+        try:
+            from .services.auto_delete import auto_delete
+            await auto_delete.stop()
+        except Exception as e:
+            logger.error("❌ Ошибка остановки автоудаления: %s", e)
+        
+        try:
+            from .services.counter_store import counter_store
+            await counter_store.stop()
+        except Exception as e:
+            logger.error("❌ Ошибка записи счетчиков: %s", e)
+        
+        try:
+            from .services.action_log import action_log_writer
+            await action_log_writer.stop()
+            logger.info("   ✅ Журнал действий записан: %s", action_log_writer.get_stats())
+        except Exception as e:
+            logger.error("❌ Ошибка записи журнала действий: %s", e)
+        
+        try:
+            await dp.storage.close()
+        except Exception as e:
+            logger.error("❌ Ошибка закрытия хранилища FSM: %s", e)
+        
+        if db:
+            await db.close()
+        
+        from .services.api_gateway import api_gateway
+        logger.info("   📡 Запросы к Telegram: %s", api_gateway.get_stats())
         
         logger.info("🔄 Закрываю сессию бота...")
         await bot.session.close()
@@ -323,7 +539,10 @@ if __name__ == "__main__":
     # Проверяем версию Python
     import platform
     python_version = platform.python_version()
-    logger.info(f"🐍 Python {python_version}")
+    logger.info("🐍 Python %s", python_version)
     
     # Запускаем главную функцию
-    asyncio.run(main())
\ No newline at end of file
+    try:
+        asyncio.run(main())
+    finally:
+        stop_logging()
\ No newline at end of file
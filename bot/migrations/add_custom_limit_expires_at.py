@@ -1,23 +1,31 @@
 
 import asyncio
-from sqlalchemy import text
-from ..database import engine
+import logging
+from sqlalchemy import inspect, text
+from ..database import db
+from ..logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
 
 async def add_custom_limit_expires_at():
-    async with engine.begin() as conn:
-        # Проверяем, существует ли уже колонка
-        result = await conn.execute(text("PRAGMA table_info(user_chat_data)"))
-        columns = [row[1] for row in result]
+    async with db.engine.begin() as conn:
+        # Проверяем, существует ли уже колонка (SQLite и PostgreSQL)
+        columns = await conn.run_sync(
+            lambda sync_conn: [column["name"] for column in inspect(sync_conn).get_columns("user_chat_data")]
+        )
         
         if 'custom_limit_expires_at' not in columns:
             # Добавляем новую колонку
             await conn.execute(text("""
                 ALTER TABLE user_chat_data 
-                ADD COLUMN custom_limit_expires_at DATETIME
+                ADD COLUMN custom_limit_expires_at TIMESTAMP
             """))
-            print("✅ Добавлено поле custom_limit_expires_at")
+            logger.info("✅ Добавлено поле custom_limit_expires_at")
         else:
-            print("✅ Поле custom_limit_expires_at уже существует")
+            logger.info("✅ Поле custom_limit_expires_at уже существует")
+    
+    await db.close()
 
 if __name__ == "__main__":
+    setup_logging()
     asyncio.run(add_custom_limit_expires_at())
\ No newline at end of file
@@ -1,34 +1,47 @@
 import asyncio
+import logging
 import sys
 import os
 
 # Добавляем корневую директорию в путь
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-async def migrate():
-    """Миграция базы данных для добавления новых полей"""
+logger = logging.getLogger(__name__)
+
+async def migrate(dry_run: bool = False, target: int = None, status: bool = False):
+    """Применяет недостающие миграции схемы БД (данные не удаляются)"""
     from bot.database import db
-    from bot.models.schemas import Base
-    
-    print("🔄 Начинаю миграцию базы данных...")
+    from bot.migrations.runner import LATEST_VERSION, get_schema_version, upgrade
     
     try:
-        # Создаем таблицы с новой структурой
-        async with db.engine.begin() as conn:
-            await conn.run_sync(Base.metadata.drop_all)
-            await conn.run_sync(Base.metadata.create_all)
-        
-        print("✅ Таблицы пересозданы с новой структурой")
+        current = await get_schema_version(db.engine)
+        logger.info("📋 Версия схемы БД: %s, последняя: %s", current if current is not None else 'нет', LATEST_VERSION)
+        if status:
+            return
         
-        # Проверяем и добавляем недостающие колонки
-        await db.check_and_add_columns()
+        logger.info("🔄 Начинаю миграцию базы данных..." if not dry_run else "🔎 Пробный запуск, БД не изменяется")
+        applied = await upgrade(db, dry_run=dry_run, target=target)
         
-        print("✅ Миграция завершена успешно!")
+        if dry_run:
+            logger.info("✅ Ожидают применения миграций: %s", len(applied))
+        else:
+            logger.info("✅ Миграция завершена успешно! Применено миграций: %s", len(applied))
         
     except Exception as e:
-        print(f"❌ Ошибка миграции: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Ошибка миграции: %s", e)
+    finally:
+        await db.close()
 
 if __name__ == "__main__":
-    asyncio.run(migrate())
\ No newline at end of file
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Миграции схемы БД")
+    parser.add_argument("--dry-run", action="store_true", help="показать запросы, не изменяя БД")
+    parser.add_argument("--target", type=int, default=None, help="версия, до которой применять миграции")
+    parser.add_argument("--status", action="store_true", help="только показать версию схемы")
+    args = parser.parse_args()
+    
+    from bot.logging_setup import setup_logging
+    setup_logging()
+    
+    asyncio.run(migrate(dry_run=args.dry_run, target=args.target, status=args.status))
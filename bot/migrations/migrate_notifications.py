@@ -1,10 +1,14 @@
 import asyncio
+import logging
 from bot.database import db
 from bot.config import config
+from bot.logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
 
 async def migrate_notifications():
     """Добавляет новые уведомления в существующую БД"""
-    print("🔄 Миграция уведомлений...")
+    logger.info("🔄 Миграция уведомлений...")
     
     settings = await db.get_global_settings()
     if settings:
@@ -17,14 +21,15 @@ async def migrate_notifications():
         if 'swear_word_blocked' not in current:
             current['swear_word_blocked'] = config.DEFAULT_NOTIFICATIONS['swear_word_blocked']
         
-        settings.default_notifications = current
-        async with db.async_session() as session:
-            await session.merge(settings)
-            await session.commit()
-        
-        print("✅ Новые уведомления добавлены в БД")
+        if await db.update_global_notifications(current):
+            logger.info("✅ Новые уведомления добавлены в БД")
+        else:
+            logger.error("❌ Не удалось сохранить уведомления")
     else:
-        print("❌ Настройки не найдены")
+        logger.error("❌ Настройки не найдены")
+    
+    await db.close()
 
 if __name__ == "__main__":
+    setup_logging()
     asyncio.run(migrate_notifications())
\ No newline at end of file
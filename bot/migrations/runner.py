@@ -0,0 +1,248 @@
+"""
+Версионированные миграции схемы БД
+
+Текущая версия схемы хранится одной строкой в таблице schema_version.
+При запуске бот читает только ее; если версия устарела, недостающие
+миграции применяются по порядку, каждая в своей транзакции вместе с
+записью нового номера версии. Миграции только добавляют колонки и
+индексы (ALTER TABLE ... ADD COLUMN, CREATE INDEX) и не пересоздают
+таблицы. В режиме dry_run миграции печатают запросы вместо выполнения.
+
+Новая миграция - функция async (conn, db, dry_run) в конце MIGRATIONS
+со следующим номером. Новые таблицы создаются по моделям при любой
+миграции, поэтому для новой модели тоже нужно повысить номер версии.
+"""
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, List, NamedTuple, Optional, Set
+
+from sqlalchemy import inspect, select, text, update
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from ..models.schemas import Base, ActionLog, FsmState, SchemaVersion, UserChatData
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[..., Awaitable[None]]
+
+
+async def _execute(conn, statement, dry_run: bool):
+    """Выполняет запрос или только печатает его в режиме dry_run"""
+    if dry_run:
+        sql = statement if isinstance(statement, str) else statement.compile(dialect=conn.dialect)
+        logger.info("   [dry-run] %s", str(sql).strip())
+        return None
+    if isinstance(statement, str):
+        statement = text(statement)
+    return await conn.execute(statement)
+
+
+async def _table_columns(conn, table_name: str) -> Optional[Set[str]]:
+    """Колонки таблицы в БД или None, если таблицы нет"""
+    def read(sync_conn):
+        inspector = inspect(sync_conn)
+        if not inspector.has_table(table_name):
+            return None
+        return {column["name"] for column in inspector.get_columns(table_name)}
+
+    return await conn.run_sync(read)
+
+
+async def _table_indexes(conn, table_name: str) -> Optional[Set[str]]:
+    """Имена индексов таблицы в БД или None, если таблицы нет"""
+    def read(sync_conn):
+        inspector = inspect(sync_conn)
+        if not inspector.has_table(table_name):
+            return None
+        return {index["name"] for index in inspector.get_indexes(table_name)}
+
+    return await conn.run_sync(read)
+
+
+async def _add_columns(conn, table_name: str, columns: dict, dry_run: bool) -> List[str]:
+    """Добавляет недостающие колонки {имя: тип SQL}, возвращает добавленные"""
+    existing = await _table_columns(conn, table_name)
+    if existing is None:
+        return []
+
+    added = []
+    for column_name, column_type in columns.items():
+        if column_name in existing:
+            continue
+        await _execute(conn, f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}", dry_run)
+        if not dry_run:
+            logger.info("✅ Добавлена колонка в %s: %s", table_name, column_name)
+        added.append(column_name)
+    return added
+
+
+async def _legacy_columns(conn, db, dry_run: bool):
+    """Колонки, которые раньше добавлялись проверкой структуры при каждом запуске"""
+    await _add_columns(conn, "chats", {
+        "exclude_use_regex": "BOOLEAN DEFAULT FALSE",
+        "banned_words": "JSON DEFAULT NULL",
+        "custom_notifications": "JSON DEFAULT '{}'",
+    }, dry_run)
+    await _add_columns(conn, "user_chat_data", {
+        "last_custom_reset_date": "TIMESTAMP",
+        "custom_limit_expires_at": "TIMESTAMP",
+        "is_custom_limit_active": "BOOLEAN DEFAULT FALSE",
+    }, dry_run)
+    await _add_columns(conn, "global_settings", {
+        "default_exclude_use_regex": "BOOLEAN DEFAULT FALSE",
+        "default_banned_words": "JSON DEFAULT '[]'",
+    }, dry_run)
+    await _add_columns(conn, "users", {
+        "is_global_admin": "BOOLEAN DEFAULT FALSE",
+    }, dry_run)
+
+
+async def _count_period(conn, db, dry_run: bool):
+    """Период счетчика для ленивого ежемесячного сброса"""
+    added = await _add_columns(conn, "user_chat_data", {"count_period": "INTEGER"}, dry_run)
+    if added:
+        # Период существующих счетчиков - месяц последнего сброса
+        table = UserChatData.__table__
+        await _execute(
+            conn,
+            update(table)
+            .where(table.c.last_reset_date != None)
+            .values(count_period=db._period_expr(table.c.last_reset_date)),
+            dry_run
+        )
+
+
+async def _model_indexes(conn, db, dry_run: bool):
+    """Индексы моделей, которых нет в БД (уникальность user_id + chat_id и др.)"""
+    for model in (UserChatData, ActionLog):
+        table_name = model.__tablename__
+        existing = await _table_indexes(conn, table_name)
+        if existing is None:
+            continue
+
+        for index in model.__table__.indexes:
+            if index.name in existing:
+                continue
+
+            if index.name == "uq_user_chat_data_user_chat":
+                # Перед уникальным индексом убираем дубли пары (user_id, chat_id),
+                # оставляя последнюю обновленную запись
+                result = await _execute(
+                    conn,
+                    "DELETE FROM user_chat_data WHERE id NOT IN ("
+                    "SELECT id FROM ("
+                    "SELECT id, ROW_NUMBER() OVER ("
+                    "PARTITION BY user_id, chat_id ORDER BY updated_at DESC, id DESC"
+                    ") AS rn FROM user_chat_data"
+                    ") ranked WHERE rn = 1)",
+                    dry_run
+                )
+                if result is not None and result.rowcount:
+                    logger.warning("⚠️ Удалено дублей в user_chat_data: %s", result.rowcount)
+
+            await _execute(conn, CreateIndex(index), dry_run)
+            if not dry_run:
+                logger.info("✅ Создан индекс %s: %s", table_name, index.name)
+
+
+async def _fsm_states(conn, db, dry_run: bool):
+    """Таблица состояний FSM (диалоги админ-панели)"""
+    if await _table_columns(conn, FsmState.__tablename__) is not None:
+        return
+    await _execute(conn, CreateTable(FsmState.__table__), dry_run)
+    for index in FsmState.__table__.indexes:
+        await _execute(conn, CreateIndex(index), dry_run)
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "недостающие колонки старых версий", _legacy_columns),
+    Migration(2, "user_chat_data.count_period", _count_period),
+    Migration(3, "индексы user_chat_data и action_logs", _model_indexes),
+    Migration(4, "таблица fsm_states", _fsm_states),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+async def get_schema_version(engine) -> Optional[int]:
+    """
+    Версия схемы из таблицы schema_version
+
+    Returns:
+        Номер версии или None, если таблицы версий еще нет
+    """
+    try:
+        async with engine.connect() as conn:
+            result = await conn.execute(select(SchemaVersion.version).where(SchemaVersion.id == 1))
+            return result.scalar_one_or_none() or 0
+    except Exception:
+        return None
+
+
+async def _set_version(conn, version: int):
+    table = SchemaVersion.__table__
+    values = {"version": version, "applied_at": datetime.utcnow()}
+    result = await conn.execute(update(table).where(table.c.id == 1).values(**values))
+    if not result.rowcount:
+        await conn.execute(table.insert().values(id=1, **values))
+
+
+async def upgrade(db, dry_run: bool = False, target: int = None) -> List[Migration]:
+    """
+    Приводит схему БД к версии target (по умолчанию - последней)
+
+    Новая БД создается целиком по моделям и сразу получает последнюю версию.
+    В существующей БД создаются новые таблицы и применяются миграции с номером
+    больше текущего.
+
+    Args:
+        db: экземпляр Database
+        dry_run: только показать запросы, ничего не меняя
+        target: версия, до которой применять миграции
+
+    Returns:
+        Список примененных (в dry_run - ожидающих) миграций
+    """
+    engine = db.engine
+    target = LATEST_VERSION if target is None else target
+    current = await get_schema_version(engine)
+
+    if current is not None and current > LATEST_VERSION:
+        logger.warning("⚠️ Версия схемы БД (%s) новее кода (%s), миграции не применяются", current, LATEST_VERSION)
+        return []
+
+    pending = [m for m in MIGRATIONS if (current or 0) < m.version <= target]
+    if current is not None and not pending:
+        return []
+
+    if dry_run:
+        logger.info("🔎 Версия схемы: %s, целевая: %s", current, target)
+        async with engine.connect() as conn:
+            for migration in pending:
+                logger.info("🔎 Миграция %s: %s", migration.version, migration.description)
+                await migration.apply(conn, db, True)
+        return pending
+
+    async with engine.begin() as conn:
+        existing_tables = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_table_names())
+        await conn.run_sync(Base.metadata.create_all)
+
+        if current is None and not existing_tables:
+            # Пустая БД: таблицы и индексы уже созданы по моделям
+            await _set_version(conn, target)
+            logger.info("✅ Создана новая БД, версия схемы %s", target)
+            return []
+
+    for migration in pending:
+        async with engine.begin() as conn:
+            logger.info("🔄 Миграция %s: %s", migration.version, migration.description)
+            await migration.apply(conn, db, False)
+            await _set_version(conn, migration.version)
+
+    if pending:
+        logger.info("✅ Схема БД обновлена до версии %s", pending[-1].version)
+    return pending
@@ -5,7 +5,10 @@ from .schemas import (
     UserChatData, 
     GlobalSettings, 
     ActionLog, 
-    Statistics
+    Statistics,
+    PendingDeletion,
+    FsmState,
+    SchemaVersion
 )
 
 __all__ = [
@@ -15,5 +18,8 @@ __all__ = [
     "UserChatData", 
     "GlobalSettings", 
     "ActionLog", 
-    "Statistics"
+    "Statistics",
+    "PendingDeletion",
+    "FsmState",
+    "SchemaVersion"
 ]
\ No newline at end of file
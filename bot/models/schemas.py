@@ -1,10 +1,21 @@
-from sqlalchemy import Column, Integer, String, BigInteger, Boolean, DateTime, JSON, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, BigInteger, Boolean, DateTime, JSON, ForeignKey, Text, Index, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
 Base = declarative_base()
 
+
+def period_key(moment: datetime) -> int:
+    """Ключ месячного периода счетчика: YYYYMM"""
+    return moment.year * 100 + moment.month
+
+
+def current_period() -> int:
+    """Текущий период счетчика (UTC)"""
+    return period_key(datetime.utcnow())
+
+
 class Chat(Base):
     """Модель чата"""
     __tablename__ = "chats"
@@ -48,10 +59,12 @@ class UserChatData(Base):
     message_count = Column(Integer, default=0)
     custom_limit = Column(Integer, nullable=True)  # Ручной лимит
     custom_limit_expires_at = Column(DateTime, nullable=True)  # Когда истекает ручной лимит (ДОБАВИТЬ)
+    is_custom_limit_active = Column(Boolean, default=False)  # Действует ли ручной лимит
     
     is_muted = Column(Boolean, default=False)
     mute_until = Column(DateTime, nullable=True)
     last_reset_date = Column(DateTime, default=datetime.utcnow)  # Дата последнего сброса
+    count_period = Column(Integer, default=current_period)  # Месяц счетчика (YYYYMM), устаревший обнуляется при допуске
     last_custom_reset_date = Column(DateTime, nullable=True)  # Дата последнего сброса ручного лимита
     
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -61,8 +74,26 @@ class UserChatData(Base):
     user = relationship("User", back_populates="chat_data")
     chat = relationship("Chat", back_populates="user_data")
     
-    # Уникальный ключ
-    __table_args__ = ({"sqlite_autoincrement": True},)
+    # Уникальный ключ и индексы горячих запросов
+    __table_args__ = (
+        # Поиск данных пользователя в чате (допуск сообщения, лимиты)
+        Index("uq_user_chat_data_user_chat", "user_id", "chat_id", unique=True),
+        # Списки пользователей чата по числу сообщений
+        Index("ix_user_chat_data_chat_count", "chat_id", "message_count"),
+        # Авторазблокировка: только заблокированные
+        Index(
+            "ix_user_chat_data_muted_until", "mute_until",
+            sqlite_where=text("is_muted = 1"),
+            postgresql_where=text("is_muted")
+        ),
+        # Истечение ручных лимитов: только строки с ручным лимитом
+        Index(
+            "ix_user_chat_data_custom_reset", "last_custom_reset_date",
+            sqlite_where=text("custom_limit IS NOT NULL"),
+            postgresql_where=text("custom_limit IS NOT NULL")
+        ),
+        {"sqlite_autoincrement": True},
+    )
 
 class GlobalSettings(Base):
     """Глобальные настройки"""
@@ -91,6 +122,11 @@ class ActionLog(Base):
     chat_id = Column(BigInteger, nullable=True)
     details = Column(Text, nullable=True)  # Дополнительная информация
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_action_logs_created_at", "created_at"),
+        Index("ix_action_logs_type_created", "action_type", "created_at"),
+    )
 
 class Statistics(Base):
     """Статистика"""
@@ -102,4 +138,30 @@ class Statistics(Base):
     total_users = Column(Integer, default=0)
     total_chats = Column(Integer, default=0)
     blocked_users = Column(Integer, default=0)
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class FsmState(Base):
+    """Состояние диалога админ-панели (FSM aiogram)"""
+    __tablename__ = "fsm_states"
+    
+    key = Column(String(255), primary_key=True)  # bot_id:chat_id:user_id
+    state = Column(String(255), nullable=True)
+    data = Column(JSON, default=dict)
+    updated_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class SchemaVersion(Base):
+    """Версия схемы БД (одна строка, ведется bot/migrations/runner.py)"""
+    __tablename__ = "schema_version"
+    
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+class PendingDeletion(Base):
+    """Сообщения бота, ожидающие автоудаления"""
+    __tablename__ = "pending_deletions"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    chat_id = Column(BigInteger, nullable=False)
+    message_id = Column(BigInteger, nullable=False)
+    delete_at = Column(DateTime, nullable=False, index=True)  # Когда удалить (UTC)
@@ -3,10 +3,13 @@
 """
 
 from .scheduler import scheduler, start_scheduler, stop_scheduler, get_scheduler_info
+from .admin_cache import admin_cache, AdminRosterCache
 
 __all__ = [
     'scheduler',
     'start_scheduler',
     'stop_scheduler',
-    'get_scheduler_info'
+    'get_scheduler_info',
+    'admin_cache',
+    'AdminRosterCache'
 ]
\ No newline at end of file
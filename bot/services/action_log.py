@@ -0,0 +1,123 @@
+"""
+Буферизованная запись журнала действий (ActionLog) пачками
+"""
+import asyncio
+import logging
+from typing import List
+
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+
+class ActionLogWriter:
+    """
+    Очередь записей журнала с пакетной записью в БД.
+
+    log_action кладет запись в буфер и возвращается без обращения к БД.
+    Буфер сбрасывается одним многострочным INSERT, когда набирается
+    batch_size записей или проходит flush_interval секунд. Если буфер
+    заполнен до max_queue, добавление ждет сброса; если БД недоступна,
+    лишние записи отбрасываются и учитываются в счетчике dropped.
+    """
+
+    def __init__(self, batch_size: int = None, flush_interval: float = None, max_queue: int = None):
+        self.batch_size = batch_size or config.ACTION_LOG_BATCH_SIZE
+        self.flush_interval = flush_interval or config.ACTION_LOG_FLUSH_INTERVAL
+        self.max_queue = max_queue or config.ACTION_LOG_MAX_QUEUE
+        self._buffer: List[dict] = []
+        self._flush_lock = asyncio.Lock()
+        self._batch_ready = asyncio.Event()
+        self._task = None
+        self._store = None
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, store):
+        """
+        Запускает фоновый сброс
+
+        Args:
+            store: хранилище с методом insert_action_logs (Database)
+        """
+        if self.running:
+            return
+        self._store = store
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает фоновую задачу и записывает остаток буфера"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self._store:
+            await self.flush()
+
+    async def add(self, entry: dict) -> bool:
+        """Добавляет запись в буфер; False - запись отброшена"""
+        if len(self._buffer) >= self.max_queue:
+            # Буфер полон - ждем записи накопленного
+            await self.flush()
+            if len(self._buffer) >= self.max_queue:
+                self.dropped += 1
+                return False
+
+        self._buffer.append(entry)
+        if len(self._buffer) >= self.batch_size:
+            self._batch_ready.set()
+        return True
+
+    async def flush(self) -> int:
+        """Записывает буфер в БД, возвращает число записанных строк"""
+        async with self._flush_lock:
+            if not self._buffer or not self._store:
+                return 0
+
+            batch, self._buffer = self._buffer, []
+            if await self._store.insert_action_logs(batch):
+                self.written += len(batch)
+                self.flushes += 1
+                return len(batch)
+
+            # Возвращаем записи в буфер, пока есть место, остальное отбрасываем
+            free = max(0, self.max_queue - len(self._buffer))
+            kept = batch[:free]
+            self._buffer = kept + self._buffer
+            self.dropped += len(batch) - len(kept)
+            return 0
+
+    async def _run(self):
+        while True:
+            try:
+                try:
+                    await asyncio.wait_for(self._batch_ready.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._batch_ready.clear()
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("❌ Ошибка записи журнала действий: %s", e)
+
+    def get_stats(self) -> dict:
+        """Статистика журнала"""
+        return {
+            "queued": len(self._buffer),
+            "written": self.written,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+        }
+
+
+action_log_writer = ActionLogWriter()
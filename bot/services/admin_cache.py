@@ -0,0 +1,122 @@
+"""
+Кэш списков администраторов чатов
+"""
+import asyncio
+import logging
+from functools import partial
+from typing import Dict, Set
+
+from ..config import config
+from .cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+ADMIN_STATUSES = ("administrator", "creator")
+
+
+class AdminRosterCache:
+    """
+    Кэш администраторов по чатам.
+
+    Список заполняется одним вызовом get_chat_administrators, обновляется
+    событиями chat_member / my_chat_member и истекает по TTL. Проверка
+    пользователя - поиск в множестве за O(1).
+    """
+
+    def __init__(self, ttl: int = None, failure_ttl: int = None):
+        self.ttl = ttl if ttl is not None else config.ADMIN_CACHE_TTL
+        self.failure_ttl = failure_ttl if failure_ttl is not None else config.ADMIN_CACHE_FAILURE_TTL
+        self._rosters = LRUCache("admins", config.CACHE_MAX_CHATS, self.ttl)  # {chat_id: admin_ids}
+        self._loads: Dict[int, asyncio.Task] = {}  # {chat_id: текущая загрузка}
+        self.hits = 0
+        self.misses = 0
+
+    def _get_fresh(self, chat_id: int):
+        return self._rosters.get(chat_id)
+
+    async def is_admin(self, bot, chat_id: int, user_id: int) -> bool:
+        """
+        Проверяет, является ли пользователь администратором чата
+
+        Args:
+            bot: экземпляр aiogram.Bot
+            chat_id: ID чата
+            user_id: ID пользователя
+
+        Returns:
+            bool: True если администратор
+        """
+        roster = self._get_fresh(chat_id)
+        if roster is not None:
+            self.hits += 1
+            return user_id in roster
+
+        roster = await self._load(bot, chat_id)
+        return user_id in roster
+
+    async def _load(self, bot, chat_id: int) -> Set[int]:
+        """
+        Загружает список администраторов одним запросом (один запрос на чат одновременно)
+
+        Все, кто пришел во время загрузки, ждут ту же задачу и получают ее
+        результат, даже если список не попал в кэш (TTL = 0). Запись о
+        загрузке удаляется, только когда задача завершена: ожидающие уже
+        держат ссылку на нее, а новые обращения видят кэш или начинают
+        новую загрузку.
+        """
+        task = self._loads.get(chat_id)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(bot, chat_id))
+            self._loads[chat_id] = task
+            task.add_done_callback(partial(self._load_done, chat_id))
+        # Отмена одного обработчика не должна прерывать загрузку для остальных
+        return await asyncio.shield(task)
+
+    def _load_done(self, chat_id: int, task: asyncio.Task):
+        if self._loads.get(chat_id) is task:
+            del self._loads[chat_id]
+
+    async def _fetch(self, bot, chat_id: int) -> Set[int]:
+        self.misses += 1
+        try:
+            administrators = await bot.get_chat_administrators(chat_id)
+            roster = {member.user.id for member in administrators}
+            ttl = self.ttl
+        except Exception as e:
+            # Не повторяем запрос на каждое сообщение, если бот не может получить список
+            logger.warning("⚠️ Не удалось получить администраторов чата %s: %s", chat_id, e)
+            roster = set()
+            ttl = self.failure_ttl
+
+        if ttl:
+            self._rosters.set(chat_id, roster, ttl)
+        return roster
+
+    def apply_member_update(self, chat_id: int, user_id: int, status: str):
+        """Обновляет закэшированный список по событию изменения участника"""
+        roster = self._rosters.get(chat_id)
+        if roster is None:
+            return
+
+        if status in ADMIN_STATUSES:
+            roster.add(user_id)
+        else:
+            roster.discard(user_id)
+
+    def invalidate(self, chat_id: int = None):
+        """Сбрасывает кэш чата (или весь кэш)"""
+        if chat_id is None:
+            self._rosters.clear()
+        else:
+            self._rosters.pop(chat_id, None)
+
+    def get_stats(self) -> dict:
+        """Статистика кэша"""
+        return {
+            "chats": len(self._rosters),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+admin_cache = AdminRosterCache()
@@ -0,0 +1,246 @@
+"""
+Сборка медиа-альбомов (media_group_id) из отдельных сообщений
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+from ..config import config
+from .cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+MAX_ALBUM_SIZE = 10  # максимальный размер альбома (по спецификации Telegram)
+
+AlbumKey = Tuple[int, str]  # (chat_id, media_group_id)
+
+
+class Album:
+    """Собранный альбом: сообщения в порядке прихода и текст первой подписи"""
+
+    __slots__ = ("key", "messages", "text", "user_id", "chat_id", "handler", "late_handler",
+                 "opened_at", "last_part_at")
+
+    def __init__(self, key: AlbumKey, user_id: int, chat_id: int, handler, late_handler, now: float):
+        self.key = key
+        self.messages: List = []
+        self.text = ""
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.handler = handler
+        self.late_handler = late_handler
+        self.opened_at = now
+        self.last_part_at = now
+
+    @property
+    def has_text(self) -> bool:
+        return bool(self.text.strip())
+
+
+class ClosedAlbum:
+    """След закрытого альбома для поздних частей (без сообщений альбома)"""
+
+    __slots__ = ("key", "has_text", "late_handler")
+
+    def __init__(self, album: Album):
+        self.key = album.key
+        self.has_text = album.has_text
+        self.late_handler = album.late_handler
+
+
+class AlbumAggregator:
+    """
+    Собирает части альбома и передает альбом обработчику один раз.
+
+    Альбом закрывается, когда новых частей нет дольше окна тишины (окно
+    отсчитывается заново с каждой частью), когда собрано MAX_ALBUM_SIZE
+    частей или когда с первой части прошло max_wait секунд. Окно тишины
+    подстраивается под наблюдаемые интервалы между частями альбомов и
+    держится в пределах quiet_min..quiet_max. Сроки всех открытых альбомов
+    проверяет одна фоновая задача. Открытых альбомов не больше max_open:
+    при переполнении дольше всех не пополнявшийся альбом закрывается сразу.
+
+    Закрытые альбомы помнятся closed_ttl секунд (только ключ, наличие текста
+    и late_handler - сообщения не удерживаются): часть, пришедшая после
+    закрытия, не открывает альбом заново, а передается late_handler
+    (без него - отбрасывается), так что альбом не обрабатывается дважды.
+    """
+
+    def __init__(self, quiet_min: float = None, quiet_max: float = None,
+                 max_wait: float = None, max_open: int = None, closed_ttl: float = None):
+        self.quiet_min = quiet_min or config.ALBUM_QUIET_MIN
+        self.quiet_max = quiet_max or config.ALBUM_QUIET_MAX
+        self.max_wait = max_wait or config.ALBUM_MAX_WAIT
+        self.max_open = max_open or config.ALBUM_MAX_OPEN
+        self._albums: "OrderedDict[AlbumKey, Album]" = OrderedDict()  # от давно пополнявшихся к свежим
+        self._closed = LRUCache("closed_albums", self.max_open, closed_ttl or config.ALBUM_CLOSED_TTL)
+        # Средний интервал между частями (EWMA); до первых наблюдений окно максимальное
+        self._gap = self.quiet_max / 4
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._processing: Set[asyncio.Task] = set()
+        self.closed = 0
+        self.closed_full = 0
+        self.evicted = 0
+        self.late_parts = 0
+        self._close_time_total = 0.0
+        self.close_time_max = 0.0
+
+    @property
+    def quiet(self) -> float:
+        """Текущее окно тишины, секунды"""
+        return min(self.quiet_max, max(self.quiet_min, self._gap * 4))
+
+    def add(self, message, user_id: int, chat_id: int, text: Optional[str],
+            handler: Callable[[Album], Awaitable[None]],
+            late_handler: Callable[[ClosedAlbum, object], Awaitable[None]] = None):
+        """
+        Добавляет часть альбома
+
+        Args:
+            message: сообщение с media_group_id
+            user_id: автор альбома
+            chat_id: чат
+            text: подпись этой части
+            handler: async-функция, получающая закрытый альбом
+            late_handler: async-функция (ClosedAlbum, часть) для частей, пришедших после закрытия
+        """
+        now = time.monotonic()
+        key = (chat_id, message.media_group_id)
+        album = self._albums.get(key)
+
+        if album is None:
+            closed = self._closed.get(key)
+            if closed is not None:
+                self.late_parts += 1
+                logger.debug("📸 Часть альбома %s пришла после закрытия", key)
+                if closed.late_handler:
+                    self._spawn(self._process_late(closed, message))
+                return
+
+            if len(self._albums) >= self.max_open:
+                _, oldest = self._albums.popitem(last=False)
+                self.evicted += 1
+                logger.warning("⚠️ Открытых альбомов больше %s, альбом %s закрыт досрочно", self.max_open, oldest.key)
+                self._close(oldest, now)
+            album = self._albums[key] = Album(key, user_id, chat_id, handler, late_handler, now)
+        else:
+            gap = now - album.last_part_at
+            self._gap += (min(gap, self.quiet_max) - self._gap) * 0.2
+            album.last_part_at = now
+            self._albums.move_to_end(key)
+
+        album.messages.append(message)
+        if not album.has_text and text and text.strip():
+            album.text = text
+
+        if len(album.messages) >= MAX_ALBUM_SIZE:
+            # Больше частей не будет - не ждем окно тишины
+            del self._albums[key]
+            self.closed_full += 1
+            self._close(album, now)
+            return
+
+        self._ensure_running()
+        self._wakeup.set()
+
+    def _deadline(self, album: Album) -> float:
+        return min(album.last_part_at + self.quiet, album.opened_at + self.max_wait)
+
+    def _close(self, album: Album, now: float):
+        elapsed = now - album.opened_at
+        self.closed += 1
+        self._close_time_total += elapsed
+        self.close_time_max = max(self.close_time_max, elapsed)
+        self._closed[album.key] = ClosedAlbum(album)
+        self._spawn(self._process(album))
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._processing.add(task)
+        task.add_done_callback(self._processing.discard)
+
+    @staticmethod
+    async def _process(album: Album):
+        try:
+            await album.handler(album)
+        except Exception as e:
+            logger.error("❌ Ошибка обработки альбома %s: %s", album.key, e)
+
+    @staticmethod
+    async def _process_late(album: ClosedAlbum, message):
+        try:
+            await album.late_handler(album, message)
+        except Exception as e:
+            logger.error("❌ Ошибка обработки поздней части альбома %s: %s", album.key, e)
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def sweep(self, now: float = None) -> Optional[float]:
+        """Закрывает альбомы с истекшим сроком, возвращает ближайший срок остальных"""
+        now = time.monotonic() if now is None else now
+        next_deadline = None
+        for key, album in list(self._albums.items()):
+            deadline = self._deadline(album)
+            if deadline <= now:
+                del self._albums[key]
+                self._close(album, now)
+            elif next_deadline is None or deadline < next_deadline:
+                next_deadline = deadline
+        return next_deadline
+
+    async def _run(self):
+        while True:
+            try:
+                self._wakeup.clear()
+                next_deadline = self.sweep()
+                timeout = None if next_deadline is None else max(0.0, next_deadline - time.monotonic())
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("❌ Ошибка проверки альбомов: %s", e)
+                await asyncio.sleep(self.quiet_min)
+
+    async def stop(self):
+        """Закрывает открытые альбомы и дожидается их обработки"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        now = time.monotonic()
+        while self._albums:
+            _, album = self._albums.popitem(last=False)
+            self._close(album, now)
+        if self._processing:
+            await asyncio.gather(*self._processing, return_exceptions=True)
+
+    def open_count(self) -> int:
+        return len(self._albums)
+
+    def get_stats(self) -> dict:
+        """Статистика сборки альбомов"""
+        return {
+            "open": len(self._albums),
+            "closed": self.closed,
+            "closed_full": self.closed_full,
+            "evicted": self.evicted,
+            "late_parts": self.late_parts,
+            "quiet_ms": round(self.quiet * 1000),
+            "avg_close_ms": round(self._close_time_total / self.closed * 1000) if self.closed else 0,
+            "max_close_ms": round(self.close_time_max * 1000),
+        }
+
+
+album_aggregator = AlbumAggregator()
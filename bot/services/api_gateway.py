@@ -0,0 +1,213 @@
+"""
+Общий шлюз исходящих запросов к Telegram Bot API: лимиты, повторы после 429, слияние дублей
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Hashable, List, Optional
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    BanChatMember, Close, DeleteMessage, DeleteMessages, DeleteWebhook, GetChat,
+    GetChatAdministrators, GetChatMember, GetMe, GetUpdates, LogOut, RestrictChatMember,
+    SetWebhook, UnbanChatMember
+)
+
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+# Полосы приоритета: меньше - раньше получает токен
+LANE_MODERATION = 0  # ограничения, баны, удаление спама
+LANE_SERVICE = 1  # служебные чтения (права бота, админы чата)
+LANE_INFO = 2  # ответы и уведомления
+
+_MODERATION_METHODS = (RestrictChatMember, BanChatMember, UnbanChatMember, DeleteMessage, DeleteMessages)
+_SERVICE_METHODS = (GetChatMember, GetChatAdministrators, GetChat)
+# Чтения без побочных эффектов: одновременные одинаковые запросы сливаются в один
+_COALESCED_READS = (GetChatMember, GetChatAdministrators, GetChat)
+# Запросы самого опроса и настройки бота идут в обход шлюза
+_BYPASS_METHODS = (GetUpdates, GetMe, SetWebhook, DeleteWebhook, Close, LogOut)
+
+
+class _TokenBucket:
+    """Корзина токенов с паузой после retry_after и очередностью по полосам"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "paused_until", "waiting")
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waiting: List[int] = [0, 0, 0]  # ожидающих по полосам
+
+    def delay(self, lane: int, now: float) -> float:
+        """Берет токен и возвращает 0 или возвращает, сколько подождать"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if now < self.paused_until:
+            return self.paused_until - now
+        if any(self.waiting[higher] for higher in range(lane)):
+            # Токены сначала получают ожидающие из полос с большим приоритетом
+            return 1.0 / self.rate
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    @property
+    def idle(self) -> bool:
+        return (
+            not any(self.waiting)
+            and time.monotonic() >= self.paused_until
+            and self.tokens + (time.monotonic() - self.updated) * self.rate >= self.capacity
+        )
+
+    async def acquire(self, lane: int):
+        registered = False
+        try:
+            while True:
+                delay = self.delay(lane, time.monotonic())
+                if not delay:
+                    return
+                if not registered:
+                    self.waiting[lane] += 1
+                    registered = True
+                await asyncio.sleep(delay)
+        finally:
+            if registered:
+                self.waiting[lane] -= 1
+
+
+class TelegramApiGateway(BaseRequestMiddleware):
+    """
+    Middleware сессии aiogram.Bot: все исходящие запросы проходят через него.
+
+    Каждый запрос берет токен из корзины своего чата и из общей корзины,
+    поэтому волна спама в одном чате не расходует лимит остальных чатов.
+    Ограничения и удаления получают токены раньше служебных чтений, а те -
+    раньше ответов и уведомлений. После 429 корзина чата (или общая, если
+    запрос не к чату) приостанавливается на retry_after, и запрос
+    повторяется. Одинаковые запросы, отправленные одновременно, уходят в
+    Telegram один раз и получают общий результат: чтения из _COALESCED_READS,
+    удаление одного сообщения и ограничение пользователя с теми же правами
+    (срок until_date при этом не сравнивается - у двух обработчиков,
+    одновременно достигших лимита, он отличается на миллисекунды).
+    """
+
+    def __init__(self, global_rate: float = None, chat_rate: float = None, chat_burst: int = None,
+                 max_retries: int = None, max_retry_after: float = None):
+        self.global_rate = global_rate or config.API_GLOBAL_RATE
+        self.chat_rate = chat_rate or config.API_CHAT_RATE
+        self.chat_burst = chat_burst or config.API_CHAT_BURST
+        self.max_retries = config.API_MAX_RETRIES if max_retries is None else max_retries
+        self.max_retry_after = max_retry_after or config.API_MAX_RETRY_AFTER
+        self._global = _TokenBucket(self.global_rate, int(self.global_rate))
+        self._chats: Dict[Hashable, _TokenBucket] = {}
+        self._inflight: Dict[tuple, asyncio.Task] = {}
+        self.requests = 0
+        self.coalesced = 0
+        self.retried = 0
+        self.throttled = 0
+
+    @staticmethod
+    def lane(method) -> int:
+        if isinstance(method, _MODERATION_METHODS):
+            return LANE_MODERATION
+        if isinstance(method, _SERVICE_METHODS):
+            return LANE_SERVICE
+        return LANE_INFO
+
+    @staticmethod
+    def _coalesce_key(method) -> Optional[tuple]:
+        if isinstance(method, _COALESCED_READS):
+            return type(method).__name__, method.chat_id, getattr(method, "user_id", None)
+        if isinstance(method, RestrictChatMember):
+            return (
+                "RestrictChatMember", method.chat_id, method.user_id,
+                method.permissions.model_dump_json(exclude_none=True),
+                method.use_independent_chat_permissions
+            )
+        if isinstance(method, DeleteMessage):
+            return "DeleteMessage", method.chat_id, method.message_id
+        return None
+
+    def _chat_bucket(self, chat_id) -> Optional[_TokenBucket]:
+        if chat_id is None:
+            return None
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= 1000:
+                # Корзины простаивающих чатов не нужны - они полные
+                for idle_chat_id in [k for k, b in self._chats.items() if b.idle]:
+                    del self._chats[idle_chat_id]
+            bucket = self._chats[chat_id] = _TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def __call__(self, make_request, bot, method):
+        if isinstance(method, _BYPASS_METHODS):
+            return await make_request(bot, method)
+
+        key = self._coalesce_key(method)
+        if key is None:
+            return await self._send(make_request, bot, method)
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._send(make_request, bot, method))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        # Отмена одного из ожидающих не отменяет общий запрос
+        return await asyncio.shield(task)
+
+    def _forget(self, key: tuple, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # ошибку уже получили ожидающие; не пишем "never retrieved"
+
+    async def _send(self, make_request, bot, method):
+        lane = self.lane(method)
+        chat_bucket = self._chat_bucket(getattr(method, "chat_id", None))
+
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+            if chat_bucket:
+                await chat_bucket.acquire(lane)
+            await self._global.acquire(lane)
+            if time.monotonic() - started > 0.05:
+                self.throttled += 1
+
+            self.requests += 1
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt >= self.max_retries or e.retry_after > self.max_retry_after:
+                    raise
+                self.retried += 1
+                (chat_bucket or self._global).pause(e.retry_after)
+                logger.warning(
+                    "⏳ Telegram просит подождать %s с (%s, чат %s)",
+                    e.retry_after, type(method).__name__, getattr(method, 'chat_id', None)
+                )
+
+    def get_stats(self) -> dict:
+        """Статистика шлюза"""
+        return {
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "retried": self.retried,
+            "throttled": self.throttled,
+            "chats": len(self._chats),
+        }
+
+
+api_gateway = TelegramApiGateway()
@@ -0,0 +1,261 @@
+"""
+Удаление сообщений: отложенное автоудаление одной фоновой задачей и пакетное удаление через deleteMessages
+"""
+import asyncio
+import heapq
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+# Telegram не дает удалять сообщения старше 48 часов
+MAX_MESSAGE_AGE = timedelta(hours=48)
+# Идентификаторов в одном запросе deleteMessages
+MAX_BULK_DELETE = 100
+
+
+class AutoDeleteService:
+    """
+    Очередь удаления сообщений по времени.
+
+    Обработчик вызывает schedule() и сразу завершается. Сроки хранятся в
+    куче, одна фоновая задача спит до ближайшего срока, удаляет все
+    наступившие сообщения (сгруппированные по чатам) и отмечает их в БД.
+    Новые записи сохраняются в БД пачками, поэтому после перезапуска
+    незавершенные удаления подхватываются из таблицы pending_deletions.
+
+    Сообщения одного чата удаляются запросами deleteMessages по 100 штук;
+    если пакетный запрос не прошел, сообщения удаляются по одному.
+    delete_soon() собирает немедленные удаления чата за bulk_window секунд
+    в один такой запрос (например, спам-волну из разных обработчиков).
+    """
+
+    def __init__(self, flush_interval: float = None, bulk_window: float = None):
+        self.flush_interval = flush_interval if flush_interval is not None else config.AUTO_DELETE_FLUSH_INTERVAL
+        self.bulk_window = bulk_window if bulk_window is not None else config.BULK_DELETE_WINDOW
+        self._immediate: Dict[int, List[int]] = {}  # {chat_id: [message_id, ...]} к немедленному удалению
+        self._collectors: Dict[int, asyncio.Task] = {}
+        self._heap: List[Tuple[float, int, int]] = []  # (время удаления, chat_id, message_id)
+        self._unsaved: List[Tuple[int, int, datetime]] = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._bot = None
+        self._store = None
+        self.deleted = 0
+        self.failed = 0
+        self.bulk_requests = 0
+
+    def schedule(self, message, delay: float):
+        """Запланировать удаление сообщения через delay секунд"""
+        if message is None or message.chat is None:
+            return
+        self.schedule_ids(message.chat.id, message.message_id, delay)
+
+    def schedule_ids(self, chat_id: int, message_id: int, delay: float):
+        """То же по идентификаторам (объект сообщения не удерживается в памяти)"""
+        delete_at = time.time() + max(0.0, delay)
+        item = (delete_at, chat_id, message_id)
+        heapq.heappush(self._heap, item)
+        self._unsaved.append((chat_id, message_id, datetime.utcfromtimestamp(delete_at)))
+
+        if self._heap[0] is item:
+            # Новый срок раньше текущего - будим фоновую задачу
+            self._wakeup.set()
+
+    def delete_soon(self, message):
+        """Удалить сообщение сейчас; удаления в одном чате объединяются в deleteMessages"""
+        if message is None or message.chat is None:
+            return
+        self.delete_soon_ids(message.bot, message.chat.id, message.message_id)
+
+    def delete_soon_ids(self, bot, chat_id: int, message_id: int):
+        """То же по идентификаторам"""
+        self._immediate.setdefault(chat_id, []).append(message_id)
+        if chat_id not in self._collectors:
+            self._collectors[chat_id] = asyncio.create_task(self._delete_collected(bot, chat_id))
+
+    async def _delete_collected(self, bot, chat_id: int):
+        try:
+            # Ждем удаления из соседних обработчиков того же чата
+            await asyncio.sleep(self.bulk_window)
+            while self._immediate.get(chat_id):
+                message_ids = self._immediate.pop(chat_id)
+                await self.delete_now(chat_id, message_ids, bot)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("❌ Ошибка удаления сообщений в чате %s: %s", chat_id, e)
+        finally:
+            self._collectors.pop(chat_id, None)
+
+    def pending_count(self, chat_id: int = None) -> int:
+        """Сколько сообщений ждут удаления (в чате или всего)"""
+        if chat_id is None:
+            return len(self._heap)
+        return sum(1 for _, item_chat_id, _ in self._heap if item_chat_id == chat_id)
+
+    async def start(self, bot, store):
+        """
+        Запускает фоновую задачу
+
+        Args:
+            bot: экземпляр aiogram.Bot
+            store: хранилище с методами *_pending_deletions (Database)
+        """
+        if self._task and not self._task.done():
+            return
+
+        self._bot = bot
+        self._store = store
+
+        restored = 0
+        oldest_allowed = datetime.utcnow() - MAX_MESSAGE_AGE
+        for chat_id, message_id, delete_at in await store.get_pending_deletions():
+            if delete_at < oldest_allowed:
+                continue
+            timestamp = delete_at.replace(tzinfo=timezone.utc).timestamp()
+            heapq.heappush(self._heap, (timestamp, chat_id, message_id))
+            restored += 1
+
+        await store.remove_stale_pending_deletions(oldest_allowed)
+        if restored:
+            logger.info("🗑️ Восстановлено отложенных удалений: %s", restored)
+
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает задачу; невыполненные удаления остаются в БД до следующего запуска"""
+        if self._collectors:
+            # Немедленные удаления уже обещаны обработчикам - дожидаемся их
+            await asyncio.gather(*list(self._collectors.values()), return_exceptions=True)
+
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self._store:
+            await self._persist()
+
+    async def _persist(self, done: Dict[int, List[int]] = None):
+        """Сохраняет новые записи, кроме уже снятых с очереди в done"""
+        batch, self._unsaved = self._unsaved, []
+        if done:
+            batch = [item for item in batch if item[1] not in done.get(item[0], ())]
+        if not batch:
+            return
+        if not await self._store.save_pending_deletions(batch):
+            # Удаления все равно выполнятся, пока процесс жив
+            logger.warning("⚠️ Не удалось сохранить %s отложенных удалений", len(batch))
+
+    def _pop_due(self, now: float) -> Dict[int, List[int]]:
+        due = defaultdict(list)
+        while self._heap and self._heap[0][0] <= now:
+            _, chat_id, message_id = heapq.heappop(self._heap)
+            due[chat_id].append(message_id)
+        return due
+
+    async def _run(self):
+        while True:
+            try:
+                # Наступившие удаления выполняются сейчас - в БД их не пишем
+                due = self._pop_due(time.time())
+                await self._persist(due)
+
+                for chat_id, message_ids in due.items():
+                    await self._delete_chat_batch(chat_id, message_ids)
+                    await self._store.remove_pending_deletions(chat_id, message_ids)
+
+                if due:
+                    continue
+
+                # Сбрасываем событие до расчета таймаута, чтобы не пропустить новый срок
+                self._wakeup.clear()
+                timeout = self.flush_interval
+                if self._heap:
+                    timeout = min(timeout, max(0.0, self._heap[0][0] - time.time()))
+
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("❌ Ошибка автоудаления: %s", e)
+                await asyncio.sleep(1)
+
+    async def _delete_chat_batch(self, chat_id: int, message_ids: List[int]):
+        """Удаляет наступившие сообщения одного чата"""
+        await self.delete_now(chat_id, message_ids)
+
+    async def delete_now(self, chat_id: int, message_ids: List[int], bot=None) -> int:
+        """
+        Удаляет сообщения чата пачками deleteMessages, при ошибке пачки - по одному
+
+        Returns:
+            Сколько сообщений удалено (недоступные для удаления Telegram в
+            пакетном запросе пропускает молча, они тоже учитываются)
+        """
+        bot = bot or self._bot
+        message_ids = list(dict.fromkeys(message_ids))
+        deleted = 0
+
+        for start in range(0, len(message_ids), MAX_BULK_DELETE):
+            chunk = message_ids[start:start + MAX_BULK_DELETE]
+            if len(chunk) > 1:
+                try:
+                    await bot.delete_messages(chat_id, chunk)
+                    self.bulk_requests += 1
+                    self.deleted += len(chunk)
+                    deleted += len(chunk)
+                    continue
+                except Exception as e:
+                    logger.warning("⚠️ Пакетное удаление в чате %s не прошло, удаляем по одному: %s", chat_id, e)
+            deleted += await self._delete_each(bot, chat_id, chunk)
+        return deleted
+
+    async def _delete_each(self, bot, chat_id: int, message_ids: List[int]) -> int:
+        deleted = 0
+        for message_id in message_ids:
+            try:
+                await bot.delete_message(chat_id, message_id)
+                self.deleted += 1
+                deleted += 1
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                try:
+                    await bot.delete_message(chat_id, message_id)
+                    self.deleted += 1
+                    deleted += 1
+                except Exception:
+                    self.failed += 1
+            except TelegramBadRequest:
+                # Сообщение уже удалено или слишком старое
+                self.failed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.warning("⚠️ Не удалось удалить сообщение %s в чате %s: %s", message_id, chat_id, e)
+        return deleted
+
+    def get_stats(self) -> dict:
+        """Статистика автоудаления"""
+        return {
+            "pending": len(self._heap),
+            "deleted": self.deleted,
+            "failed": self.failed,
+            "bulk_requests": self.bulk_requests,
+        }
+
+
+auto_delete = AutoDeleteService()
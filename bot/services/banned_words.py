@@ -0,0 +1,136 @@
+"""
+Поиск запрещенных слов: один скомпилированный шаблон на чат
+"""
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ..config import config
+from .cache import LRUCache
+
+
+def build_trie_pattern(words: Iterable[str]) -> str:
+    """
+    Строит одно регулярное выражение из списка слов через префиксное дерево.
+    Общие префиксы сливаются, поэтому стоимость проверки почти не растет
+    с увеличением списка.
+    """
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node: dict) -> str:
+        branches = [
+            re.escape(char) + build(child)
+            for char, child in sorted(node.items())
+            if char != ""
+        ]
+        if not branches:
+            return ""
+
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            # Слово может закончиться здесь - продолжение необязательно
+            pattern = "(?:" + pattern + ")?"
+        return pattern
+
+    return build(trie)
+
+
+class BannedWordMatcher:
+    """Скомпилированный набор запрещенных слов с учетом границ слов (Unicode)"""
+
+    def __init__(self, words: Iterable[str]):
+        self._originals: Dict[str, str] = {}  # {слово в нижнем регистре: исходное слово}
+        for word in words or []:
+            if not isinstance(word, str):
+                continue
+            cleaned = word.strip()
+            if cleaned:
+                self._originals.setdefault(cleaned.lower(), cleaned)
+
+        self.words: List[str] = list(self._originals.values())
+
+        if self._originals:
+            body = build_trie_pattern(self._originals.keys())
+            self._regex = re.compile(r"(?<!\w)" + body + r"(?!\w)", re.IGNORECASE)
+        else:
+            self._regex = None
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def _original(self, matched: str) -> str:
+        return self._originals.get(matched.lower(), matched)
+
+    def search(self, text: str) -> Optional[str]:
+        """Возвращает первое найденное запрещенное слово (в исходном написании) или None"""
+        if not text or self._regex is None:
+            return None
+
+        match = self._regex.search(text)
+        return self._original(match.group(0)) if match else None
+
+    def find_all(self, text: str) -> List[str]:
+        """Все найденные запрещенные слова без повторов"""
+        if not text or self._regex is None:
+            return []
+
+        found = []
+        for match in self._regex.finditer(text):
+            word = self._original(match.group(0))
+            if word not in found:
+                found.append(word)
+        return found
+
+    def mask(self, text: str) -> Tuple[str, List[str]]:
+        """Маскирует запрещенные слова звездочками, возвращает (текст, найденные_слова)"""
+        if not text or self._regex is None:
+            return text, []
+
+        found = []
+
+        def replace(match):
+            word = self._original(match.group(0))
+            if word not in found:
+                found.append(word)
+            return "*" * len(match.group(0))
+
+        return self._regex.sub(replace, text), found
+
+
+class BannedWordMatcherCache:
+    """
+    Кэш скомпилированных наборов по чатам, сбрасывается при изменении слов в БД
+    (и по истечении ttl, если задан - для нескольких процессов на одной БД)
+    """
+
+    def __init__(self, ttl: float = None):
+        self.ttl = config.SETTINGS_CACHE_TTL if ttl is None else ttl
+        self._matchers = LRUCache("banned_words", config.CACHE_MAX_CHATS, self.ttl)
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self._matchers
+
+    def __len__(self) -> int:
+        return len(self._matchers)
+
+    def get(self, chat_id: int) -> Optional[BannedWordMatcher]:
+        return self._matchers.get(chat_id)
+
+    def put(self, chat_id: int, words: Iterable[str]) -> BannedWordMatcher:
+        matcher = BannedWordMatcher(words)
+        self._matchers[chat_id] = matcher
+        return matcher
+
+    def invalidate(self, chat_id: int = None):
+        """Сбрасывает набор чата (или все наборы - при изменении глобального списка)"""
+        if chat_id is None:
+            self._matchers.clear()
+        else:
+            self._matchers.pop(chat_id, None)
+
+
+banned_word_matchers = BannedWordMatcherCache()
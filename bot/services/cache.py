@@ -0,0 +1,158 @@
+"""
+Ограниченные кэши в памяти (LRU + TTL) с учетом занимаемой памяти по пространствам имен
+"""
+import logging
+import sys
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+_caches: Dict[str, "LRUCache"] = {}
+
+
+def _sizeof(obj, seen: set, depth: int = 3) -> int:
+    """Примерный размер объекта в байтах вместе с содержимым контейнеров"""
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj, 0)
+    if depth <= 0 or isinstance(obj, (str, bytes, int, float, bool)):
+        return size
+
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += _sizeof(key, seen, depth - 1) + _sizeof(value, seen, depth - 1)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += _sizeof(item, seen, depth - 1)
+    elif hasattr(obj, "__slots__"):
+        for name in obj.__slots__:
+            size += _sizeof(getattr(obj, name, None), seen, depth - 1)
+    elif hasattr(obj, "__dict__"):
+        size += _sizeof(vars(obj), seen, depth - 1)
+    return size
+
+
+class LRUCache(MutableMapping):
+    """
+    Словарь с ограничением размера и временем жизни записей.
+
+    При превышении maxsize удаляется запись, к которой дольше всех не
+    обращались. Если задан ttl (или ttl передан в set), запись живет
+    ttl секунд с момента записи: просроченная запись не возвращается и
+    удаляется при обращении или при периодической очистке sweep_caches().
+    Кэш с именем регистрируется в общей статистике cache_stats().
+    """
+
+    def __init__(self, name: Optional[str], maxsize: int, ttl: float = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl or None
+        self._data: "OrderedDict[Hashable, list]" = OrderedDict()  # {ключ: [значение, истекает]}
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.expired = 0
+        if name:
+            _caches[name] = self
+
+    def _alive(self, key, entry, now: float = None) -> bool:
+        if entry[1] is None or entry[1] > (time.monotonic() if now is None else now):
+            return True
+        del self._data[key]
+        self.expired += 1
+        return False
+
+    def __getitem__(self, key):
+        entry = self._data.get(key)
+        if entry is None or not self._alive(key, entry):
+            self.misses += 1
+            raise KeyError(key)
+        self.hits += 1
+        self._data.move_to_end(key)
+        return entry[0]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and self._alive(key, entry)
+
+    def set(self, key, value, ttl: float = _MISSING):
+        """Записывает значение; ttl переопределяет время жизни этой записи (None - бессрочно)"""
+        ttl = self.ttl if ttl is _MISSING else ttl
+        self._data[key] = [value, time.monotonic() + ttl if ttl else None]
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evicted += 1
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        del self._data[key]
+
+    def __iter__(self):
+        now = time.monotonic()
+        for key, entry in list(self._data.items()):
+            if self._alive(key, entry, now):
+                yield key
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self):
+        self._data.clear()
+
+    def expire(self) -> int:
+        """Удаляет просроченные записи, возвращает их число"""
+        before = self.expired
+        now = time.monotonic()
+        for key, entry in list(self._data.items()):
+            self._alive(key, entry, now)
+        return self.expired - before
+
+    def memory_bytes(self) -> int:
+        """Примерный объем памяти, занятый записями"""
+        seen = set()
+        return sys.getsizeof(self._data) + sum(
+            _sizeof(key, seen) + _sizeof(entry[0], seen) for key, entry in list(self._data.items())
+        )
+
+    def get_stats(self) -> dict:
+        """Статистика кэша"""
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "bytes": self.memory_bytes(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+            "expired": self.expired,
+        }
+
+
+def sweep_caches() -> int:
+    """Удаляет просроченные записи во всех именованных кэшах, возвращает их число"""
+    removed = 0
+    for name, cache in list(_caches.items()):
+        try:
+            removed += cache.expire()
+        except Exception as e:
+            logger.error("❌ Ошибка очистки кэша %s: %s", name, e)
+    return removed
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Статистика всех именованных кэшей по пространствам имен"""
+    return {name: cache.get_stats() for name, cache in _caches.items()}
@@ -0,0 +1,111 @@
+"""
+Снимки действующих настроек чатов (настройки чата поверх глобальных)
+"""
+from types import MappingProxyType
+from typing import Dict, Iterable, Mapping, Optional, Tuple
+
+from ..config import config
+from .cache import LRUCache
+
+
+class ChatSettingsSnapshot:
+    """
+    Неизменяемый снимок настроек чата.
+
+    Значения уже объединены с глобальными настройками, поэтому чтение
+    не требует обращения к БД. Списки хранятся как кортежи, уведомления -
+    как словарь только для чтения.
+    """
+
+    __slots__ = (
+        "chat_id", "exists", "title", "is_active", "message_limit",
+        "exclude_words", "exclude_use_regex", "banned_words",
+        "notifications", "min_message_length", "contact_link",
+    )
+
+    def __init__(self, chat_id: int, exists: bool, title: str, is_active: bool,
+                 message_limit: int, exclude_words: Iterable[str], exclude_use_regex: bool,
+                 banned_words: Iterable[str], notifications: Mapping[str, str],
+                 min_message_length: int, contact_link: str):
+        values = {
+            "chat_id": chat_id,
+            "exists": exists,
+            "title": title,
+            "is_active": is_active,
+            "message_limit": message_limit,
+            "exclude_words": tuple(exclude_words or ()),
+            "exclude_use_regex": bool(exclude_use_regex),
+            "banned_words": tuple(banned_words or ()),
+            "notifications": MappingProxyType(dict(notifications or {})),
+            "min_message_length": min_message_length,
+            "contact_link": contact_link or "",
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ChatSettingsSnapshot is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError("ChatSettingsSnapshot is read-only")
+
+    def __repr__(self) -> str:
+        return f"ChatSettingsSnapshot(chat_id={self.chat_id}, exists={self.exists}, is_active={self.is_active})"
+
+
+class ChatSettingsCache:
+    """
+    Кэш снимков по чатам.
+
+    Запись хранит штамп (версия чата, глобальная версия) на момент чтения
+    из БД. Изменение настроек повышает версию, поэтому снимок, прочитанный
+    параллельно с записью, не попадет в кэш как актуальный. Если задан ttl,
+    снимок перечитывается не реже раза в ttl секунд (изменения из других
+    процессов бота).
+    """
+
+    def __init__(self, ttl: float = None):
+        self.ttl = config.SETTINGS_CACHE_TTL if ttl is None else ttl
+        self._snapshots = LRUCache("chat_settings", config.CACHE_MAX_CHATS, self.ttl)  # {chat_id: (штамп, снимок)}
+        self._chat_versions: Dict[int, int] = {}
+        self._global_version = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._snapshots)
+
+    def stamp(self, chat_id: int) -> Tuple[int, int]:
+        return self._chat_versions.get(chat_id, 0), self._global_version
+
+    def get(self, chat_id: int) -> Optional[ChatSettingsSnapshot]:
+        entry = self._snapshots.get(chat_id)
+        if entry and entry[0] == self.stamp(chat_id):
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def put(self, chat_id: int, stamp: Tuple[int, int], snapshot: ChatSettingsSnapshot):
+        if stamp == self.stamp(chat_id):
+            self._snapshots[chat_id] = (stamp, snapshot)
+
+    def invalidate(self, chat_id: int = None):
+        """Сбрасывает снимок чата (или все снимки - при изменении глобальных настроек)"""
+        if chat_id is None:
+            self._global_version += 1
+            self._snapshots.clear()
+        else:
+            self._chat_versions[chat_id] = self._chat_versions.get(chat_id, 0) + 1
+            self._snapshots.pop(chat_id, None)
+
+    def get_stats(self) -> dict:
+        """Статистика кэша"""
+        return {
+            "chats": len(self._snapshots),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+chat_settings = ChatSettingsCache()
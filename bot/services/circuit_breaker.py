@@ -0,0 +1,97 @@
+"""
+Предохранитель (circuit breaker) для обращений к БД
+"""
+import logging
+import time
+
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Обращение отклонено без попытки: предохранитель разомкнут"""
+
+
+class CircuitBreaker:
+    """
+    Размыкается после failure_threshold ошибок подряд.
+
+    Пока предохранитель разомкнут, allow() сразу возвращает False и вызывающий
+    код не ждет таймаута недоступного хранилища. Через reset_timeout секунд
+    пропускается один пробный вызов: успех замыкает предохранитель, ошибка
+    снова размыкает его на reset_timeout.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = None, reset_timeout: float = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or config.DB_BREAKER_FAILURES
+        self.reset_timeout = config.DB_BREAKER_RESET_TIMEOUT if reset_timeout is None else reset_timeout
+        self.state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self.failures = 0
+        self.rejected = 0
+        self.opened = 0
+
+    @property
+    def is_open(self) -> bool:
+        """Вызовы сейчас отклоняются (проверка без расхода пробного вызова)"""
+        if self.state == self.CLOSED:
+            return False
+        if self.state == self.OPEN:
+            return time.monotonic() < self._opened_at + self.reset_timeout
+        return True  # пробный вызов уже выполняется
+
+    def allow(self) -> bool:
+        """Можно ли выполнить вызов; после таймаута первый вызов становится пробным"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() >= self._opened_at + self.reset_timeout:
+            self.state = self.HALF_OPEN
+            return True
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info("✅ %s: снова доступна, отклонено вызовов за время сбоя: %s", self.name, self.rejected)
+        self.state = self.CLOSED
+        self._consecutive_failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        self._consecutive_failures += 1
+        if self.state == self.HALF_OPEN or (
+            self.state == self.CLOSED and self._consecutive_failures >= self.failure_threshold
+        ):
+            if self.state == self.CLOSED:
+                self.opened += 1
+                logger.warning(
+                    "⚠️ %s: %s ошибок подряд, обращения приостановлены на %s с",
+                    self.name, self._consecutive_failures, self.reset_timeout
+                )
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    def release(self):
+        """Пробный вызов прерван без результата - следующий вызов снова будет пробным"""
+        if self.state == self.HALF_OPEN:
+            self.state = self.OPEN
+            self._opened_at = time.monotonic() - self.reset_timeout
+
+    def get_stats(self) -> dict:
+        """Статистика предохранителя"""
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "opened": self.opened,
+        }
+
+
+db_breaker = CircuitBreaker("БД")
@@ -0,0 +1,300 @@
+"""
+Счетчики сообщений в памяти с отложенной пакетной записью в БД (write-behind)
+"""
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from ..config import config
+from .cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+class CounterEntry:
+    """Состояние пользователя в чате, загруженное из БД, плюс еще не записанные сообщения"""
+
+    __slots__ = ("count", "period", "is_muted", "mute_until", "custom_limit", "custom_limit_expires_at")
+
+    def __init__(self, count: int, period: int, is_muted: bool, mute_until,
+                 custom_limit, custom_limit_expires_at):
+        self.count = count
+        self.period = period
+        self.is_muted = is_muted
+        self.mute_until = mute_until
+        self.custom_limit = custom_limit
+        self.custom_limit_expires_at = custom_limit_expires_at
+
+
+class WriteBehindCounterStore:
+    """
+    Учет сообщений без записи в БД на каждое сообщение.
+
+    Приращения счетчиков копятся в памяти по ключу (user_id, chat_id, период)
+    и раз в flush_interval секунд записываются одним пакетным UPSERT. Строки
+    журнала тоже копятся в памяти и раз в journal_sync_interval секунд
+    дописываются в файл в отдельном потоке (с fsync, если включен), так что
+    обработчик сообщения не ждет диска. При сбросе журнал ротируется, а после
+    успешной записи в БД удаляется. После падения процесса незаписанные
+    приращения восстанавливаются из журнала при старте; теряются не более
+    journal_sync_interval секунд сообщений.
+
+    Загруженное из БД состояние (блокировка, ручной лимит) живет до
+    изменения строки через БД (Database вызывает forget), поэтому решения по
+    лимиту принимаются из памяти. Загруженных пар не больше max_entries:
+    давно не писавшие пользователи и записи прошлого месяца вытесняются и
+    при следующем сообщении читаются из БД заново. Режим рассчитан на один
+    процесс бота.
+    """
+
+    def __init__(self, flush_interval: float = None, journal_path: str = None,
+                 journal_sync_interval: float = None, journal_fsync: bool = None, max_entries: int = None):
+        self.flush_interval = flush_interval or config.COUNTER_FLUSH_INTERVAL
+        self.journal_path = journal_path or config.COUNTER_JOURNAL_PATH
+        self.journal_sync_interval = journal_sync_interval or config.COUNTER_JOURNAL_SYNC_INTERVAL
+        self.journal_fsync = config.COUNTER_JOURNAL_FSYNC if journal_fsync is None else journal_fsync
+        # {(user_id, chat_id): CounterEntry}
+        self._entries = LRUCache("counter_entries", max_entries or config.COUNTER_MAX_ENTRIES)
+        self._pending: Dict[Tuple[int, int, int], int] = {}  # {(user_id, chat_id, период): приращение}
+        self._inflight: Dict[Tuple[int, int, int], int] = {}  # пакет, который сейчас пишется в БД
+        self._journal = None
+        self._journal_buffer: List[str] = []  # строки журнала, еще не записанные в файл
+        self._journal_lock = asyncio.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._journal_task = None
+        self._store = None
+        self.flushed = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def _rotated_path(self) -> str:
+        return self.journal_path + ".flushing"
+
+    async def start(self, store):
+        """
+        Восстанавливает приращения из журнала и запускает фоновый сброс
+
+        Args:
+            store: хранилище с методом add_message_counts (Database)
+        """
+        if self.running:
+            return
+        self._store = store
+
+        recovered = 0
+        for path in (self._rotated_path, self.journal_path):
+            for key, delta in self._read_journal(path):
+                self._pending[key] = self._pending.get(key, 0) + delta
+                recovered += delta
+
+        if recovered:
+            logger.info("🧮 Восстановлено из журнала несохраненных сообщений: %s", recovered)
+
+        self._open_journal()
+        if self._pending:
+            # Старые файлы удаляются только после успешной записи в БД
+            await self.flush()
+        elif os.path.exists(self._rotated_path):
+            os.remove(self._rotated_path)
+
+        self._task = asyncio.create_task(self._run())
+        self._journal_task = asyncio.create_task(self._run_journal())
+
+    async def stop(self):
+        """Останавливает фоновый сброс и записывает остаток в БД"""
+        for task in (self._task, self._journal_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._journal_task = None
+
+        if self._store:
+            await self.flush()
+        await self.sync_journal()
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+        self._entries.clear()
+
+    def get(self, user_id: int, chat_id: int, period: int) -> Optional[CounterEntry]:
+        """Состояние из памяти или None (не загружено или сменился месяц)"""
+        entry = self._entries.get((user_id, chat_id))
+        if entry is None:
+            return None
+        if entry.period != period:
+            # Месяц сменился - запись прошлого периода больше не нужна
+            del self._entries[(user_id, chat_id)]
+            return None
+        return entry
+
+    def load(self, user_id: int, chat_id: int, period: int, row) -> CounterEntry:
+        """Запоминает состояние строки user_chat_data (значения из БД + незаписанные)"""
+        key = (user_id, chat_id, period)
+        entry = CounterEntry(
+            count=(row.message_count or 0) + self._pending.get(key, 0) + self._inflight.get(key, 0),
+            period=period,
+            is_muted=bool(row.is_muted),
+            mute_until=row.mute_until,
+            custom_limit=row.custom_limit,
+            custom_limit_expires_at=row.custom_limit_expires_at
+        )
+        self._entries[(user_id, chat_id)] = entry
+        return entry
+
+    def increment(self, user_id: int, chat_id: int, entry: CounterEntry) -> int:
+        """Учитывает сообщение и возвращает новое значение счетчика"""
+        key = (user_id, chat_id, entry.period)
+        if self._journal:
+            self._journal_buffer.append(f"{user_id} {chat_id} {entry.period}\n")
+        self._pending[key] = self._pending.get(key, 0) + 1
+        entry.count += 1
+        return entry.count
+
+    def forget(self, user_id: int = None, chat_id: int = None):
+        """
+        Забывает загруженное состояние (строка изменена в БД в обход счетчиков)
+
+        Незаписанные приращения сохраняются; без аргументов - все пользователи.
+        """
+        if user_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop((user_id, chat_id), None)
+
+    async def flush(self) -> int:
+        """Записывает накопленные приращения в БД, возвращает число учтенных сообщений"""
+        async with self._flush_lock:
+            if not self._pending or not self._store:
+                return 0
+
+            batch, self._pending = self._pending, {}
+            lines, self._journal_buffer = self._journal_buffer, []
+            self._inflight = batch
+            # Новые приращения пишутся в новый журнал, пока идет запись в БД
+            rotated = await self._rotate_journal(lines)
+            deltas: List[Tuple[int, int, int, int]] = [
+                (user_id, chat_id, period, delta)
+                for (user_id, chat_id, period), delta in batch.items()
+            ]
+
+            try:
+                saved = await self._store.add_message_counts(deltas)
+            finally:
+                self._inflight = {}
+
+            if saved:
+                if rotated and os.path.exists(self._rotated_path):
+                    os.remove(self._rotated_path)
+                # Загруженные записи остаются: их count уже включал записанные приращения
+                total = sum(batch.values())
+                self.flushed += total
+                self.flushes += 1
+                return total
+
+            # Возвращаем приращения; журнал .flushing остается до успешной записи
+            for key, delta in batch.items():
+                self._pending[key] = self._pending.get(key, 0) + delta
+            self.failed_flushes += 1
+            return 0
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("❌ Ошибка записи счетчиков: %s", e)
+
+    async def sync_journal(self):
+        """Дописывает накопленные строки журнала в файл (в отдельном потоке)"""
+        async with self._journal_lock:
+            if not self._journal or not self._journal_buffer:
+                return
+            lines, self._journal_buffer = self._journal_buffer, []
+            await asyncio.to_thread(self._write_journal, self._journal, lines, self.journal_fsync)
+
+    @staticmethod
+    def _write_journal(journal, lines: List[str], fsync: bool):
+        journal.write("".join(lines))
+        journal.flush()
+        if fsync:
+            os.fsync(journal.fileno())
+
+    async def _run_journal(self):
+        while True:
+            try:
+                await asyncio.sleep(self.journal_sync_interval)
+                await self.sync_journal()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("❌ Ошибка записи журнала счетчиков: %s", e)
+
+    def _open_journal(self):
+        directory = os.path.dirname(os.path.abspath(self.journal_path))
+        os.makedirs(directory, exist_ok=True)
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+
+    async def _rotate_journal(self, lines: List[str]) -> bool:
+        """Дописывает строки уходящего пакета и переименовывает журнал в .flushing"""
+        if not self._journal:
+            return False
+        async with self._journal_lock:
+            if lines:
+                await asyncio.to_thread(self._write_journal, self._journal, lines, self.journal_fsync)
+            return await asyncio.to_thread(self._rotate_journal_file)
+
+    def _rotate_journal_file(self) -> bool:
+        self._journal.close()
+        if os.path.exists(self._rotated_path):
+            # Предыдущая запись не удалась - ее строки уже в batch, дописываем к ним
+            with open(self.journal_path, "r", encoding="utf-8") as src, \
+                    open(self._rotated_path, "a", encoding="utf-8") as dst:
+                dst.write(src.read())
+            os.remove(self.journal_path)
+        else:
+            os.replace(self.journal_path, self._rotated_path)
+        self._open_journal()
+        return True
+
+    @staticmethod
+    def _read_journal(path: str):
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as journal:
+            for line in journal:
+                parts = line.split()
+                if len(parts) != 3:
+                    # Недописанная строка при падении процесса
+                    continue
+                try:
+                    user_id, chat_id, period = (int(part) for part in parts)
+                except ValueError:
+                    continue
+                yield (user_id, chat_id, period), 1
+
+    def get_stats(self) -> dict:
+        """Статистика счетчиков"""
+        return {
+            "loaded": len(self._entries),
+            "pending": sum(self._pending.values()),
+            "journal_buffered": len(self._journal_buffer),
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+        }
+
+
+counter_store = WriteBehindCounterStore()
@@ -0,0 +1,141 @@
+"""
+Правила исключений: правила чата компилируются один раз в общий шаблон
+"""
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ..config import config
+from .banned_words import build_trie_pattern
+from .cache import LRUCache
+
+# Конструкции, которые меняют смысл или ломаются внутри общего шаблона:
+# номера групп сдвигаются (\1, \g<1>, (?(1)...)), имена групп могут совпасть
+# ((?P<имя>, (?P=имя)), глобальные флаги (?i) допустимы только в начале шаблона
+_UNMERGEABLE = re.compile(r"\\(?:[1-9]|g<)|\(\?P[<=]|\(\?\(|\(\?[aiLmsux]+\)")
+
+
+class ExceptionRuleSet:
+    """
+    Скомпилированные исключения чата.
+
+    Обычные правила ищутся как подстрока без учета регистра, regex-правила -
+    как регулярные выражения (IGNORECASE). Некорректный regex, как и раньше,
+    ищется как обычная строка. Regex-правила объединяются в один шаблон,
+    кроме правил со ссылками на группы, именованными группами и флагами
+    (?i) - они проверяются по отдельности. match() возвращает сработавшее
+    правило.
+    """
+
+    def __init__(self, patterns: Iterable[str], use_regex: bool = False):
+        self.use_regex = bool(use_regex)
+        self.patterns: List[str] = []
+
+        plain: Dict[str, str] = {}  # {правило в нижнем регистре: исходное правило}
+        regex_rules: List[Tuple[str, str]] = []  # [(имя группы, правило)]
+
+        for pattern in patterns or []:
+            if not isinstance(pattern, str):
+                continue
+            pattern = pattern.strip()
+            if not pattern:
+                continue
+            self.patterns.append(pattern)
+
+            if self.use_regex and self._is_valid_regex(pattern):
+                regex_rules.append((f"r{len(regex_rules)}", pattern))
+            else:
+                plain.setdefault(pattern.lower(), pattern)
+
+        self._plain = plain
+        self._plain_regex = (
+            re.compile(build_trie_pattern(plain.keys()), re.IGNORECASE) if plain else None
+        )
+
+        # Правила со ссылками на группы и флагами компилируются отдельно
+        separate = [pattern for _, pattern in regex_rules if _UNMERGEABLE.search(pattern)]
+        regex_rules = [(name, pattern) for name, pattern in regex_rules if not _UNMERGEABLE.search(pattern)]
+
+        self._regex_by_group = dict(regex_rules)
+        self._combined_regex = None
+        if regex_rules:
+            try:
+                # Один проход по тексту для остальных regex-правил
+                self._combined_regex = re.compile(
+                    "|".join(f"(?P<{name}>{pattern})" for name, pattern in regex_rules),
+                    re.IGNORECASE
+                )
+            except re.error:
+                separate += [pattern for _, pattern in regex_rules]
+                self._regex_by_group = {}
+        self._separate_regexes: List[Tuple[str, "re.Pattern"]] = [
+            (pattern, re.compile(pattern, re.IGNORECASE)) for pattern in separate
+        ]
+
+    @staticmethod
+    def _is_valid_regex(pattern: str) -> bool:
+        try:
+            re.compile(pattern)
+            return True
+        except re.error:
+            return False
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def match(self, text: str) -> Optional[str]:
+        """Возвращает сработавшее правило или None"""
+        if not text:
+            return None
+
+        if self._combined_regex is not None:
+            found = self._combined_regex.search(text)
+            if found:
+                return self._regex_by_group.get(found.lastgroup)
+
+        for pattern, compiled in self._separate_regexes:
+            if compiled.search(text):
+                return pattern
+
+        if self._plain_regex is not None:
+            found = self._plain_regex.search(text)
+            if found:
+                return self._plain.get(found.group(0).lower(), found.group(0))
+
+        return None
+
+
+class ExceptionRuleCache:
+    """
+    Кэш скомпилированных правил по чатам.
+
+    Запись привязана к снимку настроек чата, из которого построена: пока
+    снимок не заменен новым (после изменения настроек), правила остаются
+    действительными.
+    """
+
+    def __init__(self):
+        self._rules = LRUCache("exception_rules", config.CACHE_MAX_CHATS)  # {chat_id: (снимок, правила)}
+
+    def __len__(self) -> int:
+        return len(self._rules)
+
+    def get(self, chat_id: int, source) -> Optional[ExceptionRuleSet]:
+        entry = self._rules.get(chat_id)
+        if entry and entry[0] is source:
+            return entry[1]
+        return None
+
+    def put(self, chat_id: int, source, patterns: Iterable[str], use_regex: bool) -> ExceptionRuleSet:
+        rules = ExceptionRuleSet(patterns, use_regex)
+        self._rules[chat_id] = (source, rules)
+        return rules
+
+    def invalidate(self, chat_id: int = None):
+        """Сбрасывает правила чата (или все правила)"""
+        if chat_id is None:
+            self._rules.clear()
+        else:
+            self._rules.pop(chat_id, None)
+
+
+exception_rules = ExceptionRuleCache()
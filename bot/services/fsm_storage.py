@@ -0,0 +1,176 @@
+"""
+Хранилище состояний FSM (диалоги админ-панели), переживающее перезапуск бота
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from ..config import config
+
+logger = logging.getLogger(__name__)
+
+
+class _Record:
+    __slots__ = ("state", "data", "updated_at")
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any], updated_at: datetime):
+        self.state = state
+        self.data = data
+        self.updated_at = updated_at
+
+
+class SQLStorage(BaseStorage):
+    """
+    Состояния FSM в таблице fsm_states основной БД.
+
+    FSM читается на каждое обновление (в том числе на каждое сообщение в
+    группах), поэтому чтение идет из копии в памяти, а в БД пишется только
+    изменение состояния или данных. В памяти и в таблице есть только ключи
+    с непустым состоянием или данными; сброшенное состояние удаляется.
+    Состояние, которое не менялось дольше ttl секунд, считается брошенным:
+    оно не возвращается и раз в cleanup_interval секунд удаляется из БД.
+    Копия в памяти верна, пока в таблицу пишет один процесс бота.
+    """
+
+    def __init__(self, store, ttl: float = None, cleanup_interval: float = None):
+        self.ttl = config.FSM_STATE_TTL if ttl is None else ttl
+        self.cleanup_interval = cleanup_interval or config.FSM_CLEANUP_INTERVAL
+        self._store = store
+        self._records: Dict[str, _Record] = {}
+        self._task = None
+        self.expired = 0
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        parts = [str(key.bot_id), str(key.chat_id), str(key.user_id)]
+        if key.thread_id or key.business_connection_id or key.destiny != "default":
+            parts += [str(key.thread_id or ""), key.business_connection_id or "", key.destiny]
+        return ":".join(parts)
+
+    def _cutoff(self) -> Optional[datetime]:
+        if not self.ttl:
+            return None
+        return datetime.utcnow() - timedelta(seconds=self.ttl)
+
+    async def start(self):
+        """Загружает сохраненные состояния и запускает очистку брошенных"""
+        if self._task and not self._task.done():
+            return
+
+        await self.expire_idle()
+        for key, state, data, updated_at in await self._store.get_fsm_states():
+            self._records[key] = _Record(state, data or {}, updated_at)
+        if self._records:
+            logger.info("💬 Восстановлено диалогов админ-панели: %s", len(self._records))
+
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _get(self, key: StorageKey) -> Optional[_Record]:
+        storage_key = self._key(key)
+        record = self._records.get(storage_key)
+        if record is None:
+            return None
+
+        cutoff = self._cutoff()
+        if cutoff and record.updated_at < cutoff:
+            # Строку в БД удалит очистка
+            del self._records[storage_key]
+            self.expired += 1
+            return None
+        return record
+
+    async def _save(self, key: StorageKey, state: Optional[str], data: Dict[str, Any]):
+        storage_key = self._key(key)
+        if state is None and not data:
+            if self._records.pop(storage_key, None) is None:
+                return
+        else:
+            self._records[storage_key] = _Record(state, data, datetime.utcnow())
+        await self._store.save_fsm_state(storage_key, state, data)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        record = self._get(key)
+        await self._save(key, state, record.data if record else {})
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = self._get(key)
+        return record.state if record else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = self._get(key)
+        await self._save(key, record.state if record else None, data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = self._get(key)
+        return record.data.copy() if record else {}
+
+    async def expire_idle(self) -> int:
+        """Удаляет брошенные состояния из памяти и БД, возвращает число строк в БД"""
+        cutoff = self._cutoff()
+        if cutoff is None:
+            return 0
+
+        for storage_key in [k for k, record in self._records.items() if record.updated_at < cutoff]:
+            del self._records[storage_key]
+            self.expired += 1
+        return await self._store.delete_expired_fsm_states(cutoff)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.sleep(self.cleanup_interval)
+                await self.expire_idle()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("❌ Ошибка очистки состояний FSM: %s", e)
+
+    def get_stats(self) -> dict:
+        """Статистика хранилища"""
+        return {
+            "active": len(self._records),
+            "expired": self.expired,
+        }
+
+
+def create_fsm_storage(store) -> BaseStorage:
+    """
+    Хранилище FSM по настройке FSM_STORAGE
+
+    sql - таблица fsm_states в БД бота (по умолчанию); redis - любой сервер
+    с протоколом Redis по FSM_REDIS_URL, срок жизни ключей задает сам сервер;
+    memory - как раньше, в памяти процесса.
+
+    Args:
+        store: хранилище с методами *_fsm_state(s) (Database)
+    """
+    backend = (config.FSM_STORAGE or "sql").lower()
+
+    if backend == "redis":
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError:
+            logger.warning("⚠️ Для FSM_STORAGE=redis нужен пакет redis, используем БД")
+        else:
+            ttl = config.FSM_STATE_TTL or None
+            return RedisStorage.from_url(config.FSM_REDIS_URL, state_ttl=ttl, data_ttl=ttl)
+
+    if backend == "memory":
+        return MemoryStorage()
+
+    return SQLStorage(store)
@@ -0,0 +1,88 @@
+"""
+Глобальные настройки в памяти: одна копия на процесс, обновляется после записи в БД
+"""
+import time
+from typing import Any, Dict, Optional
+
+from ..config import config
+
+
+class GlobalSettingsView:
+    """
+    Отвязанная от сессии копия GlobalSettings только для чтения.
+
+    Поля читаются как у модели (settings.contact_link и т.д.). Списки и
+    словари отдаются копиями, поэтому изменение результата не портит кэш.
+    Изменять настройки нужно через методы Database.update_global_*.
+    """
+
+    __slots__ = ("_values",)
+
+    def __init__(self, values: Dict[str, Any]):
+        object.__setattr__(self, "_values", dict(values))
+
+    @classmethod
+    def from_model(cls, settings) -> "GlobalSettingsView":
+        return cls({
+            column.key: getattr(settings, column.key)
+            for column in settings.__table__.columns
+        })
+
+    def __getattr__(self, name: str):
+        try:
+            value = self._values[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+        if isinstance(value, list):
+            return list(value)
+        if isinstance(value, dict):
+            return dict(value)
+        return value
+
+    def __setattr__(self, name, value):
+        raise AttributeError("GlobalSettingsView is read-only, use db.update_global_* methods")
+
+    def __delattr__(self, name):
+        raise AttributeError("GlobalSettingsView is read-only, use db.update_global_* methods")
+
+    def __repr__(self) -> str:
+        return f"GlobalSettingsView(id={self._values.get('id')})"
+
+
+class GlobalSettingsProvider:
+    """
+    Хранит текущую копию глобальных настроек и счетчик версий.
+
+    Версия повышается после каждой записи настроек; копия, прочитанная из
+    БД до этого, в кэш уже не попадет. Если задан ttl, копия перечитывается
+    не реже раза в ttl секунд.
+    """
+
+    def __init__(self, ttl: float = None):
+        self.ttl = config.SETTINGS_CACHE_TTL if ttl is None else ttl
+        self.version = 0
+        self._view: Optional[GlobalSettingsView] = None
+        self._view_version = -1
+        self._expires_at = 0.0
+
+    def get(self) -> Optional[GlobalSettingsView]:
+        if self._view_version != self.version:
+            return None
+        if self.ttl and time.monotonic() >= self._expires_at:
+            return None
+        return self._view
+
+    def put(self, version: int, view: GlobalSettingsView):
+        if version == self.version:
+            self._view = view
+            self._view_version = version
+            self._expires_at = time.monotonic() + (self.ttl or 0)
+
+    def invalidate(self):
+        """Настройки изменились - следующее чтение загрузит их из БД"""
+        self.version += 1
+        self._view = None
+
+
+global_settings = GlobalSettingsProvider()
@@ -30,13 +30,13 @@ async def monthly_reset():
         # 3. Разблокируем пользователей
         unblock_count = await db.auto_unblock_users()
         
-        logger.info(f"✅ Ежемесячный сброс завершен!")
-        logger.info(f"📊 Сброшено стандартных лимитов: {reset_count}")
-        logger.info(f"⭐ Сброшено ручных лимитов: {custom_reset_count}")
-        logger.info(f"🔓 Разблокировано пользователей: {unblock_count}")
+        logger.info("✅ Ежемесячный сброс завершен!")
+        logger.info("📊 Сброшено стандартных лимитов: %s", reset_count)
+        logger.info("⭐ Сброшено ручных лимитов: %s", custom_reset_count)
+        logger.info("🔓 Разблокировано пользователей: %s", unblock_count)
         
     except Exception as e:
-        logger.error(f"❌ Ошибка при ежемесячном сбросе: {e}")
+        logger.error("❌ Ошибка при ежемесячном сбросе: %s", e)
 
 async def monthly_reset():
     """
@@ -57,12 +57,12 @@ async def monthly_reset():
         # Создаем резервную копию статистики
         await db.backup_statistics()
         
-        logger.info(f"✅ Ежемесячный сброс завершен!")
-        logger.info(f"📊 Сброшено счетчиков: {reset_count}")
-        logger.info(f"🔓 Разблокировано пользователей: {unblock_count}")
+        logger.info("✅ Ежемесячный сброс завершен!")
+        logger.info("📊 Сброшено счетчиков: %s", reset_count)
+        logger.info("🔓 Разблокировано пользователей: %s", unblock_count)
         
     except Exception as e:
-        logger.error(f"❌ Ошибка при ежемесячном сбросе: {e}")
+        logger.error("❌ Ошибка при ежемесячном сбросе: %s", e)
 
 async def daily_check():
     """
@@ -83,13 +83,13 @@ async def daily_check():
         # Проверяем активность чатов
         checked = await db.check_chats_activity()
         
-        logger.info(f"✅ Ежедневная проверка завершена!")
-        logger.info(f"🔓 Авторазблокировано: {unblocked}")
-        logger.info(f"🗑️ Очищено логов: {cleared}")
-        logger.info(f"💬 Проверено чатов: {checked}")
+        logger.info("✅ Ежедневная проверка завершена!")
+        logger.info("🔓 Авторазблокировано: %s", unblocked)
+        logger.info("🗑️ Очищено логов: %s", cleared)
+        logger.info("💬 Проверено чатов: %s", checked)
         
     except Exception as e:
-        logger.error(f"❌ Ошибка при ежедневной проверке: {e}")
+        logger.error("❌ Ошибка при ежедневной проверке: %s", e)
 
 async def weekly_backup():
     """
@@ -104,11 +104,31 @@ async def weekly_backup():
         # Создаем полную резервную копию БД
         backup_file = await db.create_backup()
         
-        logger.info(f"✅ Резервное копирование завершено!")
-        logger.info(f"📁 Файл резервной копии: {backup_file}")
+        logger.info("✅ Резервное копирование завершено!")
+        logger.info("📁 Файл резервной копии: %s", backup_file)
         
     except Exception as e:
-        logger.error(f"❌ Ошибка при резервном копировании: {e}")
+        logger.error("❌ Ошибка при резервном копировании: %s", e)
+
+async def sweep_caches():
+    """
+    Очистка просроченных записей кэшей в памяти
+    Выполняется каждые CACHE_SWEEP_INTERVAL секунд
+    """
+    try:
+        from .cache import cache_stats, sweep_caches as sweep
+        
+        removed = sweep()
+        # Подсчет памяти обходит все записи - только если отладочный вывод включен
+        if logger.isEnabledFor(logging.DEBUG):
+            stats = cache_stats()
+            total_kb = sum(cache["bytes"] for cache in stats.values()) // 1024
+            logger.debug("🧹 Кэши: удалено просроченных %s, занято ~%s КБ", removed, total_kb)
+            for name, cache in stats.items():
+                logger.debug("   • %s: %s/%s, ~%s КБ", name, cache["size"], cache["maxsize"], cache["bytes"] // 1024)
+        
+    except Exception as e:
+        logger.error("❌ Ошибка очистки кэшей: %s", e)
 
 def setup_scheduler():
     """
@@ -142,6 +162,17 @@ def setup_scheduler():
             replace_existing=True
         )
         
+        # Очистка кэшей в памяти
+        from ..config import config
+        scheduler.add_job(
+            sweep_caches,
+            'interval',
+            seconds=config.CACHE_SWEEP_INTERVAL,
+            id='sweep_caches',
+            name='Очистка кэшей',
+            replace_existing=True
+        )
+        
         # Тестовая задача - каждые 30 минут (для отладки)
         scheduler.add_job(
             lambda: logger.debug("🔄 Планировщик работает..."),
@@ -155,9 +186,10 @@ def setup_scheduler():
         logger.info("   • Ежемесячный сброс: 1-го числа, 00:01")
         logger.info("   • Ежедневная проверка: каждый день, 03:00")
         logger.info("   • Резервное копирование: воскресенье, 04:00")
+        logger.info("   • Очистка кэшей: каждые %s с", config.CACHE_SWEEP_INTERVAL)
         
     except Exception as e:
-        logger.error(f"❌ Ошибка настройки планировщика: {e}")
+        logger.error("❌ Ошибка настройки планировщика: %s", e)
         raise
 
 async def start_scheduler():
@@ -176,7 +208,7 @@ async def start_scheduler():
             logger.info("✅ Все задачи планировщика активны")
             
     except Exception as e:
-        logger.error(f"❌ Ошибка запуска планировщика: {e}")
+        logger.error("❌ Ошибка запуска планировщика: %s", e)
 
 async def stop_scheduler():
     """
@@ -187,7 +219,7 @@ async def stop_scheduler():
             scheduler.shutdown()
             logger.info("⏹️ Планировщик задач остановлен")
     except Exception as e:
-        logger.error(f"❌ Ошибка остановки планировщика: {e}")
+        logger.error("❌ Ошибка остановки планировщика: %s", e)
 
 def get_scheduler_info() -> str:
     """
@@ -1,9 +1,12 @@
 """
 Утилиты для проверки прав администратора
 """
+import logging
 import os
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
 def is_admin(user_id: int) -> bool:
     """
     Проверяет, является ли пользователь администратором
@@ -18,14 +21,14 @@ def is_admin(user_id: int) -> bool:
     
     # Если файла нет, создаем его с ID пользователя (первый запуск)
     if not admin_file.exists():
-        print(f"⚠️ Файл ADMIN_ID.txt не найден. Создаю новый...")
+        logger.warning("⚠️ Файл ADMIN_ID.txt не найден. Создаю новый...")
         try:
             with open(admin_file, 'w', encoding='utf-8') as f:
                 f.write(f"{user_id}\n")
-            print(f"✅ Файл создан, добавлен ID: {user_id}")
+            logger.info("✅ Файл создан, добавлен ID: %s", user_id)
             return True
         except Exception as e:
-            print(f"❌ Ошибка создания файла ADMIN_ID.txt: {e}")
+            logger.error("❌ Ошибка создания файла ADMIN_ID.txt: %s", e)
             return False
     
     try:
@@ -33,7 +36,7 @@ def is_admin(user_id: int) -> bool:
             content = f.read().strip()
         
         if not content:
-            print(f"⚠️ Файл ADMIN_ID.txt пуст. Добавляю ID: {user_id}")
+            logger.warning("⚠️ Файл ADMIN_ID.txt пуст. Добавляю ID: %s", user_id)
             with open(admin_file, 'w', encoding='utf-8') as f:
                 f.write(f"{user_id}\n")
             return True
@@ -48,7 +51,7 @@ def is_admin(user_id: int) -> bool:
         return str(user_id) in admin_ids
         
     except Exception as e:
-        print(f"❌ Ошибка чтения файла ADMIN_ID.txt: {e}")
+        logger.error("❌ Ошибка чтения файла ADMIN_ID.txt: %s", e)
         return False
 
 def get_admin_ids() -> list[int]:
@@ -80,7 +83,7 @@ def get_admin_ids() -> list[int]:
         return admin_ids
         
     except Exception as e:
-        print(f"❌ Ошибка чтения файла ADMIN_ID.txt: {e}")
+        logger.error("❌ Ошибка чтения файла ADMIN_ID.txt: %s", e)
         return []
 
 def add_admin(user_id: int) -> bool:
@@ -96,7 +99,7 @@ def add_admin(user_id: int) -> bool:
     admin_ids = get_admin_ids()
     
     if user_id in admin_ids:
-        print(f"ℹ️ Пользователь {user_id} уже является администратором")
+        logger.info("ℹ️ Пользователь %s уже является администратором", user_id)
         return True
     
     admin_ids.append(user_id)
@@ -109,11 +112,11 @@ def add_admin(user_id: int) -> bool:
             for aid in admin_ids:
                 f.write(f"{aid}\n")
         
-        print(f"✅ Добавлен администратор: {user_id}")
+        logger.info("✅ Добавлен администратор: %s", user_id)
         return True
         
     except Exception as e:
-        print(f"❌ Ошибка добавления администратора: {e}")
+        logger.error("❌ Ошибка добавления администратора: %s", e)
         return False
 
 def remove_admin(user_id: int) -> bool:
@@ -129,7 +132,7 @@ def remove_admin(user_id: int) -> bool:
     admin_ids = get_admin_ids()
     
     if user_id not in admin_ids:
-        print(f"ℹ️ Пользователь {user_id} не является администратором")
+        logger.info("ℹ️ Пользователь %s не является администратором", user_id)
         return True
     
     admin_ids = [aid for aid in admin_ids if aid != user_id]
@@ -141,11 +144,11 @@ def remove_admin(user_id: int) -> bool:
             for aid in admin_ids:
                 f.write(f"{aid}\n")
         
-        print(f"✅ Удален администратор: {user_id}")
+        logger.info("✅ Удален администратор: %s", user_id)
         return True
         
     except Exception as e:
-        print(f"❌ Ошибка удаления администратора: {e}")
+        logger.error("❌ Ошибка удаления администратора: %s", e)
         return False
 
 def list_admins() -> str:
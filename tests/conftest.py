@@ -0,0 +1,34 @@
+"""
+Общие настройки тестов: каждый тест получает свою БД SQLite во временной папке
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# bot.database создает общий экземпляр Database при импорте - не в рабочей папке
+os.environ.setdefault("DB_URL", "sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(), "import.db"))
+os.environ.setdefault("BOT_TOKEN", "1:test")
+
+import pytest
+
+from bot.config import config
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Новый экземпляр Database на пустой БД (таблицы создает сам тест)"""
+    from bot.database import Database
+    from bot.services.banned_words import banned_word_matchers
+    from bot.services.chat_settings import chat_settings
+    from bot.services.exception_rules import exception_rules
+    from bot.services.global_settings import global_settings
+
+    monkeypatch.setattr(config, "DB_URL", f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    # Кэши настроек общие для процесса - не переносим их между тестами
+    for cache in (chat_settings, global_settings, banned_word_matchers, exception_rules):
+        cache.invalidate()
+    return Database()
+
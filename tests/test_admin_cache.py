@@ -0,0 +1,55 @@
+"""
+Кэш администраторов: одна загрузка списка на чат
+"""
+import asyncio
+from types import SimpleNamespace
+
+from bot.services.admin_cache import AdminRosterCache
+
+CHAT_ID = -1001234567890
+ADMIN_ID = 1
+
+
+class FakeBot:
+    def __init__(self):
+        self.calls = 0
+
+    async def get_chat_administrators(self, chat_id):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return [SimpleNamespace(user=SimpleNamespace(id=ADMIN_ID))]
+
+
+def test_concurrent_loaders_share_one_request():
+    async def scenario():
+        # TTL = 0: список не кэшируется, ожидающие получают результат загрузки
+        cache = AdminRosterCache(ttl=0, failure_ttl=0)
+        bot = FakeBot()
+
+        first = [asyncio.create_task(cache.is_admin(bot, CHAT_ID, user_id)) for user_id in (1, 2, 3)]
+        await asyncio.sleep(0)
+        # Обработчик, пришедший в середине загрузки, тоже ждет ее
+        late = asyncio.create_task(cache.is_admin(bot, CHAT_ID, ADMIN_ID))
+
+        assert await asyncio.gather(*first, late) == [True, False, False, True]
+        assert bot.calls == 1
+        assert cache._loads == {}
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_does_not_abort_load():
+    async def scenario():
+        cache = AdminRosterCache(ttl=60)
+        bot = FakeBot()
+
+        cancelled = asyncio.create_task(cache.is_admin(bot, CHAT_ID, ADMIN_ID))
+        waiter = asyncio.create_task(cache.is_admin(bot, CHAT_ID, ADMIN_ID))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+
+        assert await waiter is True
+        assert await cache.is_admin(bot, CHAT_ID, ADMIN_ID) is True
+        assert bot.calls == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,84 @@
+"""
+Сборка медиа-альбомов
+"""
+import asyncio
+from types import SimpleNamespace
+
+from bot.services.album_aggregator import MAX_ALBUM_SIZE, AlbumAggregator, ClosedAlbum
+
+
+def _part(group_id: str, message_id: int):
+    return SimpleNamespace(media_group_id=group_id, message_id=message_id)
+
+
+def test_full_album_closes_without_waiting():
+    async def scenario():
+        aggregator = AlbumAggregator(quiet_min=5, quiet_max=10, max_wait=30)
+        closed = []
+
+        async def handler(album):
+            closed.append(album)
+
+        for i in range(MAX_ALBUM_SIZE):
+            aggregator.add(_part("g", i), 1, -100, "подпись" if i == 3 else None, handler)
+        await asyncio.sleep(0)
+
+        assert len(closed) == 1
+        assert len(closed[0].messages) == MAX_ALBUM_SIZE
+        assert closed[0].text == "подпись"
+        await aggregator.stop()
+
+    asyncio.run(scenario())
+
+
+def test_quiet_window_starts_at_maximum():
+    assert AlbumAggregator(quiet_min=0.3, quiet_max=1.5).quiet == 1.5
+
+
+def test_late_part_does_not_reopen_closed_album():
+    async def scenario():
+        aggregator = AlbumAggregator(quiet_min=0.05, quiet_max=0.05, max_wait=1)
+        closed, late = [], []
+
+        async def handler(album):
+            closed.append(album)
+
+        async def late_handler(album, message):
+            late.append((album.key, message.message_id))
+
+        aggregator.add(_part("g", 1), 1, -100, None, handler, late_handler)
+        aggregator.add(_part("g", 2), 1, -100, None, handler, late_handler)
+        await asyncio.sleep(0.2)
+        assert len(closed) == 1
+
+        aggregator.add(_part("g", 3), 1, -100, None, handler, late_handler)
+        await aggregator.stop()
+
+        assert len(closed) == 1
+        assert late == [((-100, "g"), 3)]
+        assert aggregator.get_stats()["late_parts"] == 1
+        # Закрытый альбом помнится без своих сообщений
+        assert isinstance(aggregator._closed[(-100, "g")], ClosedAlbum)
+        assert not hasattr(aggregator._closed[(-100, "g")], "messages")
+
+    asyncio.run(scenario())
+
+
+def test_overflow_closes_least_recently_extended_album():
+    async def scenario():
+        aggregator = AlbumAggregator(quiet_min=10, quiet_max=10, max_wait=30, max_open=2)
+        closed = []
+
+        async def handler(album):
+            closed.append(album.key)
+
+        for group_id in ("a", "b", "c"):
+            aggregator.add(_part(group_id, 1), 1, -100, None, handler)
+        await asyncio.sleep(0)
+
+        assert closed == [(-100, "a")]
+        assert aggregator.open_count() == 2
+        await aggregator.stop()
+        assert sorted(closed) == [(-100, "a"), (-100, "b"), (-100, "c")]
+
+    asyncio.run(scenario())
@@ -0,0 +1,134 @@
+"""
+Шлюз запросов к Telegram: полосы приоритета, слияние дублей, повтор после 429
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import DeleteMessage, GetChatMember, RestrictChatMember, SendMessage
+from aiogram.types import ChatPermissions
+
+from bot.services.api_gateway import TelegramApiGateway
+
+CHAT_ID = -1001234567890
+USER_ID = 42
+
+
+class FakeSession:
+    """Заменитель запроса к Bot API: записывает отправленные методы"""
+
+    def __init__(self, delay: float = 0.0, retry_after: int = None):
+        self.sent = []
+        self.delay = delay
+        self.retry_after = retry_after
+
+    async def make_request(self, bot, method):
+        self.sent.append(method)
+        await asyncio.sleep(self.delay)
+        if self.retry_after is not None:
+            retry_after, self.retry_after = self.retry_after, None
+            raise TelegramRetryAfter(method, "Too Many Requests", retry_after)
+        return type(method).__name__
+
+
+def _restrict(until_date=None, **permissions):
+    return RestrictChatMember(
+        chat_id=CHAT_ID, user_id=USER_ID, until_date=until_date,
+        permissions=ChatPermissions(can_send_messages=False, **permissions)
+    )
+
+
+def test_moderation_lane_goes_before_queued_replies():
+    async def scenario():
+        gateway = TelegramApiGateway(global_rate=10, chat_rate=100, chat_burst=20)
+        session = FakeSession()
+
+        # Забираем все токены общей корзины
+        for _ in range(10):
+            await gateway(session.make_request, None, SendMessage(chat_id=CHAT_ID, text="первый"))
+        session.sent.clear()
+        reply = asyncio.create_task(gateway(session.make_request, None, SendMessage(chat_id=CHAT_ID, text="ответ")))
+        await asyncio.sleep(0)
+        restrict = asyncio.create_task(gateway(session.make_request, None, _restrict()))
+        await asyncio.gather(reply, restrict)
+
+        assert [type(method).__name__ for method in session.sent] == ["RestrictChatMember", "SendMessage"]
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_get_chat_member_sends_one_request():
+    async def scenario():
+        gateway = TelegramApiGateway(global_rate=30, chat_rate=100, chat_burst=10)
+        session = FakeSession(delay=0.05)
+
+        results = await asyncio.gather(*(
+            gateway(session.make_request, None, GetChatMember(chat_id=CHAT_ID, user_id=USER_ID))
+            for _ in range(3)
+        ))
+
+        assert results == ["GetChatMember"] * 3
+        assert len(session.sent) == 1
+        assert gateway.get_stats()["coalesced"] == 2
+
+        # Другой пользователь - другой запрос
+        await gateway(session.make_request, None, GetChatMember(chat_id=CHAT_ID, user_id=USER_ID + 1))
+        assert len(session.sent) == 2
+
+    asyncio.run(scenario())
+
+
+def test_racing_restrictions_are_coalesced():
+    async def scenario():
+        gateway = TelegramApiGateway(global_rate=30, chat_rate=100, chat_burst=10)
+        session = FakeSession(delay=0.05)
+
+        # Два обработчика одновременно достигли лимита: сроки отличаются на миллисекунды
+        mute_until = datetime.now() + timedelta(days=3)
+        await asyncio.gather(
+            gateway(session.make_request, None, _restrict(mute_until)),
+            gateway(session.make_request, None, _restrict(mute_until + timedelta(milliseconds=3))),
+        )
+        assert len(session.sent) == 1
+        assert gateway.get_stats()["coalesced"] == 1
+
+        # Другие права - другой запрос
+        await asyncio.gather(
+            gateway(session.make_request, None, _restrict(mute_until)),
+            gateway(session.make_request, None, _restrict(mute_until, can_send_polls=False)),
+        )
+        assert len(session.sent) == 3
+
+    asyncio.run(scenario())
+
+
+def test_duplicate_deletions_are_coalesced():
+    async def scenario():
+        gateway = TelegramApiGateway(global_rate=30, chat_rate=100, chat_burst=10)
+        session = FakeSession(delay=0.05)
+
+        await asyncio.gather(*(
+            gateway(session.make_request, None, DeleteMessage(chat_id=CHAT_ID, message_id=message_id))
+            for message_id in (7, 7, 8)
+        ))
+
+        assert sorted(method.message_id for method in session.sent) == [7, 8]
+
+    asyncio.run(scenario())
+
+
+def test_retry_after_pauses_chat_and_repeats():
+    async def scenario():
+        gateway = TelegramApiGateway(global_rate=30, chat_rate=100, chat_burst=10, max_retries=2)
+        session = FakeSession(retry_after=1)
+
+        started = time.monotonic()
+        result = await gateway(session.make_request, None, SendMessage(chat_id=CHAT_ID, text="текст"))
+
+        assert result == "SendMessage"
+        assert len(session.sent) == 2
+        assert time.monotonic() - started >= 1
+        assert gateway.get_stats()["retried"] == 1
+
+    asyncio.run(scenario())
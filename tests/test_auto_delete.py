@@ -0,0 +1,84 @@
+"""
+Отложенное автоудаление: в БД пишутся только удаления, которые еще ждут срока
+"""
+import asyncio
+
+from bot.services.auto_delete import AutoDeleteService
+
+CHAT_ID = -1001234567890
+
+
+class FakeBot:
+    def __init__(self):
+        self.deleted = []
+
+    async def delete_messages(self, chat_id, message_ids):
+        self.deleted.extend(message_ids)
+
+    async def delete_message(self, chat_id, message_id):
+        self.deleted.append(message_id)
+
+
+class FakeStore:
+    """Таблица pending_deletions в памяти с журналом вызовов"""
+
+    def __init__(self):
+        self.rows = {}
+        self.saved = []
+
+    async def get_pending_deletions(self):
+        return [(chat_id, message_id, delete_at) for (chat_id, message_id), delete_at in self.rows.items()]
+
+    async def remove_stale_pending_deletions(self, before):
+        return 0
+
+    async def save_pending_deletions(self, items):
+        for chat_id, message_id, delete_at in items:
+            self.saved.append(message_id)
+            self.rows[(chat_id, message_id)] = delete_at
+        return True
+
+    async def remove_pending_deletions(self, chat_id, message_ids):
+        for message_id in message_ids:
+            self.rows.pop((chat_id, message_id), None)
+        return True
+
+
+def test_due_deletions_are_not_persisted():
+    async def scenario():
+        service = AutoDeleteService(flush_interval=3600, bulk_window=0)
+        bot, store = FakeBot(), FakeStore()
+
+        service.schedule_ids(CHAT_ID, 1, 0)
+        service.schedule_ids(CHAT_ID, 2, 0)
+        service.schedule_ids(CHAT_ID, 3, 3600)
+        await service.start(bot, store)
+        await asyncio.sleep(0.05)
+        await service.stop()
+
+        assert sorted(bot.deleted) == [1, 2]
+        # Наступившие удаления выполнены сразу, в таблицу попало только ожидающее
+        assert store.saved == [3]
+        assert list(store.rows) == [(CHAT_ID, 3)]
+        assert service.get_stats()["pending"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_saved_deletion_row_removed_when_done():
+    async def scenario():
+        service = AutoDeleteService(flush_interval=3600, bulk_window=0)
+        bot, store = FakeBot(), FakeStore()
+        await service.start(bot, store)
+
+        service.schedule_ids(CHAT_ID, 5, 0.1)
+        await asyncio.sleep(0.02)
+        assert list(store.rows) == [(CHAT_ID, 5)]
+
+        await asyncio.sleep(0.2)
+        await service.stop()
+
+        assert bot.deleted == [5]
+        assert store.rows == {}
+
+    asyncio.run(scenario())
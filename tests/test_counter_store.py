@@ -0,0 +1,131 @@
+"""
+Счетчики в памяти с отложенной записью (COUNTER_WRITE_BEHIND)
+"""
+import asyncio
+import os
+from types import SimpleNamespace
+
+from sqlalchemy import select
+
+import bot.database as database_module
+from bot.models.schemas import Chat, User, UserChatData, current_period
+from bot.services.counter_store import WriteBehindCounterStore
+
+CHAT_ID = -1001234567890
+USER_ID = 42
+
+
+async def _seed(db, **row):
+    await db.create_tables()
+    await db.init_global_settings()
+    async with db.async_session() as session:
+        session.add(Chat(id=CHAT_ID, title="Тест", is_active=True))
+        session.add(User(id=USER_ID, first_name="Тест"))
+        session.add(UserChatData(user_id=USER_ID, chat_id=CHAT_ID, **row))
+        await session.commit()
+
+
+async def _db_row(db):
+    async with db.async_session() as session:
+        result = await session.execute(
+            select(UserChatData.message_count, UserChatData.count_period, UserChatData.custom_limit)
+            .where(UserChatData.user_id == USER_ID, UserChatData.chat_id == CHAT_ID)
+        )
+        return tuple(result.one())
+
+
+def test_flush_keeps_custom_limit_counts_with_old_period(database, tmp_path, monkeypatch):
+    """Период строки с ручным лимитом не продвигается - приращения все равно записываются"""
+    store = WriteBehindCounterStore(flush_interval=3600, journal_path=str(tmp_path / "counters.journal"))
+    monkeypatch.setattr(database_module, "counter_store", store)
+
+    async def scenario():
+        await _seed(database, message_count=4, count_period=202001, custom_limit=100)
+        await store.start(database)
+        try:
+            for _ in range(5):
+                decision = await database.admit_message(USER_ID, CHAT_ID, "Тест")
+            assert decision.message_count == 9
+
+            assert await store.flush() == 5
+            assert await _db_row(database) == (9, 202001, 100)
+
+            # Запись в памяти пережила сброс и продолжает счет
+            decision = await database.admit_message(USER_ID, CHAT_ID, "Тест")
+            assert decision.message_count == 10
+        finally:
+            await store.stop()
+            await database.close()
+
+    asyncio.run(scenario())
+
+
+def test_journal_is_written_off_the_message_path(database, tmp_path, monkeypatch):
+    journal_path = tmp_path / "counters.journal"
+    store = WriteBehindCounterStore(flush_interval=3600, journal_path=str(journal_path),
+                                    journal_sync_interval=3600)
+    monkeypatch.setattr(database_module, "counter_store", store)
+
+    async def scenario():
+        await _seed(database, message_count=0)
+        await store.start(database)
+        try:
+            for _ in range(3):
+                await database.admit_message(USER_ID, CHAT_ID, "Тест")
+            # Строки ждут фоновой записи, обработчик сообщения диск не трогает
+            assert os.path.getsize(journal_path) == 0
+            assert store.get_stats()["journal_buffered"] == 3
+
+            await store.sync_journal()
+            assert len(journal_path.read_text(encoding="utf-8").splitlines()) == 3
+        finally:
+            await store.stop()
+            await database.close()
+
+    asyncio.run(scenario())
+
+
+def test_journal_recovers_unflushed_counts(database, tmp_path, monkeypatch):
+    journal_path = tmp_path / "counters.journal"
+
+    async def scenario():
+        await _seed(database, message_count=1)
+        first = WriteBehindCounterStore(flush_interval=3600, journal_path=str(journal_path))
+        monkeypatch.setattr(database_module, "counter_store", first)
+        await first.start(database)
+        for _ in range(2):
+            await database.admit_message(USER_ID, CHAT_ID, "Тест")
+        # Падение процесса: журнал записан, БД - нет
+        await first.sync_journal()
+        first._task.cancel()
+        first._journal_task.cancel()
+        first._journal.close()
+
+        second = WriteBehindCounterStore(flush_interval=3600, journal_path=str(journal_path))
+        await second.start(database)
+        try:
+            assert (await _db_row(database))[0] == 3
+        finally:
+            await second.stop()
+            await database.close()
+
+    asyncio.run(scenario())
+
+
+def test_loaded_entries_are_bounded(tmp_path):
+    store = WriteBehindCounterStore(flush_interval=3600, journal_path=str(tmp_path / "counters.journal"),
+                                    max_entries=2)
+    row = SimpleNamespace(message_count=3, is_muted=False, mute_until=None,
+                          custom_limit=None, custom_limit_expires_at=None)
+    period = current_period()
+
+    for user_id in (1, 2, 3):
+        store.load(user_id, CHAT_ID, period, row)
+    assert store.get_stats()["loaded"] == 2
+    # Вытесненная запись читается из БД заново
+    assert store.get(1, CHAT_ID, period) is None
+    assert store.get(3, CHAT_ID, period).count == 3
+
+    # Запись прошлого месяца удаляется при обращении
+    assert store.get(3, CHAT_ID, period + 1) is None
+    assert store.get_stats()["loaded"] == 1
@@ -0,0 +1,34 @@
+"""
+Правила исключений: общий шаблон и правила, которые нельзя в него объединить
+"""
+from bot.services.exception_rules import ExceptionRuleSet
+
+
+def test_backreference_rule_keeps_its_group_numbers():
+    rules = ExceptionRuleSet(["привет", r"(ха)\1", r"\d{3}"], use_regex=True)
+
+    assert rules.match("ха-ха-хаха") == r"(ха)\1"
+    assert rules.match("ха-ха") is None
+    assert rules.match("код 123") == r"\d{3}"
+    assert rules.match("Привет всем") == "привет"
+    # Правило с обратной ссылкой не мешает объединить остальные
+    assert rules._combined_regex is not None
+    assert [pattern for pattern, _ in rules._separate_regexes] == [r"(ха)\1"]
+
+
+def test_named_groups_and_inline_flags_compiled_separately():
+    patterns = [r"(?P<w>да)(?P=w)", r"(?P<w>нет)", r"(?s)начало.конец", "спам"]
+    rules = ExceptionRuleSet(patterns, use_regex=True)
+
+    assert rules.match("дада") == patterns[0]
+    assert rules.match("НЕТ") == patterns[1]
+    assert rules.match("начало\nконец") == patterns[2]
+    assert rules.match("это СПАМ") == "спам"
+    assert [pattern for pattern, _ in rules._separate_regexes] == patterns[:3]
+
+
+def test_plain_rules_ignore_regex_syntax():
+    rules = ExceptionRuleSet([r"(a)\1"], use_regex=False)
+
+    assert rules.match(r"строка (a)\1") == r"(a)\1"
+    assert rules.match("aa") is None
@@ -0,0 +1,103 @@
+"""
+Хранилище состояний FSM: выбор бэкенда и истечение брошенных диалогов
+"""
+import asyncio
+import sys
+import types
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from bot.config import config
+from bot.services.fsm_storage import SQLStorage, create_fsm_storage
+
+KEY = StorageKey(bot_id=1, chat_id=42, user_id=42)
+
+
+class FakeRedisStorage:
+    """Заменитель aiogram RedisStorage: запоминает параметры подключения"""
+
+    def __init__(self, url, **kwargs):
+        self.url = url
+        self.kwargs = kwargs
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        return cls(url, **kwargs)
+
+
+def test_redis_backend_passes_url_and_ttl(monkeypatch):
+    module = types.ModuleType("aiogram.fsm.storage.redis")
+    module.RedisStorage = FakeRedisStorage
+    monkeypatch.setitem(sys.modules, "aiogram.fsm.storage.redis", module)
+    monkeypatch.setattr(config, "FSM_STORAGE", "Redis")
+    monkeypatch.setattr(config, "FSM_REDIS_URL", "redis://cache:6379/2")
+    monkeypatch.setattr(config, "FSM_STATE_TTL", 600)
+
+    storage = create_fsm_storage(store=None)
+
+    assert isinstance(storage, FakeRedisStorage)
+    assert storage.url == "redis://cache:6379/2"
+    assert storage.kwargs == {"state_ttl": 600, "data_ttl": 600}
+
+
+def test_redis_backend_without_package_falls_back_to_sql(monkeypatch):
+    # None в sys.modules - import завершается ImportError, как без пакета redis
+    monkeypatch.setitem(sys.modules, "aiogram.fsm.storage.redis", None)
+    monkeypatch.setattr(config, "FSM_STORAGE", "redis")
+
+    assert isinstance(create_fsm_storage(store=None), SQLStorage)
+
+
+def test_memory_backend(monkeypatch):
+    monkeypatch.setattr(config, "FSM_STORAGE", "memory")
+    assert isinstance(create_fsm_storage(store=None), MemoryStorage)
+
+
+def test_sql_storage_survives_restart_and_expires(database):
+    async def scenario():
+        await database.create_tables()
+        await database.init_global_settings()
+        try:
+            storage = SQLStorage(database, ttl=0.2, cleanup_interval=3600)
+            await storage.start()
+            await storage.set_state(KEY, "AdminStates:waiting_limit")
+            await storage.set_data(KEY, {"chat_id": -100})
+            await storage.close()
+
+            # Перезапуск: состояние читается из БД
+            restarted = SQLStorage(database, ttl=0.2, cleanup_interval=3600)
+            await restarted.start()
+            assert await restarted.get_state(KEY) == "AdminStates:waiting_limit"
+            assert await restarted.get_data(KEY) == {"chat_id": -100}
+
+            await asyncio.sleep(0.3)
+            assert await restarted.get_state(KEY) is None
+            assert restarted.get_stats() == {"active": 0, "expired": 1}
+
+            # Очистка удаляет строку брошенного диалога из БД
+            assert await restarted.expire_idle() == 1
+            assert await database.get_fsm_states() == []
+            await restarted.close()
+        finally:
+            await database.close()
+
+    asyncio.run(scenario())
+
+
+def test_sql_storage_reset_deletes_row(database):
+    async def scenario():
+        await database.create_tables()
+        await database.init_global_settings()
+        try:
+            storage = SQLStorage(database, ttl=0, cleanup_interval=3600)
+            await storage.set_state(KEY, "AdminStates:waiting_limit")
+            assert len(await database.get_fsm_states()) == 1
+
+            await storage.set_state(KEY, None)
+            assert await database.get_fsm_states() == []
+            assert storage.get_stats()["active"] == 0
+        finally:
+            await database.close()
+
+    asyncio.run(scenario())
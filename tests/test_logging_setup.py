@@ -0,0 +1,27 @@
+"""
+Логирование через очередь
+"""
+import logging
+import queue
+
+from bot.logging_setup import KeyValueFormatter, _QueueHandler
+
+
+def test_arguments_are_formatted_in_calling_thread():
+    log_queue = queue.SimpleQueue()
+    logger = logging.getLogger("tests.logging_setup")
+    logger.propagate = False
+    handler = _QueueHandler(log_queue)
+    logger.addHandler(handler)
+    try:
+        stats = {"pending": 1}
+        logger.warning("📊 Статистика: %s", stats, extra={"chat_id": -100})
+        # Аргумент изменился до того, как поток записи дошел до записи
+        stats["pending"] = 2
+
+        record = log_queue.get_nowait()
+        line = KeyValueFormatter("%(message)s").format(record)
+        assert line == "📊 Статистика: {'pending': 1} chat_id=-100"
+        assert record.args is None
+    finally:
+        logger.removeHandler(handler)
@@ -0,0 +1,50 @@
+"""
+Обслуживание по расписанию: пакетные UPDATE порциями
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from bot.config import config
+from bot.models.schemas import Chat, User, UserChatData
+
+CHAT_ID = -1001234567890
+
+
+def test_expired_custom_limits_reset_in_chunks(database, monkeypatch, caplog):
+    monkeypatch.setattr(config, "MAINTENANCE_CHUNK_SIZE", 2)
+    long_ago = datetime.utcnow() - timedelta(days=62)
+
+    async def scenario():
+        await database.create_tables()
+        await database.init_global_settings()
+        try:
+            async with database.async_session() as session:
+                session.add(Chat(id=CHAT_ID, title="Тест", is_active=True))
+                for user_id in (1, 2, 3):
+                    session.add(User(id=user_id, first_name="Тест"))
+                await session.flush()
+                for user_id in (1, 2, 3):
+                    session.add(UserChatData(
+                        user_id=user_id, chat_id=CHAT_ID, message_count=10, custom_limit=10,
+                        is_custom_limit_active=True, last_custom_reset_date=long_ago
+                    ))
+                await session.commit()
+
+            with caplog.at_level(logging.DEBUG, logger="bot.database"):
+                assert await database.check_and_reset_expired_custom_limits() == 3
+
+            async with database.async_session() as session:
+                result = await session.execute(
+                    select(UserChatData.custom_limit, UserChatData.is_custom_limit_active, UserChatData.message_count)
+                )
+                assert result.all() == [(None, False, 0)] * 3
+
+            chunks = [r.getMessage().strip() for r in caplog.records if "Порция" in r.getMessage()]
+            assert chunks == ["🔁 Порция 1: обновлено строк 2", "🔁 Порция 2: обновлено строк 1"]
+        finally:
+            await database.close()
+
+    asyncio.run(scenario())